@@ -6,7 +6,15 @@ from werkzeug.utils import secure_filename
 from itsdangerous import URLSafeTimedSerializer
 from datetime import datetime
 import pymysql
-from models.db import get_db_connection
+from models.db import al_confirmar, get_db_connection, init_app as init_db_app
+from models.metrics import init_app as init_metrics_app, metrics_response
+from models.nplusone import init_app as init_nplusone_app
+from models.cache import cached
+from models.estadisticas_globales import asegurar_refresco, contar_totales, version_datos
+from models.exportacion import EXPORTACIONES, filas_csv
+from models.informes import cola_informes
+from models.notification import contar_no_leidas, invalidar_no_leidas
+from models.contenido_admin import listar as listar_contenido_admin, invalidar as invalidar_contenido_admin
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DEFAULT_ADMIN_EMAIL = os.environ.get('ADMIN_EMAIL', 'evinava8@gmail.com')
@@ -21,6 +29,11 @@ def create_admin_app():
     app.config['ADMIN_UPLOAD_FOLDER'] = os.path.join(BASE_DIR, 'static', 'img', 'admin_avatars')
     os.makedirs(app.config['ADMIN_UPLOAD_FOLDER'], exist_ok=True)
 
+    # Una conexión y un commit por petición
+    init_db_app(app)
+    init_metrics_app(app)
+    init_nplusone_app(app)
+
     # register local admin blueprint implemented below
     try:
         app.register_blueprint(admin_bp)
@@ -88,11 +101,13 @@ def admin_login_required(f):
     return wrapper
 
 
+@cached(ttl=60, maxsize=16, guardar_si=lambda stats: not stats.get('incompleto'))
 def get_global_statistics(filtro_tipo=None, periodo='mes'):
-    """Obtiene estadísticas globales detalladas de la aplicación"""
-    from datetime import datetime, timedelta
-    import calendar
-    
+    """
+    Obtiene estadísticas globales detalladas de la aplicación desde los resúmenes
+    de estadisticas_globales (tablas pequeñas). Caché de 60 s por filtro/periodo;
+    si alguna sección falló (stats['incompleto']) no se cachea.
+    """
     stats = {
         'usuarios_activos': 0,
         'usuarios_totales': 0,
@@ -110,193 +125,123 @@ def get_global_statistics(filtro_tipo=None, periodo='mes'):
     }
     
     try:
+        asegurar_refresco()
         conn = get_db_connection()
         with conn.cursor(pymysql.cursors.DictCursor) as cur:
             # Definir el filtro de período
             if periodo == 'semana':
-                fecha_filtro = 'DATE_SUB(NOW(), INTERVAL 7 DAY)'
-                grupo_fecha = 'DATE(fecha)'
-                grupo_fecha_usuarios = 'DATE(fecha_creacion)'
+                fecha_filtro = 'DATE_SUB(CURDATE(), INTERVAL 7 DAY)'
+                grupo_fecha = 'fecha'
             elif periodo == 'mes':
-                fecha_filtro = 'DATE_SUB(NOW(), INTERVAL 30 DAY)'
-                grupo_fecha = 'DATE(fecha)'
-                grupo_fecha_usuarios = 'DATE(fecha_creacion)'
+                fecha_filtro = 'DATE_SUB(CURDATE(), INTERVAL 30 DAY)'
+                grupo_fecha = 'fecha'
             else:  # año
-                fecha_filtro = 'DATE_SUB(NOW(), INTERVAL 365 DAY)'
+                fecha_filtro = 'DATE_SUB(CURDATE(), INTERVAL 365 DAY)'
                 grupo_fecha = 'DATE_FORMAT(fecha, "%Y-%m")'
-                grupo_fecha_usuarios = 'DATE_FORMAT(fecha_creacion, "%Y-%m")'
             
-            # Usuarios totales y activos
+            # Usuarios y rutinas (COUNT(*) en vivo)
             try:
-                cur.execute('SELECT COUNT(*) AS total FROM usuario')
-                stats['usuarios_totales'] = cur.fetchone().get('total', 0)
-                
-                cur.execute(f'SELECT COUNT(*) AS total FROM usuario WHERE fecha_creacion >= {fecha_filtro}')
-                stats['usuarios_activos'] = cur.fetchone().get('total', 0)
-            except Exception as e:
-                print(f'Error usuarios: {e}')
-            
-            # Rutinas creadas (filtradas por tipo si se especifica)
-            try:
-                if filtro_tipo == 'ejercicio':
-                    cur.execute('SELECT COUNT(*) AS total FROM rutina WHERE tipo = "ejercicio"')
-                    stats['rutinas_creadas'] = cur.fetchone().get('total', 0)
-                elif filtro_tipo == 'estudio':
-                    cur.execute('SELECT COUNT(*) AS total FROM rutina WHERE tipo = "estudio"')
-                    stats['rutinas_creadas'] = cur.fetchone().get('total', 0)
+                globales = contar_totales(cur)
+                stats['usuarios_totales'] = globales.get('usuarios', 0)
+                stats['rutinas_ejercicio'] = globales.get('rutinas_ejercicio', 0)
+                stats['rutinas_estudio'] = globales.get('rutinas_estudio', 0)
+                if filtro_tipo in ('ejercicio', 'estudio'):
+                    stats['rutinas_creadas'] = globales.get(f'rutinas_{filtro_tipo}', 0)
                 else:
-                    cur.execute('SELECT COUNT(*) AS total FROM rutina')
-                    stats['rutinas_creadas'] = cur.fetchone().get('total', 0)
-                
-                # Rutinas por tipo
-                cur.execute('SELECT COUNT(*) AS total FROM rutina WHERE tipo = "ejercicio"')
-                stats['rutinas_ejercicio'] = cur.fetchone().get('total', 0)
+                    stats['rutinas_creadas'] = globales.get('rutinas', 0)
                 
-                cur.execute('SELECT COUNT(*) AS total FROM rutina WHERE tipo = "estudio"')
-                stats['rutinas_estudio'] = cur.fetchone().get('total', 0)
+                cur.execute(f'SELECT COALESCE(SUM(nuevos), 0) AS total FROM stats_usuarios_nuevos WHERE fecha >= {fecha_filtro}')
+                stats['usuarios_activos'] = int(cur.fetchone().get('total', 0))
             except Exception as e:
-                print(f'Error rutinas: {e}')
+                stats['incompleto'] = True
+                print(f'Error usuarios/rutinas: {e}')
             
-            # Actividades completadas (usando item_diario)
+            # Actividades completadas por tipo (stats_diarias_tipo)
             try:
-                if filtro_tipo == 'ejercicio':
-                    cur.execute('''
-                        SELECT COUNT(*) AS total 
-                        FROM item_diario id 
-                        JOIN rutina_item ri ON id.id_item = ri.id_item 
-                        JOIN rutina r ON ri.id_rutina = r.id_rutina 
-                        WHERE r.tipo = "ejercicio" AND id.completado = 1
-                    ''')
-                    stats['actividades_completadas'] = cur.fetchone().get('total', 0)
-                elif filtro_tipo == 'estudio':
-                    cur.execute('''
-                        SELECT COUNT(*) AS total 
-                        FROM item_diario id 
-                        JOIN rutina_item ri ON id.id_item = ri.id_item 
-                        JOIN rutina r ON ri.id_rutina = r.id_rutina 
-                        WHERE r.tipo = "estudio" AND id.completado = 1
-                    ''')
-                    stats['actividades_completadas'] = cur.fetchone().get('total', 0)
+                cur.execute('SELECT tipo, SUM(completadas) AS total FROM stats_diarias_tipo GROUP BY tipo')
+                por_tipo = {row['tipo']: int(row['total'] or 0) for row in cur.fetchall()}
+                stats['actividades_ejercicio'] = por_tipo.get('ejercicio', 0)
+                stats['actividades_estudio'] = por_tipo.get('estudio', 0)
+                if filtro_tipo in ('ejercicio', 'estudio'):
+                    stats['actividades_completadas'] = por_tipo.get(filtro_tipo, 0)
                 else:
-                    cur.execute('SELECT COUNT(*) AS total FROM item_diario WHERE completado = 1')
-                    stats['actividades_completadas'] = cur.fetchone().get('total', 0)
-                
-                # Actividades por tipo
-                cur.execute('''
-                    SELECT COUNT(*) AS total 
-                    FROM item_diario id 
-                    JOIN rutina_item ri ON id.id_item = ri.id_item 
-                    JOIN rutina r ON ri.id_rutina = r.id_rutina 
-                    WHERE r.tipo = "ejercicio" AND id.completado = 1
-                ''')
-                stats['actividades_ejercicio'] = cur.fetchone().get('total', 0)
-                
-                cur.execute('''
-                    SELECT COUNT(*) AS total 
-                    FROM item_diario id 
-                    JOIN rutina_item ri ON id.id_item = ri.id_item 
-                    JOIN rutina r ON ri.id_rutina = r.id_rutina 
-                    WHERE r.tipo = "estudio" AND id.completado = 1
-                ''')
-                stats['actividades_estudio'] = cur.fetchone().get('total', 0)
+                    stats['actividades_completadas'] = sum(por_tipo.values())
+                stats['actividades_por_tipo'] = [
+                    {'tipo_actividad': tipo, 'total': total} for tipo, total in por_tipo.items()
+                ]
             except Exception as e:
+                stats['incompleto'] = True
                 print(f'Error actividades: {e}')
             
             # Uso por período
             try:
-                query = f'''
-                SELECT {grupo_fecha} as fecha, COUNT(*) as actividades
-                FROM item_diario 
-                WHERE fecha >= {fecha_filtro} AND completado = 1
+                cur.execute(f'''
+                SELECT {grupo_fecha} as fecha, SUM(completadas) as actividades
+                FROM stats_diarias_tipo
+                WHERE fecha >= {fecha_filtro}
                 GROUP BY {grupo_fecha}
                 ORDER BY fecha
-                '''
-                cur.execute(query)
-                uso_data = cur.fetchall() or []
-                stats['uso_por_periodo'] = uso_data
+                ''')
+                stats['uso_por_periodo'] = cur.fetchall() or []
             except Exception as e:
+                stats['incompleto'] = True
                 print(f'Error uso por período: {e}')
                 stats['uso_por_periodo'] = []
             
-            # Actividades por tipo para gráfico
-            try:
-                cur.execute('''
-                SELECT r.tipo, COUNT(*) as total
-                FROM item_diario id
-                JOIN rutina_item ri ON id.id_item = ri.id_item 
-                JOIN rutina r ON ri.id_rutina = r.id_rutina 
-                WHERE id.completado = 1
-                GROUP BY r.tipo
-                ''')
-                tipo_data = cur.fetchall() or []
-                
-                if tipo_data:
-                    # Convertir a formato esperado por el frontend
-                    tipo_data = [{'tipo_actividad': row.get('tipo', 'sin_tipo'), 'total': row.get('total', 0)} for row in tipo_data]
-                else:
-                    tipo_data = []
-                
-                stats['actividades_por_tipo'] = tipo_data
-                print(f'Actividades por tipo: {tipo_data}')
-            except Exception as e:
-                print(f'Error actividades por tipo: {e}')
-                stats['actividades_por_tipo'] = []
-            
             # Crecimiento de usuarios por período
             try:
-                query = f'''
-                SELECT {grupo_fecha_usuarios} as fecha, COUNT(*) as nuevos_usuarios
-                FROM usuario 
-                WHERE fecha_creacion >= {fecha_filtro}
-                GROUP BY {grupo_fecha_usuarios}
+                cur.execute(f'''
+                SELECT {grupo_fecha} as fecha, SUM(nuevos) as nuevos_usuarios
+                FROM stats_usuarios_nuevos
+                WHERE fecha >= {fecha_filtro}
+                GROUP BY {grupo_fecha}
                 ORDER BY fecha
-                '''
-                cur.execute(query)
-                crecimiento_data = cur.fetchall() or []
-                stats['crecimiento_usuarios'] = crecimiento_data
+                ''')
+                stats['crecimiento_usuarios'] = cur.fetchall() or []
             except Exception as e:
+                stats['incompleto'] = True
                 print(f'Error crecimiento usuarios: {e}')
                 stats['crecimiento_usuarios'] = []
             
-            # Rutinas más populares
+            # Rutinas más populares (hasta ayer)
             try:
                 cur.execute('''
-                SELECT r.nombre, r.tipo, COUNT(id.id) as usos
-                FROM rutina r
-                LEFT JOIN rutina_item ri ON r.id_rutina = ri.id_rutina
-                LEFT JOIN item_diario id ON ri.id_item = id.id_item
-                WHERE id.completado = 1
-                GROUP BY r.id_rutina, r.nombre, r.tipo
-                ORDER BY usos DESC
+                SELECT r.nombre, r.tipo, s.completadas as usos
+                FROM stats_rutina s
+                JOIN rutina r ON r.id_rutina = s.id_rutina
+                ORDER BY s.completadas DESC
                 LIMIT 10
                 ''')
                 stats['rutinas_mas_populares'] = cur.fetchall() or []
             except Exception as e:
+                stats['incompleto'] = True
                 print(f'Error rutinas populares: {e}')
             
-            # Usuarios más activos
+            # Usuarios más activos (hasta ayer)
             try:
                 cur.execute('''
-                SELECT u.nombre, COUNT(id.id) as actividades_completadas
-                FROM usuario u
-                LEFT JOIN item_diario id ON u.id = id.id_usuario
-                WHERE id.completado = 1
-                GROUP BY u.id, u.nombre
-                ORDER BY actividades_completadas DESC
+                SELECT u.nombre, s.completadas as actividades_completadas
+                FROM stats_usuario s
+                JOIN usuario u ON u.id = s.user_id
+                ORDER BY s.completadas DESC
                 LIMIT 10
                 ''')
                 stats['usuarios_mas_activos'] = cur.fetchall() or []
             except Exception as e:
+                stats['incompleto'] = True
                 print(f'Error usuarios activos: {e}')
         
         conn.close()
     except Exception as e:
+        stats['incompleto'] = True
         print('get_global_statistics error:', e)
     
     return stats
 
 
+@cached(ttl=60)
 def get_admin_stats():
+    """Contadores del dashboard (COUNT(*) en vivo). Caché de 60 s."""
     stats = {
         'usuarios': 0, 
         'rutinas_publicas': 0, 
@@ -312,25 +257,20 @@ def get_admin_stats():
     try:
         conn = get_db_connection()
         with conn.cursor(pymysql.cursors.DictCursor) as cur:
-            # Usuarios totales
-            cur.execute('SELECT COUNT(*) AS total FROM usuario')
-            stats['usuarios'] = cur.fetchone().get('total', 0)
-            
-            # Rutinas públicas (tipo 'compartida') y totales
+            # Usuarios y rutinas (públicas = tipo 'compartida')
             try:
-                cur.execute("SELECT COUNT(*) AS total FROM rutina WHERE tipo = 'compartida'")
-                stats['rutinas_publicas'] = cur.fetchone().get('total', 0)
-                cur.execute('SELECT COUNT(*) AS total FROM rutina')
-                stats['total_rutinas'] = cur.fetchone().get('total', 0)
+                globales = contar_totales(cur)
+                stats['usuarios'] = globales.get('usuarios', 0)
+                stats['rutinas_publicas'] = globales.get('rutinas_compartida', 0)
+                stats['total_rutinas'] = globales.get('rutinas', 0)
             except Exception as e:
                 print(f'Error rutinas: {e}')
                 stats['rutinas_publicas'] = 0
                 stats['total_rutinas'] = 0
             
-            # Notificaciones no leídas
+            # Notificaciones no leídas (contador cacheado de models.notification)
             try:
-                cur.execute('SELECT COUNT(*) AS total FROM user_notifications WHERE is_read = 0')
-                stats['notificaciones'] = cur.fetchone().get('total', 0)
+                stats['notificaciones'] = contar_no_leidas()
             except Exception as e:
                 print(f'Error notificaciones: {e}')
                 stats['notificaciones'] = 0
@@ -365,10 +305,11 @@ def get_admin_stats():
                 print(f'Error contenido_admin: {e}')
                 stats['contenido_admin'] = 0
             
-            # Usuarios activos en el último mes (aproximado)
+            # Usuarios activos en el último mes (aproximado, desde stats_usuarios_nuevos)
             try:
-                cur.execute('SELECT COUNT(*) AS total FROM usuario WHERE fecha_creacion >= DATE_SUB(NOW(), INTERVAL 30 DAY)')
-                stats['usuarios_activos_mes'] = cur.fetchone().get('total', 0)
+                asegurar_refresco()
+                cur.execute('SELECT COALESCE(SUM(nuevos), 0) AS total FROM stats_usuarios_nuevos WHERE fecha >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)')
+                stats['usuarios_activos_mes'] = int(cur.fetchone().get('total', 0))
             except Exception as e:
                 print(f'Error usuarios activos: {e}')
                 stats['usuarios_activos_mes'] = 0
@@ -382,11 +323,7 @@ def get_admin_stats():
 def list_admin_content(content_type='rutina_destacada'):
     items = []
     try:
-        conn = get_db_connection()
-        with conn.cursor(pymysql.cursors.DictCursor) as cur:
-            cur.execute('SELECT * FROM contenido_admin WHERE tipo_contenido = %s ORDER BY actualizado_en DESC', (content_type,))
-            items = cur.fetchall() or []
-        conn.close()
+        items = listar_contenido_admin(content_type)
     except Exception as e:
         print('list_admin_content error:', e)
     return items
@@ -408,10 +345,15 @@ def get_notifications(limit=200):
 def mark_notification_read(nid):
     try:
         conn = get_db_connection()
-        with conn.cursor() as cur:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
             cur.execute('UPDATE user_notifications SET is_read = 1 WHERE id = %s', (nid,))
+            cur.execute('SELECT user_id FROM user_notifications WHERE id = %s', (nid,))
+            row = cur.fetchone()
         conn.commit()
         conn.close()
+        if row:
+            al_confirmar(lambda: invalidar_no_leidas(row['user_id']))
+        al_confirmar(get_admin_stats.cache.clear)
         return True
     except Exception as e:
         print('mark_notification_read error:', e)
@@ -430,17 +372,19 @@ def inject_admin_sidebar():
     ]
     unread = 0
     try:
-        conn = get_db_connection()
-        with conn.cursor(pymysql.cursors.DictCursor) as cur:
-            cur.execute('SELECT COUNT(*) AS total FROM user_notifications WHERE is_read = 0')
-            row = cur.fetchone()
-            unread = int(row.get('total', 0)) if row else 0
-        conn.close()
+        unread = contar_no_leidas()
     except Exception:
         unread = 0
     return dict(admin_sidebar=admin_sidebar, admin_unread_notifications=unread)
 
 
+@admin_bp.route('/metrics')
+def metrics():
+    """Métricas de BD y del pool en formato Prometheus (mismo registro que /metrics).
+    Con sesión de administrador no hace falta METRICS_TOKEN."""
+    return metrics_response(autorizado='admin_email' in session)
+
+
 @admin_bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -600,6 +544,8 @@ def content_manager():
                 cur.execute('INSERT INTO contenido_admin (tipo_contenido, titulo, texto, url_imagen, actualizado_por, actualizado_en) VALUES (%s,%s,%s,%s,%s,%s)', (ctype, title, body, image_name, session.get('admin_id'), datetime.now()))
             conn.commit()
             conn.close()
+            get_admin_stats.cache.clear()
+            invalidar_contenido_admin()
             flash('Contenido creado.', 'success')
         except Exception as e:
             flash(f'Error creando contenido: {e}', 'danger')
@@ -642,6 +588,8 @@ def content_delete(item_id):
                 flash('Contenido eliminado.', 'success')
         conn.commit()
         conn.close()
+        get_admin_stats.cache.clear()
+        invalidar_contenido_admin()
     except Exception as e:
         flash(f'Error al eliminar contenido: {e}', 'danger')
     return redirect(request.referrer or url_for('admin.content_manager'))
@@ -679,6 +627,7 @@ def admin_approve_post(post_id):
             cur.execute('UPDATE community_posts SET approved = 1 WHERE id = %s', (post_id,))
         conn.commit()
         conn.close()
+        get_admin_stats.cache.clear()
         flash('Publicación aprobada', 'success')
     except Exception as e:
         flash(f'Error al aprobar publicación: {e}', 'danger')
@@ -708,6 +657,7 @@ def admin_delete_post(post_id):
                                f'Tu publicación "{post_info["title"]}" ha sido eliminada por: {motivo}',
                                datetime.now(),
                                0))
+                    al_confirmar(lambda: invalidar_no_leidas(post_info['user_id']))
                 except Exception as e:
                     print(f'Error enviando notificación: {e}')
                 
@@ -716,6 +666,7 @@ def admin_delete_post(post_id):
                 flash('Publicación no encontrada.', 'warning')
         conn.commit()
         conn.close()
+        get_admin_stats.cache.clear()
     except Exception as e:
         flash(f'Error al eliminar publicación: {e}', 'danger')
     return redirect(request.referrer or url_for('admin.admin_community_posts'))
@@ -733,6 +684,7 @@ def delete_recommendation(recommendation_id):
             if rec:
                 cur.execute('DELETE FROM recommendations WHERE id = %s', (recommendation_id,))
                 conn.commit()
+                get_admin_stats.cache.clear()
                 flash(f'Recomendación "{rec[0] if isinstance(rec, tuple) else rec.get("title", "")}" eliminada por violación de normas.', 'success')
             else:
                 flash('Recomendación no encontrada.', 'warning')
@@ -813,27 +765,103 @@ def global_statistics():
     filtro_tipo = request.args.get('tipo', None)  # 'ejercicio', 'estudio', o None para todos
     periodo = request.args.get('periodo', 'mes')  # 'semana', 'mes', 'año'
     formato_export = request.args.get('export', None)  # 'csv', 'pdf', o None
+    datos = request.args.get('datos', None)  # 'completados', 'usuarios': datos crudos en CSV (streaming)
+    
+    if formato_export == 'csv' and datos in EXPORTACIONES:
+        return export_raw_csv(datos, filtro_tipo, periodo)
+    
+    # Los informes se generan en segundo plano (models.informes)
+    if formato_export in ('csv', 'pdf'):
+        id_informe = encargar_informe(formato_export, filtro_tipo, periodo)
+        return redirect(url_for('admin.report_download', report_id=id_informe))
     
     # Obtener estadísticas
     stats = get_global_statistics(filtro_tipo, periodo)
     
-    # Si se solicita exportación
-    if formato_export == 'csv':
-        return export_statistics_csv(stats, filtro_tipo, periodo)
-    elif formato_export == 'pdf':
-        return export_statistics_pdf(stats, filtro_tipo, periodo)
-    
     return render_template('admin/admin_global_statistics.html', 
                          stats=stats, 
                          filtro_tipo=filtro_tipo, 
                          periodo=periodo)
 
 
-def export_statistics_csv(stats, filtro_tipo, periodo):
-    """Exporta las estadísticas en formato CSV con estructura mejorada"""
+def encargar_informe(formato, filtro_tipo, periodo):
+    """Encarga el informe a la cola; la clave incluye la versión de los resúmenes globales"""
+    version = None
+    try:
+        asegurar_refresco()
+        conn = get_db_connection()
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            version = version_datos(cur)
+        conn.close()
+    except Exception as e:
+        print('version_datos error:', e)
+    
+    render = render_statistics_pdf if formato == 'pdf' else render_statistics_csv
+    
+    def generar():
+        # Sin la caché de 60 s: el informe debe corresponder a la versión de su clave
+        stats = get_global_statistics.__wrapped__(filtro_tipo, periodo)
+        return render(stats, filtro_tipo, periodo)
+    
+    return cola_informes().enviar((formato, filtro_tipo, periodo, version), formato, generar)
+
+
+def _estado_informe(report_id):
+    cola = cola_informes()
+    estado = cola.estado(report_id)
+    return {
+        'id': report_id,
+        'estado': estado,
+        'error': cola.error(report_id),
+        'url_estado': url_for('admin.report_status', report_id=report_id),
+        'url_descarga': url_for('admin.report_download', report_id=report_id) if estado == 'listo' else None,
+    }
+
+
+@admin_bp.route('/reports', methods=['POST'])
+@admin_login_required
+def report_submit():
+    formato = request.values.get('formato', 'pdf')
+    if formato not in ('csv', 'pdf'):
+        return jsonify({'error': 'Formato no soportado'}), 400
+    id_informe = encargar_informe(formato, request.values.get('tipo') or None, request.values.get('periodo', 'mes'))
+    return jsonify(_estado_informe(id_informe)), 202
+
+
+@admin_bp.route('/reports/<report_id>')
+@admin_login_required
+def report_status(report_id):
+    return jsonify(_estado_informe(report_id))
+
+
+@admin_bp.route('/reports/<report_id>/download')
+@admin_login_required
+def report_download(report_id):
+    from flask import send_file, make_response
+    
+    cola = cola_informes()
+    ruta = cola.ruta(report_id)
+    if ruta:
+        extension = report_id.rsplit('.', 1)[-1]
+        mimetype = 'application/pdf' if extension == 'pdf' else 'text/csv; charset=utf-8'
+        return send_file(ruta, mimetype=mimetype, as_attachment=True,
+                         download_name=f'estadisticas_focusfit_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}')
+    
+    estado = cola.estado(report_id)
+    if estado == 'pendiente':
+        # Para el enlace directo del navegador: la página se recarga hasta que el informe esté listo
+        response = make_response('<meta http-equiv="refresh" content="2"><p>Generando informe...</p>', 202)
+        response.headers['Retry-After'] = '2'
+        return response
+    if estado == 'error':
+        return jsonify({'error': f'Error generando informe: {cola.error(report_id)}'}), 500
+    return jsonify({'error': 'Informe no encontrado o caducado'}), 404
+
+
+def render_statistics_csv(stats, filtro_tipo, periodo):
+    """Genera el informe de estadísticas en CSV (bytes UTF-8) con estructura mejorada"""
     import csv
     import io
-    from flask import make_response
     from datetime import datetime
     
     # Usar StringIO con encoding específico
@@ -943,216 +971,206 @@ def export_statistics_csv(stats, filtro_tipo, periodo):
     writer.writerow(['FIN DEL REPORTE'])
     writer.writerow(['Generado por FocusFit Admin Panel'])
     
-    # Crear respuesta con encoding correcto
-    csv_content = output.getvalue()
+    return output.getvalue().encode('utf-8')
+
+
+def export_raw_csv(datos, filtro_tipo, periodo):
+    """Exporta datos crudos (models.exportacion) en streaming, sin cargarlos en memoria"""
+    from flask import Response
     
-    # Crear respuesta
-    response = make_response(csv_content.encode('utf-8'))
+    response = Response(filas_csv(datos, filtro_tipo, periodo), mimetype='text/csv')
     response.headers['Content-Type'] = 'text/csv; charset=utf-8'
-    response.headers['Content-Disposition'] = f'attachment; filename=estadisticas_focusfit_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-    
+    response.headers['Content-Disposition'] = f'attachment; filename={datos}_focusfit_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    # Que un proxy (nginx) no acumule la descarga antes de enviarla
+    response.headers['X-Accel-Buffering'] = 'no'
     return response
 
 
-def export_statistics_pdf(stats, filtro_tipo, periodo):
-    """Exporta las estadísticas en formato PDF"""
-    try:
-        from reportlab.lib.pagesizes import letter, A4
-        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib.units import inch
-        from reportlab.lib import colors
-        from datetime import datetime
-        import io
-        from flask import make_response
+def render_statistics_pdf(stats, filtro_tipo, periodo):
+    """Genera el informe de estadísticas en PDF (bytes). Los errores se propagan a la cola de informes"""
+    from reportlab.lib.pagesizes import letter, A4
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.lib import colors
+    from datetime import datetime
+    import io
+    
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=0.5*inch, rightMargin=0.5*inch)
+    styles = getSampleStyleSheet()
+    story = []
+    
+    # Título
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        textColor=colors.darkblue,
+        alignment=1  # Centrado
+    )
+    story.append(Paragraph("📊 Estadísticas Globales FocusFit", title_style))
+    story.append(Spacer(1, 20))
+    
+    # Información del reporte
+    info_style = styles['Normal']
+    story.append(Paragraph(f"<b>Filtro de tipo:</b> {filtro_tipo or 'Todos'}", info_style))
+    story.append(Paragraph(f"<b>Período:</b> {periodo}", info_style))
+    story.append(Paragraph(f"<b>Fecha de exportación:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", info_style))
+    story.append(Spacer(1, 30))
+    
+    # Estadísticas principales
+    story.append(Paragraph("📈 Estadísticas Principales", styles['Heading2']))
+    story.append(Spacer(1, 12))
+    
+    data = [
+        ['Estadística', 'Valor'],
+        ['Usuarios totales', str(stats.get('usuarios_totales', 0))],
+        ['Usuarios activos', str(stats.get('usuarios_activos', 0))],
+        ['Rutinas creadas', str(stats.get('rutinas_creadas', 0))],
+        ['Rutinas de ejercicio', str(stats.get('rutinas_ejercicio', 0))],
+        ['Rutinas de estudio', str(stats.get('rutinas_estudio', 0))],
+        ['Actividades completadas', str(stats.get('actividades_completadas', 0))],
+        ['Actividades de ejercicio', str(stats.get('actividades_ejercicio', 0))],
+        ['Actividades de estudio', str(stats.get('actividades_estudio', 0))],
+    ]
+    
+    table = Table(data, colWidths=[3*inch, 1.5*inch])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    story.append(table)
+    story.append(Spacer(1, 30))
+    
+    # Uso por período
+    uso_data = stats.get('uso_por_periodo', [])
+    if uso_data:
+        story.append(Paragraph("📅 Uso por Período", styles['Heading2']))
+        story.append(Spacer(1, 12))
         
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=0.5*inch, rightMargin=0.5*inch)
-        styles = getSampleStyleSheet()
-        story = []
+        uso_table_data = [['Fecha', 'Actividades']]
+        for item in uso_data[:10]:  # Limitar a 10 elementos
+            fecha = item.get('fecha', 'N/A') if isinstance(item, dict) else getattr(item, 'fecha', 'N/A')
+            actividades = item.get('actividades', 0) if isinstance(item, dict) else getattr(item, 'actividades', 0)
+            uso_table_data.append([str(fecha), str(actividades)])
         
-        # Título
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            textColor=colors.darkblue,
-            alignment=1  # Centrado
-        )
-        story.append(Paragraph("📊 Estadísticas Globales FocusFit", title_style))
+        uso_table = Table(uso_table_data, colWidths=[2*inch, 1.5*inch])
+        uso_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.darkgreen),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 11),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.lightgreen),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+        story.append(uso_table)
         story.append(Spacer(1, 20))
-        
-        # Información del reporte
-        info_style = styles['Normal']
-        story.append(Paragraph(f"<b>Filtro de tipo:</b> {filtro_tipo or 'Todos'}", info_style))
-        story.append(Paragraph(f"<b>Período:</b> {periodo}", info_style))
-        story.append(Paragraph(f"<b>Fecha de exportación:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", info_style))
-        story.append(Spacer(1, 30))
-        
-        # Estadísticas principales
-        story.append(Paragraph("📈 Estadísticas Principales", styles['Heading2']))
+    
+    # Actividades por tipo
+    tipo_data = stats.get('actividades_por_tipo', [])
+    if tipo_data:
+        story.append(Paragraph("🎯 Actividades por Tipo", styles['Heading2']))
         story.append(Spacer(1, 12))
         
-        data = [
-            ['Estadística', 'Valor'],
-            ['Usuarios totales', str(stats.get('usuarios_totales', 0))],
-            ['Usuarios activos', str(stats.get('usuarios_activos', 0))],
-            ['Rutinas creadas', str(stats.get('rutinas_creadas', 0))],
-            ['Rutinas de ejercicio', str(stats.get('rutinas_ejercicio', 0))],
-            ['Rutinas de estudio', str(stats.get('rutinas_estudio', 0))],
-            ['Actividades completadas', str(stats.get('actividades_completadas', 0))],
-            ['Actividades de ejercicio', str(stats.get('actividades_ejercicio', 0))],
-            ['Actividades de estudio', str(stats.get('actividades_estudio', 0))],
-        ]
+        tipo_table_data = [['Tipo', 'Total']]
+        for item in tipo_data:
+            tipo = item.get('tipo_actividad', 'N/A') if isinstance(item, dict) else getattr(item, 'tipo_actividad', 'N/A')
+            total = item.get('total', 0) if isinstance(item, dict) else getattr(item, 'total', 0)
+            tipo_table_data.append([str(tipo), str(total)])
         
-        table = Table(data, colWidths=[3*inch, 1.5*inch])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+        tipo_table = Table(tipo_table_data, colWidths=[2*inch, 1.5*inch])
+        tipo_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.orange),
             ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
             ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
+            ('FONTSIZE', (0, 0), (-1, 0), 11),
             ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.lightyellow),
             ('GRID', (0, 0), (-1, -1), 1, colors.black)
         ]))
-        story.append(table)
-        story.append(Spacer(1, 30))
-        
-        # Uso por período
-        uso_data = stats.get('uso_por_periodo', [])
-        if uso_data:
-            story.append(Paragraph("📅 Uso por Período", styles['Heading2']))
-            story.append(Spacer(1, 12))
-            
-            uso_table_data = [['Fecha', 'Actividades']]
-            for item in uso_data[:10]:  # Limitar a 10 elementos
-                fecha = item.get('fecha', 'N/A') if isinstance(item, dict) else getattr(item, 'fecha', 'N/A')
-                actividades = item.get('actividades', 0) if isinstance(item, dict) else getattr(item, 'actividades', 0)
-                uso_table_data.append([str(fecha), str(actividades)])
-            
-            uso_table = Table(uso_table_data, colWidths=[2*inch, 1.5*inch])
-            uso_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.darkgreen),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 11),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.lightgreen),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            story.append(uso_table)
-            story.append(Spacer(1, 20))
-        
-        # Actividades por tipo
-        tipo_data = stats.get('actividades_por_tipo', [])
-        if tipo_data:
-            story.append(Paragraph("🎯 Actividades por Tipo", styles['Heading2']))
-            story.append(Spacer(1, 12))
-            
-            tipo_table_data = [['Tipo', 'Total']]
-            for item in tipo_data:
-                tipo = item.get('tipo_actividad', 'N/A') if isinstance(item, dict) else getattr(item, 'tipo_actividad', 'N/A')
-                total = item.get('total', 0) if isinstance(item, dict) else getattr(item, 'total', 0)
-                tipo_table_data.append([str(tipo), str(total)])
-            
-            tipo_table = Table(tipo_table_data, colWidths=[2*inch, 1.5*inch])
-            tipo_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.orange),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 11),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.lightyellow),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            story.append(tipo_table)
-            story.append(Spacer(1, 20))
-        
-        # Rutinas más populares
-        rutinas_data = stats.get('rutinas_mas_populares', [])
-        if rutinas_data:
-            story.append(Paragraph("🏆 Rutinas Más Populares", styles['Heading2']))
-            story.append(Spacer(1, 12))
-            
-            rutinas_table_data = [['Nombre', 'Tipo', 'Usos']]
-            for rutina in rutinas_data[:10]:  # Limitar a 10 elementos
-                nombre = rutina.get('nombre', 'N/A') if isinstance(rutina, dict) else getattr(rutina, 'nombre', 'N/A')
-                tipo = rutina.get('tipo', 'N/A') if isinstance(rutina, dict) else getattr(rutina, 'tipo', 'N/A')
-                usos = rutina.get('usos', 0) if isinstance(rutina, dict) else getattr(rutina, 'usos', 0)
-                # Truncar nombre si es muy largo
-                nombre_corto = (nombre[:25] + '...') if len(str(nombre)) > 25 else str(nombre)
-                rutinas_table_data.append([nombre_corto, str(tipo), str(usos)])
-            
-            rutinas_table = Table(rutinas_table_data, colWidths=[2.5*inch, 1*inch, 1*inch])
-            rutinas_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.purple),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 11),
-                ('FONTSIZE', (0, 1), (-1, -1), 9),  # Texto más pequeño para contenido
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.lavender),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            story.append(rutinas_table)
-            story.append(Spacer(1, 20))
-        
-        # Usuarios más activos
-        usuarios_data = stats.get('usuarios_mas_activos', [])
-        if usuarios_data:
-            story.append(Paragraph("⭐ Usuarios Más Activos", styles['Heading2']))
-            story.append(Spacer(1, 12))
-            
-            usuarios_table_data = [['Nombre', 'Apellido', 'Actividades']]
-            for usuario in usuarios_data[:10]:  # Limitar a 10 elementos
-                nombre = usuario.get('nombre', 'N/A') if isinstance(usuario, dict) else getattr(usuario, 'nombre', 'N/A')
-                apellido = usuario.get('apellido', 'N/A') if isinstance(usuario, dict) else getattr(usuario, 'apellido', 'N/A')
-                actividades = usuario.get('actividades_completadas', 0) if isinstance(usuario, dict) else getattr(usuario, 'actividades_completadas', 0)
-                usuarios_table_data.append([str(nombre), str(apellido), str(actividades)])
-            
-            usuarios_table = Table(usuarios_table_data, colWidths=[1.5*inch, 1.5*inch, 1.5*inch])
-            usuarios_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.teal),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 11),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.lightcyan),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            story.append(usuarios_table)
-        
-        # Pie de página
-        story.append(Spacer(1, 30))
-        footer_style = ParagraphStyle(
-            'Footer',
-            parent=styles['Normal'],
-            fontSize=10,
-            textColor=colors.grey,
-            alignment=1
-        )
-        story.append(Paragraph("Generado por FocusFit Admin Panel", footer_style))
+        story.append(tipo_table)
+        story.append(Spacer(1, 20))
+    
+    # Rutinas más populares
+    rutinas_data = stats.get('rutinas_mas_populares', [])
+    if rutinas_data:
+        story.append(Paragraph("🏆 Rutinas Más Populares", styles['Heading2']))
+        story.append(Spacer(1, 12))
         
-        # Construir PDF
-        doc.build(story)
-        buffer.seek(0)
+        rutinas_table_data = [['Nombre', 'Tipo', 'Usos']]
+        for rutina in rutinas_data[:10]:  # Limitar a 10 elementos
+            nombre = rutina.get('nombre', 'N/A') if isinstance(rutina, dict) else getattr(rutina, 'nombre', 'N/A')
+            tipo = rutina.get('tipo', 'N/A') if isinstance(rutina, dict) else getattr(rutina, 'tipo', 'N/A')
+            usos = rutina.get('usos', 0) if isinstance(rutina, dict) else getattr(rutina, 'usos', 0)
+            # Truncar nombre si es muy largo
+            nombre_corto = (nombre[:25] + '...') if len(str(nombre)) > 25 else str(nombre)
+            rutinas_table_data.append([nombre_corto, str(tipo), str(usos)])
         
-        # Crear respuesta
-        response = make_response(buffer.getvalue())
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = f'attachment; filename=estadisticas_focusfit_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+        rutinas_table = Table(rutinas_table_data, colWidths=[2.5*inch, 1*inch, 1*inch])
+        rutinas_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.purple),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 11),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),  # Texto más pequeño para contenido
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.lavender),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+        story.append(rutinas_table)
+        story.append(Spacer(1, 20))
+    
+    # Usuarios más activos
+    usuarios_data = stats.get('usuarios_mas_activos', [])
+    if usuarios_data:
+        story.append(Paragraph("⭐ Usuarios Más Activos", styles['Heading2']))
+        story.append(Spacer(1, 12))
         
-        return response
+        usuarios_table_data = [['Nombre', 'Apellido', 'Actividades']]
+        for usuario in usuarios_data[:10]:  # Limitar a 10 elementos
+            nombre = usuario.get('nombre', 'N/A') if isinstance(usuario, dict) else getattr(usuario, 'nombre', 'N/A')
+            apellido = usuario.get('apellido', 'N/A') if isinstance(usuario, dict) else getattr(usuario, 'apellido', 'N/A')
+            actividades = usuario.get('actividades_completadas', 0) if isinstance(usuario, dict) else getattr(usuario, 'actividades_completadas', 0)
+            usuarios_table_data.append([str(nombre), str(apellido), str(actividades)])
         
-    except Exception as e:
-        print(f"Error generando PDF: {e}")
-        from flask import jsonify
-        return jsonify({'error': f'Error generando PDF: {str(e)}'}), 500
+        usuarios_table = Table(usuarios_table_data, colWidths=[1.5*inch, 1.5*inch, 1.5*inch])
+        usuarios_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.teal),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 11),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.lightcyan),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+        story.append(usuarios_table)
+    
+    # Pie de página
+    story.append(Spacer(1, 30))
+    footer_style = ParagraphStyle(
+        'Footer',
+        parent=styles['Normal'],
+        fontSize=10,
+        textColor=colors.grey,
+        alignment=1
+    )
+    story.append(Paragraph("Generado por FocusFit Admin Panel", footer_style))
+    
+    # Construir PDF
+    doc.build(story)
+    return buffer.getvalue()
 
 
 @admin_bp.route('/perfil', methods=['GET', 'POST'])
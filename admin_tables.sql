@@ -30,8 +30,16 @@ CREATE TABLE IF NOT EXISTS `user_notifications` (
   `is_delivered` TINYINT(1) DEFAULT 0,
   `fecha_envio` DATETIME NULL,
   `tipo` VARCHAR(50) DEFAULT 'recordatorio',
+  `rutina_id` INT NULL,
+  `kind` VARCHAR(20) NOT NULL DEFAULT 'aviso',
+  `envio_reclamado` DATETIME NULL,
+  `envio_intentos` INT NOT NULL DEFAULT 0,
+  `envio_siguiente` DATETIME NULL,
   `created_at` DATETIME DEFAULT CURRENT_TIMESTAMP,
   INDEX (`user_id`),
   INDEX (`is_read`),
-  INDEX (`fecha_programada`)
+  INDEX (`fecha_programada`),
+  INDEX `idx_notif_rutina` (`rutina_id`),
+  INDEX `idx_notif_envio` (`tipo`, `fecha_envio`, `fecha_programada`),
+  UNIQUE KEY `uniq_notif_origen` (`user_id`, `rutina_id`, `kind`, `fecha_programada`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -1,10 +1,14 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
-from models.db import get_db_connection
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, Response
+from models.db import get_db_connection, init_app as init_db_app, al_confirmar
+from models.metrics import init_app as init_metrics_app, metrics_response
+from models.nplusone import init_app as init_nplusone_app
+from models.contenido_admin import listar as listar_contenido_admin
+from models.correo import repartidor_correo
 from models.user import get_user_by_email, create_user, update_user_password, update_user_email, update_user_name, update_user_avatar, update_user_phone
 
 # importar notificaciones y rachas (copiadas desde el otro proyecto)
 try:
-    from models.notification import create_notifications_for_routine, get_due_notifications, mark_delivered
+    from models.notification import create_notifications_for_routine, get_due_notifications, mark_delivered, mark_delivered_many, contar_no_leidas
     try:
         from models.notification import create_email_reminder_for_routine, get_pending_email_reminders, mark_notification_sent
     except Exception:
@@ -15,6 +19,8 @@ except Exception:
     create_notifications_for_routine = None
     get_due_notifications = None
     mark_delivered = None
+    mark_delivered_many = None
+    contar_no_leidas = None
 
 try:
     from models.streak import mark_task_completed, get_global_streak, evaluate_daily_streak, check_and_reset_missed_streaks, debug_streak_status
@@ -27,7 +33,7 @@ except Exception:
 
 # Importar sistema de rachas mejorado
 try:
-    from sistema_rachas_mejorado import evaluar_racha_inteligente, evaluar_racha_forzar_recalculo, verificar_racha_perdida, obtener_estado_racha_dia
+    from sistema_rachas_mejorado import evaluar_racha_inteligente, evaluar_racha_forzar_recalculo, verificar_racha_perdida, obtener_estado_racha_dia, registrar_evento_item, invalidar_contador_dia
 except ImportError:
     # Si no existe el archivo, crear funciones dummy
     def evaluar_racha_inteligente(usuario_id):
@@ -39,6 +45,18 @@ except ImportError:
     def obtener_estado_racha_dia(usuario_id):
         return False
 
+    def registrar_evento_item(usuario_id, id_item, completado_antes, completado_ahora, dias_mask=None, fecha=None, tiempo=None):
+        return evaluar_racha_inteligente(usuario_id)
+
+    def invalidar_contador_dia(usuario_id, fecha=None):
+        pass
+
+from progreso_usuario import progreso_semanal as calcular_progreso_semanal, progreso_dias as calcular_progreso_dias
+from models.dias import DIAS_ORDEN, bit_dia, mask_de_dias
+from models.carga_dia import recalcular_carga_usuario
+from models.items_diarios import generar_items_diarios
+from models.historial_rachas import historial as obtener_historial_rachas
+
 import os
 from werkzeug.security import check_password_hash
 from werkzeug.utils import secure_filename
@@ -46,6 +64,7 @@ import smtplib
 from email.message import EmailMessage
 import pymysql
 import re
+import json
 from itsdangerous import URLSafeTimedSerializer
 from flask import current_app
 from datetime import datetime, timedelta
@@ -58,12 +77,6 @@ except Exception:
     # dotenv no está instalada o no se puede cargar: continuar sin ella
     load_dotenv = None
 
-try:
-    from sendgrid import SendGridAPIClient
-    from sendgrid.helpers.mail import Mail
-except Exception:
-    SendGridAPIClient = None
-    Mail = None
 
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -81,6 +94,11 @@ app.config['MAIL_USE_CONSOLE'] = os.environ.get('MAIL_USE_CONSOLE', '1') == '1'
 app.config['UPLOAD_FOLDER'] = os.path.join(STATIC_DIR, 'img', 'avatars')  # Carpeta para subir avatares (servida desde static)
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Una conexión y un commit por petición (compartida por todos los helpers de modelos)
+init_db_app(app)
+init_metrics_app(app)
+init_nplusone_app(app)
+
 # Admin blueprint removed: admin_dashboard.py was deleted per user request.
 # Register admin blueprint from admin_app so admin panel is available on the same port
 try:
@@ -111,17 +129,10 @@ def allowed_file(filename):
 
 def list_admin_content_app(content_type='rutina_destacada', limit=10):
     """Load content added via the admin panel (contenido_admin table).
-    Returns a list of dict rows (may be empty)."""
+    Returns a list of dict rows (may be empty). Cached in models.contenido_admin."""
     items = []
     try:
-        conn = get_db_connection()
-        with conn.cursor(pymysql.cursors.DictCursor) as cur:
-            cur.execute(
-                'SELECT * FROM contenido_admin WHERE tipo_contenido = %s ORDER BY actualizado_en DESC LIMIT %s',
-                (content_type, limit)
-            )
-            items = cur.fetchall() or []
-        conn.close()
+        items = listar_contenido_admin(content_type, limit)
     except Exception as e:
         print('list_admin_content_app error:', e)
     return items
@@ -129,22 +140,23 @@ def list_admin_content_app(content_type='rutina_destacada', limit=10):
 
 @app.context_processor
 def inject_user_notifications():
-    """Inyecta el conteo de notificaciones no leídas del usuario para la UI"""
+    """Inyecta el conteo de notificaciones no leídas del usuario para la UI (contador cacheado)"""
     unread = 0
     try:
         user_id = session.get('usuario_id')
-        if user_id:
-            conn = get_db_connection()
-            with conn.cursor(pymysql.cursors.DictCursor) as cur:
-                cur.execute('SELECT COUNT(*) AS total FROM user_notifications WHERE user_id = %s AND is_read = 0', (user_id,))
-                row = cur.fetchone()
-                unread = int(row.get('total', 0)) if row else 0
-            conn.close()
+        if user_id and contar_no_leidas is not None:
+            unread = contar_no_leidas(user_id)
     except Exception:
         unread = 0
     return dict(user_unread_notifications=unread)
 
 
+@app.route('/metrics')
+def metrics():
+    """Métricas de BD y del pool en formato Prometheus."""
+    return metrics_response()
+
+
 @app.route('/notifications')
 def user_notifications_page():
     """Página de notificaciones del usuario. Usa el partial notifications.html para mostrar los toasts y también lista de notificaciones."""
@@ -202,8 +214,7 @@ def inicio():
     try:
         # ✅ Sistema de rachas mejorado
         try:
-            # Verificar rachas perdidas de días anteriores
-            verificar_racha_perdida(usuario['id'])
+            # Los días anteriores los cierra liquidar_rachas.py cada noche
             # Evaluar estado de racha actual
             estado_racha = evaluar_racha_inteligente(usuario['id'])
         except Exception as e:
@@ -223,46 +234,16 @@ def inicio():
                 FROM rutina r
                 JOIN rutina_item ri ON r.id_rutina = ri.id_rutina
                 LEFT JOIN item_diario id ON ri.id_item = id.id_item AND id.fecha = %s AND id.id_usuario = %s
-                WHERE r.id_usuario = %s AND FIND_IN_SET(%s, r.dias)
+                WHERE r.id_usuario = %s AND (r.dias_mask & %s) <> 0
                 ORDER BY r.horario ASC
-            """, (hoy, usuario['id'], usuario['id'], dia_actual))
+            """, (hoy, usuario['id'], usuario['id'], bit_dia(dia_actual)))
             lista_diaria = cur.fetchall()
 
-            # Progreso semanal
-            dias_orden = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
-            progreso_semanal = []
-
-            for dia in dias_orden:
-                hoy_dt = datetime.today()
-                dias_desde_lunes = hoy_dt.weekday()  # 0=Lunes
-                indice_dia = dias_orden.index(dia)
-                fecha_dia = (hoy_dt - timedelta(days=dias_desde_lunes - indice_dia)).date()
-
-                cur.execute("""
-                    SELECT COUNT(*) AS total
-                    FROM rutina r
-                    JOIN rutina_item ri ON r.id_rutina = ri.id_rutina
-                    WHERE r.id_usuario = %s AND FIND_IN_SET(%s, r.dias)
-                """, (usuario['id'], dia))
-                total = cur.fetchone()['total'] or 0
-
-                if total == 0:
-                    porcentaje = 0
-                else:
-                    cur.execute("""
-                        SELECT COUNT(*) AS completados
-                        FROM rutina r
-                        JOIN rutina_item ri ON r.id_rutina = ri.id_rutina
-                        LEFT JOIN item_diario id ON ri.id_item = id.id_item AND id.fecha = %s AND id.id_usuario = %s
-                        WHERE r.id_usuario = %s AND FIND_IN_SET(%s, r.dias) AND COALESCE(id.completado, FALSE) = 1
-                    """, (fecha_dia, usuario['id'], usuario['id'], dia))
-                    completados = cur.fetchone()['completados'] or 0
-                    porcentaje = round((completados / total) * 100)
-
-                progreso_semanal.append({'dia': dia[:3], 'porcentaje': porcentaje})
+            # Progreso semanal (2 consultas para los 7 días)
+            progreso_semanal = calcular_progreso_semanal(usuario['id'], hoy)
 
             # Estadísticas y racha usando el nuevo sistema
-            cumplimiento_pct = progreso_semanal[dias_orden.index(dia_actual)]['porcentaje']
+            cumplimiento_pct = progreso_semanal[DIAS_ORDEN.index(dia_actual)]['porcentaje']
             
             estadisticas = {
                 'rachas': estado_racha['racha_actual'],
@@ -354,9 +335,9 @@ def crear_rutina():
             with conn.cursor() as cur:
                 
                 cur.execute("""
-                    INSERT INTO rutina (nombre, tipo, duracion_horas, duracion_minutos, dias, horario, id_usuario)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, (nombre, tipo, duracion_horas, duracion_minutos, dias, horario, id_usuario))
+                    INSERT INTO rutina (nombre, tipo, duracion_horas, duracion_minutos, dias, dias_mask, horario, id_usuario)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """, (nombre, tipo, duracion_horas, duracion_minutos, dias, mask_de_dias(dias), horario, id_usuario))
                 id_rutina = cur.lastrowid
 
               
@@ -388,6 +369,9 @@ def crear_rutina():
                             VALUES (%s, %s, %s, %s)
                         """, (id_rutina, n, t_val, p_val))
 
+                # Carga por día de la semana, en la misma transacción
+                recalcular_carga_usuario(id_usuario, cur)
+
             conn.commit()
             conn.close()
 
@@ -451,6 +435,9 @@ def crear_rutina():
                 # Crear recordatorio único por email (si está disponible)
                 if create_email_reminder_for_routine is not None:
                     create_email_reminder_for_routine(id_usuario, id_rutina, nombre, horario, minutes_before=30)
+                # Los primeros recordatorios pueden vencer antes de la próxima carga del despachador
+                if despachador is not None:
+                    al_confirmar(despachador.resincronizar)
             except Exception:
                 pass
             flash('Rutina creada exitosamente', 'success')
@@ -657,10 +644,11 @@ def community_post():
             conn = get_db_connection()
             with conn.cursor() as cur:
                 # Use neutral tipo 'compartida' for community-created rutinas (requires enum migration)
-                cur.execute('INSERT INTO rutina (nombre, tipo, duracion_horas, duracion_minutos, dias, horario, id_usuario) VALUES (%s, %s, %s, %s, %s, %s, %s)', (
-                    title, 'compartida', 0, 0, dias, None, usuario['id']
+                cur.execute('INSERT INTO rutina (nombre, tipo, duracion_horas, duracion_minutos, dias, dias_mask, horario, id_usuario) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)', (
+                    title, 'compartida', 0, 0, dias, mask_de_dias(dias), None, usuario['id']
                 ))
                 rutina_id = cur.lastrowid
+                recalcular_carga_usuario(usuario['id'], cur)
             conn.commit()
             if conn:
                 conn.close()
@@ -805,9 +793,9 @@ def community_save(post_id):
                     print(f'🕐 DEBUG: Horario original encontrado: {horario_original}')
             
             cur.execute('''
-                INSERT INTO rutina (nombre, tipo, duracion_horas, duracion_minutos, dias, horario, id_usuario, fecha_creacion) 
-                VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
-            ''', (titulo_rutina, 'compartida', duracion_horas, duracion_minutos, dias, horario_original, usuario['id']))
+                INSERT INTO rutina (nombre, tipo, duracion_horas, duracion_minutos, dias, dias_mask, horario, id_usuario, fecha_creacion) 
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW())
+            ''', (titulo_rutina, 'compartida', duracion_horas, duracion_minutos, dias, mask_de_dias(dias), horario_original, usuario['id']))
             new_rutina_id = cur.lastrowid
             print(f'✅ DEBUG: Nueva rutina creada con ID: {new_rutina_id}, horario: {horario_original}')
 
@@ -841,8 +829,11 @@ def community_save(post_id):
                     VALUES (%s, %s, %s, %s)
                 ''', (new_rutina_id, item_nombre, total_minutos_item, 'media'))
 
+            recalcular_carga_usuario(usuario['id'], cur)
+
         conn.commit()
         conn.close()
+        invalidar_contador_dia(usuario['id'])
         
         msg = f'Rutina guardada exitosamente'
         print(f'✅ community_save: success - post_id={post_id}, user_id={usuario["id"]}, new_rutina_id={new_rutina_id}')
@@ -924,8 +915,8 @@ def save_recommendation(rid):
             print(f'✅ DEBUG: Creating rutina - nombre={nombre}, tipo={tipo}, duracion={duracion_horas}h {duracion_minutos}m, dias={dias}')
 
             # insert rutina for this user
-            cur.execute('INSERT INTO rutina (nombre, tipo, duracion_horas, duracion_minutos, dias, horario, id_usuario) VALUES (%s, %s, %s, %s, %s, %s, %s)', (
-                nombre, tipo, duracion_horas, duracion_minutos, dias, None, usuario['id']
+            cur.execute('INSERT INTO rutina (nombre, tipo, duracion_horas, duracion_minutos, dias, dias_mask, horario, id_usuario) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)', (
+                nombre, tipo, duracion_horas, duracion_minutos, dias, mask_de_dias(dias), None, usuario['id']
             ))
             new_rutina_id = cur.lastrowid
             print(f'✅ DEBUG: Nueva rutina creada con ID: {new_rutina_id}')
@@ -936,8 +927,11 @@ def save_recommendation(rid):
                        (new_rutina_id, item_name, duration_minutes))
             print(f'✅ DEBUG: Item creado para rutina {new_rutina_id}')
 
+            recalcular_carga_usuario(usuario['id'], cur)
+
         conn.commit()
         conn.close()
+        invalidar_contador_dia(usuario['id'])
         print(f'✅ save_recommendation: success - rid={rid}, user_id={usuario["id"]}, new_rutina_id={new_rutina_id}')
 
         flash('Rutina guardada exitosamente', 'success')
@@ -1135,9 +1129,9 @@ def editar_rutina_completa(id_rutina):
                     # Actualizar rutina
                     cur.execute("""
                         UPDATE rutina
-                        SET nombre=%s, tipo=%s, duracion_horas=%s, duracion_minutos=%s, dias=%s, horario=%s
+                        SET nombre=%s, tipo=%s, duracion_horas=%s, duracion_minutos=%s, dias=%s, dias_mask=%s, horario=%s
                         WHERE id_rutina=%s AND id_usuario=%s
-                    """, (nombre, tipo, duracion_horas, duracion_minutos, dias, horario, id_rutina, id_usuario))
+                    """, (nombre, tipo, duracion_horas, duracion_minutos, dias, mask_de_dias(dias), horario, id_rutina, id_usuario))
 
                     # Eliminar items existentes
                     cur.execute("DELETE FROM rutina_item WHERE id_rutina = %s", (id_rutina,))
@@ -1162,6 +1156,8 @@ def editar_rutina_completa(id_rutina):
                                     VALUES (%s, %s, %s, %s)
                                 """, (id_rutina, n, t_val, p_val))
 
+                    recalcular_carga_usuario(id_usuario, cur)
+
                 conn.commit()
                 conn.close()
 
@@ -1208,11 +1204,14 @@ def editar_rutina(id_rutina):
         with conn.cursor() as cur:
             cur.execute("""
                 UPDATE rutina
-                SET nombre=%s, tipo=%s, duracion_horas=%s, duracion_minutos=%s, dias=%s, horario=%s
+                SET nombre=%s, tipo=%s, duracion_horas=%s, duracion_minutos=%s, dias=%s, dias_mask=%s, horario=%s
                 WHERE id_rutina=%s AND id_usuario=%s
-            """, (nombre, tipo, duracion_horas, duracion_minutos, dias, horario, id_rutina, usuario['id']))
+            """, (nombre, tipo, duracion_horas, duracion_minutos, dias, mask_de_dias(dias), horario, id_rutina, usuario['id']))
+            recalcular_carga_usuario(usuario['id'], cur)
             conn.commit()
         conn.close()
+        # Los días pueden haber cambiado: el contador de hoy se vuelve a contar
+        invalidar_contador_dia(usuario['id'])
         flash('Rutina actualizada correctamente', 'success')
     except Exception as e:
         flash(f'Error al actualizar rutina: {e}', 'danger')
@@ -1236,6 +1235,7 @@ def eliminar_rutina(id_rutina):
         with conn.cursor() as cur:
             # Solo elimina la rutina si pertenece al usuario
             cur.execute("DELETE FROM rutina WHERE id_rutina=%s AND id_usuario=%s", (id_rutina, usuario['id']))
+            recalcular_carga_usuario(usuario['id'], cur)
             conn.commit()
         conn.close()
 
@@ -1256,36 +1256,44 @@ def eliminar_rutina(id_rutina):
 
 
 def send_email(to_email, subject, body):
-    """Envía un correo usando SendGrid (funciona en producción)"""
+    """Encola el correo; lo envía el repartidor en segundo plano (models.correo), sin bloquear la petición."""
     try:
-        # Obtener la API Key de las variables de entorno
-        sg_api_key = os.environ.get('SENDGRID_API_KEY')
-        from_email = os.environ.get('MAIL_FROM', 'no-reply@focusfit.com')
-        
-        if not sg_api_key:
-            # Modo desarrollo: imprimir en consola
-            print('--- EMAIL (modo desarrollo) ---')
-            print(f'To: {to_email}')
-            print(f'Subject: {subject}')
-            print(body)
-            print('--- FIN EMAIL ---')
-            return
-
-        # Crear el email
-        message = Mail(
-            from_email=from_email,
-            to_emails=to_email,
-            subject=subject,
-            plain_text_content=body
+        repartidor_correo().encolar(to_email, subject, body)
+    except Exception as e:
+        print(f'Error al encolar email: {str(e)}')
+
+
+# Despachador de recordatorios: entrega las vencidas a una bandeja en memoria
+# (la lee /api/notifications/due), las publica para /api/notifications/stream
+# y avisa al repartidor de correo de los 'email_once'. Arranca con la primera
+# petición, así no corre en el proceso vigilante del recargador de Flask. Con
+# NOTIF_DESPACHADOR=0 cada sondeo vuelve a consultar MySQL.
+despachador = None
+bandeja_notificaciones = None
+canal_notificaciones = None
+if os.environ.get('NOTIF_DESPACHADOR', '1') == '1':
+    try:
+        from models.despachador import Despachador, BandejaApp, SumideroEmail, SumideroPush
+        from models.canal_notificaciones import canal_notificaciones
+        bandeja_notificaciones = BandejaApp()
+        despachador = Despachador(
+            {'app': bandeja_notificaciones, 'push': SumideroPush(canal_notificaciones()),
+             'email': SumideroEmail()},
+            ventana=int(os.environ.get('NOTIF_VENTANA', 600)),
+            resync=int(os.environ.get('NOTIF_RESYNC', 30)),
         )
-        
-        # Enviar con SendGrid
-        sg = SendGridAPIClient(sg_api_key)
-        response = sg.send(message)
-        print(f'Email enviado a {to_email}, status: {response.status_code}')
-        
     except Exception as e:
-        print(f'Error al enviar email: {str(e)}')
+        print(f'⚠️ Despachador de notificaciones no disponible: {e}')
+        despachador = None
+        bandeja_notificaciones = None
+        canal_notificaciones = None
+
+
+@app.before_request
+def _iniciar_trabajos_fondo():
+    if despachador is not None and not despachador.activo:
+        despachador.iniciar()
+    repartidor_correo()
 
 
 @app.route('/api/notifications/due')
@@ -1297,6 +1305,8 @@ def api_notifications_due():
     if not usuario:
         return jsonify([])
     try:
+        if despachador is not None and despachador.activo:
+            return jsonify(bandeja_notificaciones.pendientes(usuario['id'], limit=10))
         if get_due_notifications is None:
             return jsonify([])
         rows = get_due_notifications(limit=10, user_id=usuario['id'])
@@ -1316,16 +1326,70 @@ def api_notifications_due():
         return jsonify([])
 
 
+def _evento_sse(notificacion):
+    return 'data: ' + json.dumps(notificacion, default=str) + '\n\n'
+
+
+@app.route('/api/notifications/stream')
+def api_notifications_stream():
+    # Server-Sent Events: empuja cada recordatorio al vencer. 204 o 503 hacen
+    # que el navegador vuelva al sondeo de /api/notifications/due.
+    if 'user_email' not in session:
+        return '', 401
+    usuario = get_user_by_email(session['user_email'])
+    if not usuario:
+        return '', 401
+    if despachador is None or not despachador.activo:
+        return '', 204
+    canal = canal_notificaciones()
+    if canal.lleno():
+        return '', 503
+    user_id = usuario['id']
+    # Las ya vencidas que el usuario aún no vio (el cliente descarta repetidas);
+    # se leen aquí porque la bandeja puede tener que consultar MySQL
+    ya_vencidas = bandeja_notificaciones.pendientes(user_id, limit=10)
+
+    # Sin stream_with_context: la conexión MySQL de la petición vuelve al pool
+    # antes de empezar a emitir y el stream no toca la base de datos.
+    def eventos():
+        with canal.suscribir(user_id) as sus:
+            yield 'retry: 5000\n\n'
+            for n in ya_vencidas:
+                yield _evento_sse(n)
+            while True:
+                n = sus.esperar(timeout=15)
+                yield _evento_sse(n) if n is not None else ': ping\n\n'
+
+    return Response(eventos(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @app.route('/api/notifications/mark_delivered', methods=['POST'])
 def api_notifications_mark_delivered():
+    # Acepta {'id': n} o, con los acuses agrupados del navegador, {'ids': [...]}
+    # Solo el dueño puede marcar sus notificaciones
+    user_id = session.get('usuario_id')
+    if not user_id:
+        return jsonify({'ok': False}), 401
     data = request.get_json(silent=True) or {}
-    nid = data.get('id')
-    if not nid:
+    ids = data.get('ids') or ([data['id']] if data.get('id') else [])
+    try:
+        ids = [int(nid) for nid in ids][:100]
+    except (TypeError, ValueError):
+        ids = []
+    if not ids:
         return jsonify({'ok': False}), 400
     try:
         if mark_delivered is None:
             return jsonify({'ok': False}), 501
-        mark_delivered(nid)
+        if len(ids) == 1 or mark_delivered_many is None:
+            for nid in ids:
+                mark_delivered(nid, user_id)
+        else:
+            mark_delivered_many(ids, user_id)
+        if bandeja_notificaciones is not None:
+            for nid in ids:
+                bandeja_notificaciones.confirmar(nid, user_id)
         return jsonify({'ok': True})
     except Exception as e:
         print('mark_delivered error', e)
@@ -1395,8 +1459,8 @@ def login():
             flash('Correo inválido.', 'danger')
             return redirect(url_for('login'))
 
-        # 3. Verificar usuario
-        user = get_user_by_email(correo)
+        # 3. Verificar usuario (sin caché: la contraseña pudo cambiar en otro worker)
+        user = get_user_by_email(correo, fresh=True)
         if not user:
             flash('Usuario no encontrado.', 'danger')
             return redirect(url_for('login'))
@@ -1417,10 +1481,10 @@ def login():
             from datetime import date
             today = date.today()
             with conn2.cursor() as cur2:
-                marker = "[LOGIN_REMINDER]"
+                # Rango sobre la clave única (user_id, rutina_id, kind, fecha_programada)
                 cur2.execute(
-                    "SELECT 1 FROM user_notifications WHERE user_id = (SELECT id FROM usuario WHERE correo = %s) AND message LIKE %s AND DATE(fecha_programada) = %s",
-                    (correo, f"%{marker}%", today)
+                    "SELECT 1 FROM user_notifications WHERE user_id = %s AND rutina_id IS NULL AND kind = 'login' AND fecha_programada >= %s AND fecha_programada < %s",
+                    (user['id'], today, today + timedelta(days=1))
                 )
                 already = cur2.fetchone()
 
@@ -1442,10 +1506,10 @@ def login():
                             FROM rutina r
                             JOIN rutina_item ri ON ri.id_rutina = r.id_rutina
                             WHERE r.id_usuario = (SELECT id FROM usuario WHERE correo = %s)
-                              AND FIND_IN_SET(%s, r.dias)
+                              AND (r.dias_mask & %s) <> 0
                             ORDER BY r.horario ASC
                             """,
-                            (correo, dia_actual)
+                            (correo, bit_dia(dia_actual))
                         )
                         items = cur3.fetchall()
                 except Exception:
@@ -1471,20 +1535,17 @@ def login():
                 else:
                     body = "Tienes rutinas en la app. Hoy no tienes items programados, pero puedes revisar y programar nuevas rutinas en FocusFit."
 
-                # enviar email (no bloquear si falla)
-                try:
-                    send_email(correo, 'Recordatorio diario - FocusFit', body)
-                except Exception as e:
-                    print('Error enviando login reminder:', e)
-
-                # registrar en user_notifications para evitar duplicados (fecha_programada = ahora)
+                # Recordatorio 'email_once' pendiente (fecha_programada = ahora): lo reclama,
+                # envía y reintenta el repartidor (procesar_recordatorios_email), así no se
+                # pierde si el proceso se reinicia o el transporte falla; la fila evita duplicados
                 try:
                     with conn2.cursor() as cur4:
                         cur4.execute(
-                            'INSERT INTO user_notifications (user_id, title, message, fecha_programada, tipo, fecha_envio, is_read) VALUES ((SELECT id FROM usuario WHERE correo = %s), %s, %s, %s, %s, %s, %s)',
-                            (correo, 'Recordatorio diario', f"[LOGIN_REMINDER] Recordatorio enviado al iniciar sesión", datetime.now(), 'email_once', datetime.now(), 1)
+                            'INSERT INTO user_notifications (user_id, title, message, fecha_programada, tipo, kind) VALUES (%s, %s, %s, %s, %s, %s)',
+                            (user['id'], 'Recordatorio diario - FocusFit', body, datetime.now(), 'email_once', 'login')
                         )
-                        conn2.commit()
+                    conn2.commit()
+                    al_confirmar(lambda: repartidor_correo().despertar())
                 except Exception as e:
                     print('Error registrando login reminder:', e)
         except Exception:
@@ -1716,8 +1777,8 @@ def lista_diaria():
     with conn.cursor(pymysql.cursors.DictCursor) as cur:
         cur.execute("""
             SELECT * FROM rutina
-            WHERE id_usuario = %s AND dias LIKE %s
-        """, (usuario['id'], f"%{dia_actual}%"))
+            WHERE id_usuario = %s AND (dias_mask & %s) <> 0
+        """, (usuario['id'], bit_dia(dia_actual)))
         rutinas = cur.fetchall()
 
         for r in rutinas:
@@ -1735,70 +1796,6 @@ def lista_diaria():
     return render_template('lista_diaria.html', rutinas=rutinas, dia_actual=dia_actual)
 
 
-def generar_items_diarios(id_usuario, fecha=None):
-    """
-    Genera automáticamente los registros en item_diario para las rutinas del día.
-    Esta función se ejecuta automáticamente cuando un usuario accede a su lista diaria.
-    """
-    if fecha is None:
-        fecha = datetime.today().date()
-    
-    # Obtener día de la semana en español
-    dias_traduccion = {
-        'Monday': 'Lunes', 'Tuesday': 'Martes', 'Wednesday': 'Miércoles',
-        'Thursday': 'Jueves', 'Friday': 'Viernes', 'Saturday': 'Sábado', 'Sunday': 'Domingo'
-    }
-    dia_actual = dias_traduccion[fecha.strftime('%A')]
-    
-    try:
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            # Buscar rutinas activas para el día actual
-            cur.execute("""
-                SELECT r.id_rutina, r.nombre, r.tipo
-                FROM rutina r
-                WHERE r.id_usuario = %s AND r.dias LIKE %s
-            """, (id_usuario, f"%{dia_actual}%"))
-            rutinas_del_dia = cur.fetchall()
-            
-            items_creados = 0
-            
-            for rutina in rutinas_del_dia:
-                # Obtener items de esta rutina
-                cur.execute("""
-                    SELECT id_item FROM rutina_item 
-                    WHERE id_rutina = %s
-                """, (rutina['id_rutina'],))
-                items_rutina = cur.fetchall()
-                
-                for item in items_rutina:
-                    # Verificar si ya existe un registro para este item en esta fecha
-                    cur.execute("""
-                        SELECT id FROM item_diario 
-                        WHERE id_item = %s AND id_usuario = %s AND fecha = %s
-                    """, (item['id_item'], id_usuario, fecha))
-                    
-                    if not cur.fetchone():
-                        # Crear registro si no existe
-                        cur.execute("""
-                            INSERT INTO item_diario (id_item, id_usuario, fecha, completado)
-                            VALUES (%s, %s, %s, FALSE)
-                        """, (item['id_item'], id_usuario, fecha))
-                        items_creados += 1
-            
-            conn.commit()
-            conn.close()
-            
-            if items_creados > 0:
-                print(f"✅ Generados {items_creados} items diarios para usuario {id_usuario} en {fecha}")
-            
-            return items_creados
-            
-    except Exception as e:
-        print(f"❌ Error generando items diarios: {e}")
-        return 0
-
-
 @app.route('/api/marcar_completado/<int:id_item>', methods=['POST'])
 def api_marcar_completado(id_item):
     if 'user_email' not in session:
@@ -1817,7 +1814,7 @@ def api_marcar_completado(id_item):
             with conn.cursor() as cur:
                 # Verificar que el item pertenece al usuario
                 cur.execute("""
-                    SELECT r.id_usuario
+                    SELECT r.id_usuario, r.dias_mask, ri.tiempo
                     FROM rutina_item ri
                     JOIN rutina r ON ri.id_rutina = r.id_rutina
                     WHERE ri.id_item = %s
@@ -1828,66 +1825,47 @@ def api_marcar_completado(id_item):
                 if not result or result['id_usuario'] != id_usuario:
                     return jsonify({'error': 'Item no encontrado'}), 404
 
-                # Verificar si ya existe un registro para hoy
+                # Verificar si ya existe un registro para hoy. FOR UPDATE: la fila queda
+                # bloqueada hasta el commit de la petición y un segundo clic simultáneo
+                # lee el estado ya cambiado (si no, ambos aplicarían el mismo +1 al contador)
                 cur.execute("""
                     SELECT completado FROM item_diario
                     WHERE id_usuario = %s AND id_item = %s AND fecha = %s
+                    FOR UPDATE
                 """, (id_usuario, id_item, hoy))
                 log_existente = cur.fetchone()
 
+                completado_antes = bool(log_existente['completado']) if log_existente else False
                 if log_existente:
-                    nuevo_estado = not bool(log_existente['completado'])
+                    nuevo_estado = not completado_antes
                     cur.execute("""
                         UPDATE item_diario
-                        SET completado = %s
+                        SET completado = %s, completado_en = IF(%s, NOW(), NULL)
                         WHERE id_usuario = %s AND id_item = %s AND fecha = %s
-                    """, (nuevo_estado, id_usuario, id_item, hoy))
+                    """, (nuevo_estado, nuevo_estado, id_usuario, id_item, hoy))
                 else:
                     cur.execute("""
-                        INSERT INTO item_diario (id_usuario, id_item, fecha, completado)
-                        VALUES (%s, %s, %s, %s)
+                        INSERT INTO item_diario (id_usuario, id_item, fecha, completado, completado_en)
+                        VALUES (%s, %s, %s, %s, NOW())
                     """, (id_usuario, id_item, hoy, True))
                     nuevo_estado = True
 
                 conn.commit()
 
-                # Evaluar racha FORZANDO RECÁLCULO (para marcar/desmarcar)
+                # Evento de racha: contador del día ±1 y transición O(1)
                 try:
-                    estado_racha = evaluar_racha_forzar_recalculo(id_usuario)
+                    estado_racha = registrar_evento_item(id_usuario, id_item, completado_antes, nuevo_estado, result['dias_mask'], tiempo=result['tiempo'])
                     streak_days = estado_racha['racha_actual']
                     racha_activa_api = estado_racha['racha_activa']
                 except Exception:
+                    estado_racha = {}
                     streak_days = 0
                     racha_activa_api = False
 
-                # Calcular porcentaje de cumplimiento de hoy
-                dias_semana = {
-                    'Monday': 'Lunes', 'Tuesday': 'Martes', 'Wednesday': 'Miércoles',
-                    'Thursday': 'Jueves', 'Friday': 'Viernes', 'Saturday': 'Sábado', 'Sunday': 'Domingo'
-                }
-                dia_actual = dias_semana[datetime.today().strftime('%A')]
-                
-                # Calcular total de items programados para hoy
-                cur.execute("""
-                    SELECT COUNT(*) AS total
-                    FROM rutina r
-                    JOIN rutina_item ri ON r.id_rutina = ri.id_rutina
-                    WHERE r.id_usuario = %s AND FIND_IN_SET(%s, r.dias)
-                """, (id_usuario, dia_actual))
-                total = cur.fetchone()['total'] or 0
-
-                cumplimiento_porcentaje = 0
-                if total > 0:
-                    # Calcular completados hoy
-                    cur.execute("""
-                        SELECT COUNT(*) AS completados
-                        FROM rutina r
-                        JOIN rutina_item ri ON r.id_rutina = ri.id_rutina
-                        LEFT JOIN item_diario id ON ri.id_item = id.id_item AND id.fecha = %s AND id.id_usuario = %s
-                        WHERE r.id_usuario = %s AND FIND_IN_SET(%s, r.dias) AND COALESCE(id.completado, FALSE) = 1
-                    """, (hoy, id_usuario, id_usuario, dia_actual))
-                    completados = cur.fetchone()['completados'] or 0
-                    cumplimiento_porcentaje = round((completados / total) * 100)
+                # Cumplimiento de hoy desde el contador del día (sin consultas extra)
+                total = estado_racha.get('total_tareas', 0) or 0
+                completados = estado_racha.get('tareas_completadas', 0) or 0
+                cumplimiento_porcentaje = round((completados / total) * 100) if total > 0 else 0
 
                 return jsonify({
                     'success': True,
@@ -1930,7 +1908,7 @@ def marcar_item():
             with conn.cursor() as cur:
                 # Verificar que el item pertenece al usuario
                 cur.execute("""
-                    SELECT r.id_usuario
+                    SELECT r.id_usuario, r.dias_mask, ri.tiempo
                     FROM rutina_item ri
                     JOIN rutina r ON ri.id_rutina = r.id_rutina
                     WHERE ri.id_item = %s
@@ -1940,30 +1918,34 @@ def marcar_item():
                 if not result or result['id_usuario'] != id_usuario:
                     return jsonify({'success': False, 'message': 'Item no encontrado'}), 404
 
-                # Verificar si ya existe un registro para hoy
+                # Verificar si ya existe un registro para hoy. FOR UPDATE: la fila queda
+                # bloqueada hasta el commit de la petición y un segundo clic simultáneo
+                # lee el estado ya cambiado (si no, ambos aplicarían el mismo +1 al contador)
                 cur.execute("""
                     SELECT completado FROM item_diario
                     WHERE id_usuario = %s AND id_item = %s AND fecha = %s
+                    FOR UPDATE
                 """, (id_usuario, id_item, hoy))
                 log_existente = cur.fetchone()
 
+                completado_antes = bool(log_existente['completado']) if log_existente else False
                 if log_existente:
                     cur.execute("""
                         UPDATE item_diario
-                        SET completado = %s
+                        SET completado = %s, completado_en = IF(%s, NOW(), NULL)
                         WHERE id_usuario = %s AND id_item = %s AND fecha = %s
-                    """, (completado, id_usuario, id_item, hoy))
+                    """, (completado, completado, id_usuario, id_item, hoy))
                 else:
                     cur.execute("""
-                        INSERT INTO item_diario (id_usuario, id_item, fecha, completado)
-                        VALUES (%s, %s, %s, %s)
-                    """, (id_usuario, id_item, hoy, completado))
+                        INSERT INTO item_diario (id_usuario, id_item, fecha, completado, completado_en)
+                        VALUES (%s, %s, %s, %s, IF(%s, NOW(), NULL))
+                    """, (id_usuario, id_item, hoy, completado, completado))
 
                 conn.commit()
 
-                # Evaluar racha FORZANDO RECÁLCULO
+                # Evento de racha: contador del día ±1 y transición O(1)
                 try:
-                    estado_racha = evaluar_racha_forzar_recalculo(id_usuario)
+                    estado_racha = registrar_evento_item(id_usuario, id_item, completado_antes, completado, result['dias_mask'], tiempo=result['tiempo'])
                     streak_days = estado_racha['racha_actual']
                     racha_activa_api = estado_racha['racha_activa']
                 except Exception:
@@ -2012,74 +1994,10 @@ def api_estadisticas_actuales():
             'Thursday': 'Jueves', 'Friday': 'Viernes', 'Saturday': 'Sábado', 'Sunday': 'Domingo'
         }
         dia_actual = dias_semana[datetime.today().strftime('%A')]
-        hoy = datetime.today().strftime('%Y-%m-%d')
-        
-        conn = get_db_connection()
-        cumplimiento_porcentaje = 0
-        progreso_semanal = []
-        
-        try:
-            with conn.cursor() as cur:
-                # Calcular cumplimiento de hoy
-                cur.execute("""
-                    SELECT COUNT(*) AS total
-                    FROM rutina r
-                    JOIN rutina_item ri ON r.id_rutina = ri.id_rutina
-                    WHERE r.id_usuario = %s AND FIND_IN_SET(%s, r.dias)
-                """, (id_usuario, dia_actual))
-                total = cur.fetchone()['total'] or 0
-
-                if total > 0:
-                    cur.execute("""
-                        SELECT COUNT(*) AS completados
-                        FROM rutina r
-                        JOIN rutina_item ri ON r.id_rutina = ri.id_rutina
-                        LEFT JOIN item_diario id ON ri.id_item = id.id_item AND id.fecha = %s AND id.id_usuario = %s
-                        WHERE r.id_usuario = %s AND FIND_IN_SET(%s, r.dias) AND COALESCE(id.completado, FALSE) = 1
-                    """, (hoy, id_usuario, id_usuario, dia_actual))
-                    completados = cur.fetchone()['completados'] or 0
-                    cumplimiento_porcentaje = round((completados / total) * 100)
-
-                # Calcular progreso semanal
-                dias_semana_ordenados = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
-                hoy_dt = datetime.today()
-                
-                for i, dia in enumerate(dias_semana_ordenados):
-                    # Calcular la fecha correspondiente al día de la semana
-                    dias_desde_lunes = i
-                    lunes_esta_semana = hoy_dt - timedelta(days=hoy_dt.weekday())
-                    fecha_dia = lunes_esta_semana + timedelta(days=dias_desde_lunes)
-                    fecha_str = fecha_dia.strftime('%Y-%m-%d')
-                    
-                    # Total de items para este día
-                    cur.execute("""
-                        SELECT COUNT(*) AS total
-                        FROM rutina r
-                        JOIN rutina_item ri ON r.id_rutina = ri.id_rutina
-                        WHERE r.id_usuario = %s AND FIND_IN_SET(%s, r.dias)
-                    """, (id_usuario, dia))
-                    total_dia = cur.fetchone()['total'] or 0
-                    
-                    porcentaje_dia = 0
-                    if total_dia > 0:
-                        # Completados para este día
-                        cur.execute("""
-                            SELECT COUNT(*) AS completados
-                            FROM rutina r
-                            JOIN rutina_item ri ON r.id_rutina = ri.id_rutina
-                            LEFT JOIN item_diario id ON ri.id_item = id.id_item AND id.fecha = %s AND id.id_usuario = %s
-                            WHERE r.id_usuario = %s AND FIND_IN_SET(%s, r.dias) AND COALESCE(id.completado, FALSE) = 1
-                        """, (fecha_str, id_usuario, id_usuario, dia))
-                        completados_dia = cur.fetchone()['completados'] or 0
-                        porcentaje_dia = round((completados_dia / total_dia) * 100)
-                    
-                    progreso_semanal.append({
-                        'dia': dia[:3],  # Abreviatura del día
-                        'porcentaje': porcentaje_dia
-                    })
 
-        finally:
-            conn.close()
+        # Progreso semanal y cumplimiento de hoy salen de las mismas 2 consultas
+        progreso_semanal = calcular_progreso_semanal(id_usuario)
+        cumplimiento_porcentaje = progreso_semanal[DIAS_ORDEN.index(dia_actual)]['porcentaje']
 
         return jsonify({
             'success': True,
@@ -2114,57 +2032,13 @@ def api_progreso_semanal():
         dia_actual = dias_semana[datetime.today().strftime('%A')]
         hoy = datetime.today().date()
 
-        conn = get_db_connection()
-        try:
-            with conn.cursor(pymysql.cursors.DictCursor) as cur:
-                # Progreso semanal
-                dias_orden = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
-                progreso_semanal = []
-
-                for dia in dias_orden:
-                    hoy_dt = datetime.today()
-                    dias_desde_lunes = hoy_dt.weekday()  # 0=Lunes
-                    indice_dia = dias_orden.index(dia)
-                    fecha_dia = (hoy_dt - timedelta(days=dias_desde_lunes - indice_dia)).date()
+        progreso_semanal = calcular_progreso_semanal(id_usuario, hoy, detalle=True)
 
-                    # Total de tareas para este día
-                    cur.execute("""
-                        SELECT COUNT(*) AS total
-                        FROM rutina r
-                        JOIN rutina_item ri ON r.id_rutina = ri.id_rutina
-                        WHERE r.id_usuario = %s AND FIND_IN_SET(%s, r.dias)
-                    """, (id_usuario, dia))
-                    total = cur.fetchone()['total'] or 0
-
-                    if total == 0:
-                        porcentaje = 0
-                    else:
-                        # Tareas completadas para este día
-                        cur.execute("""
-                            SELECT COUNT(*) AS completados
-                            FROM rutina r
-                            JOIN rutina_item ri ON r.id_rutina = ri.id_rutina
-                            LEFT JOIN item_diario id ON ri.id_item = id.id_item AND id.fecha = %s AND id.id_usuario = %s
-                            WHERE r.id_usuario = %s AND FIND_IN_SET(%s, r.dias) AND COALESCE(id.completado, FALSE) = 1
-                        """, (fecha_dia, id_usuario, id_usuario, dia))
-                        completados = cur.fetchone()['completados'] or 0
-                        porcentaje = round((completados / total) * 100)
-
-                    progreso_semanal.append({
-                        'dia': dia[:3], 
-                        'porcentaje': porcentaje,
-                        'total_tareas': total,
-                        'tareas_completadas': completados if total > 0 else 0
-                    })
-
-                return jsonify({
-                    'success': True,
-                    'progreso_semanal': progreso_semanal,
-                    'dia_actual': dia_actual
-                })
-
-        finally:
-            conn.close()
+        return jsonify({
+            'success': True,
+            'progreso_semanal': progreso_semanal,
+            'dia_actual': dia_actual
+        })
 
     except Exception as e:
         import traceback
@@ -2173,6 +2047,31 @@ def api_progreso_semanal():
         return jsonify({'error': 'Error interno'}), 500
 
 
+@app.route('/api/rachas/historial')
+def api_historial_rachas():
+    """Timeline de rachas (streak_run) y mapa de calor de un rango: ?desde=YYYY-MM-DD&hasta=YYYY-MM-DD"""
+    if 'user_email' not in session:
+        return jsonify({'error': 'No autorizado'}), 401
+
+    usuario = get_user_by_email(session['user_email'])
+    if not usuario:
+        return jsonify({'error': 'Sesión inválida'}), 401
+
+    try:
+        hasta = datetime.strptime(request.args['hasta'], '%Y-%m-%d').date() if request.args.get('hasta') else datetime.today().date()
+        desde = datetime.strptime(request.args['desde'], '%Y-%m-%d').date() if request.args.get('desde') else hasta - timedelta(days=364)
+    except ValueError:
+        return jsonify({'error': 'Fechas con formato YYYY-MM-DD'}), 400
+    if desde > hasta:
+        return jsonify({'error': 'desde no puede ser posterior a hasta'}), 400
+
+    try:
+        return jsonify(dict(obtener_historial_rachas(usuario['id'], desde, hasta), success=True))
+    except Exception as e:
+        print(f"❌ Error en api_historial_rachas: {e}")
+        return jsonify({'error': 'Error interno'}), 500
+
+
 @app.route('/estadisticas')
 def ver_estadisticas():
     print(f"🔍 DEBUG - Estadísticas: sesión = {dict(session)}")
@@ -2248,129 +2147,58 @@ def progreso():
     generar_items_diarios(id_usuario)
     
     try:
-        conn = get_db_connection()
-        with conn.cursor(pymysql.cursors.DictCursor) as cur:
-            
-            # Calcular progreso de la semana actual (lunes a domingo)
-            progreso_dias = []
-            
-            # Obtener el lunes de esta semana
-            dias_desde_lunes = hoy.weekday()  # 0 = lunes, 6 = domingo
-            inicio_semana = hoy - timedelta(days=dias_desde_lunes)
-            
-            # Generar los 7 días de la semana actual
-            for i in range(7):
-                fecha_dia = inicio_semana + timedelta(days=i)
-                
-                # Nombre del día
-                dias_nombres = {
-                    'Monday': 'Lunes', 'Tuesday': 'Martes', 'Wednesday': 'Miércoles',
-                    'Thursday': 'Jueves', 'Friday': 'Viernes', 'Saturday': 'Sábado', 'Sunday': 'Domingo'
-                }
-                nombre_dia = dias_nombres[fecha_dia.strftime('%A')]
-                
-                # Si es día pasado o presente, usar item_diario
-                if fecha_dia <= hoy:
-                    # Obtener tareas totales del día
-                    cur.execute("""
-                        SELECT COUNT(*) as total_tareas
-                        FROM item_diario 
-                        WHERE id_usuario = %s AND fecha = %s
-                    """, (id_usuario, fecha_dia))
-                    
-                    total_result = cur.fetchone()
-                    total_tareas = total_result['total_tareas'] if total_result else 0
-                    
-                    # Obtener tareas completadas del día
-                    cur.execute("""
-                        SELECT COUNT(*) as tareas_completadas
-                        FROM item_diario 
-                        WHERE id_usuario = %s AND fecha = %s AND completado = TRUE
-                    """, (id_usuario, fecha_dia))
-                    
-                    completadas_result = cur.fetchone()
-                    tareas_completadas = completadas_result['tareas_completadas'] if completadas_result else 0
-                    
-                else:
-                    # Si es día futuro, calcular basado en rutinas programadas
-                    # Buscar rutinas que tienen este día programado
-                    cur.execute("""
-                        SELECT COUNT(ri.id_item) as total_tareas
-                        FROM rutina r
-                        JOIN rutina_item ri ON r.id_rutina = ri.id_rutina
-                        WHERE r.id_usuario = %s AND r.dias LIKE %s
-                    """, (id_usuario, f"%{nombre_dia}%"))
-                    
-                    total_result = cur.fetchone()
-                    total_tareas = total_result['total_tareas'] if total_result else 0
-                    tareas_completadas = 0  # Día futuro, nada completado aún
-                
-                # Calcular porcentaje
-                if total_tareas > 0:
-                    porcentaje = round((tareas_completadas / total_tareas) * 100)
-                else:
-                    porcentaje = 0
-                
-                progreso_dias.append({
-                    'fecha': fecha_dia.strftime('%d/%m'),
-                    'fecha_completa': fecha_dia.strftime('%Y-%m-%d'),
-                    'nombre_dia': nombre_dia,
-                    'total_tareas': total_tareas,
-                    'tareas_completadas': tareas_completadas,
-                    'porcentaje': porcentaje,
-                    'es_hoy': fecha_dia == hoy,
-                    'es_futuro': fecha_dia > hoy
-                })
-            
-            # Los días ya están en orden correcto (lunes a domingo)
-            
-            # Calcular progreso promedio de la semana
-            porcentajes_validos = [dia['porcentaje'] for dia in progreso_dias if dia['total_tareas'] > 0]
-            promedio_semana = round(sum(porcentajes_validos) / len(porcentajes_validos)) if porcentajes_validos else 0
-            
-            # Progreso de hoy
-            progreso_hoy = next((dia for dia in progreso_dias if dia['es_hoy']), None)
-            
-            # Calcular estadísticas adicionales
-            mejor_dia_datos = max(progreso_dias, key=lambda x: x['porcentaje']) if progreso_dias else {'porcentaje': 0, 'nombre_dia': 'N/A'}
-            dias_100 = len([dia for dia in progreso_dias if dia['porcentaje'] == 100])
-            
-            # Calcular días consecutivos (desde hoy hacia atrás)
-            dias_consecutivos = 0
-            for dia in reversed(progreso_dias):
-                if dia['es_futuro']:
-                    continue
-                if dia['porcentaje'] == 100:
-                    dias_consecutivos += 1
-                else:
-                    break
-            
-            estadisticas_extra = {
-                'mejor_dia': mejor_dia_datos,
-                'dias_100': dias_100,
-                'dias_consecutivos': dias_consecutivos
-            }
-            
-            # Datos para la gráfica de columnas (solo tareas completadas)
-            grafica_datos = []
-            max_completadas = 0
-            for dia in progreso_dias:
-                completadas = dia['tareas_completadas']
-                if completadas > max_completadas:
-                    max_completadas = completadas
-                
-                grafica_datos.append({
-                    'dia': dia['nombre_dia'][:3],  # Lun, Mar, Mie, etc.
-                    'completadas': completadas,
-                    'fecha': dia['fecha'],
-                    'es_hoy': dia['es_hoy'],
-                    'es_futuro': dia['es_futuro']
-                })
+        # Progreso de la semana actual (lunes a domingo) en 2 consultas
+        dias_desde_lunes = hoy.weekday()  # 0 = lunes, 6 = domingo
+        inicio_semana = hoy - timedelta(days=dias_desde_lunes)
+        progreso_dias = calcular_progreso_dias(id_usuario, inicio_semana, hoy)
+        
+        # Los días ya están en orden correcto (lunes a domingo)
+        
+        # Calcular progreso promedio de la semana
+        porcentajes_validos = [dia['porcentaje'] for dia in progreso_dias if dia['total_tareas'] > 0]
+        promedio_semana = round(sum(porcentajes_validos) / len(porcentajes_validos)) if porcentajes_validos else 0
+        
+        # Progreso de hoy
+        progreso_hoy = next((dia for dia in progreso_dias if dia['es_hoy']), None)
+        
+        # Calcular estadísticas adicionales
+        mejor_dia_datos = max(progreso_dias, key=lambda x: x['porcentaje']) if progreso_dias else {'porcentaje': 0, 'nombre_dia': 'N/A'}
+        dias_100 = len([dia for dia in progreso_dias if dia['porcentaje'] == 100])
+        
+        # Calcular días consecutivos (desde hoy hacia atrás)
+        dias_consecutivos = 0
+        for dia in reversed(progreso_dias):
+            if dia['es_futuro']:
+                continue
+            if dia['porcentaje'] == 100:
+                dias_consecutivos += 1
+            else:
+                break
+        
+        estadisticas_extra = {
+            'mejor_dia': mejor_dia_datos,
+            'dias_100': dias_100,
+            'dias_consecutivos': dias_consecutivos
+        }
+        
+        # Datos para la gráfica de columnas (solo tareas completadas)
+        grafica_datos = []
+        max_completadas = 0
+        for dia in progreso_dias:
+            completadas = dia['tareas_completadas']
+            if completadas > max_completadas:
+                max_completadas = completadas
             
-            # Calcular altura máxima para normalizar las columnas (mínimo 5 para que se vea bien)
-            altura_maxima = max(max_completadas, 5) if max_completadas > 0 else 5
+            grafica_datos.append({
+                'dia': dia['nombre_dia'][:3],  # Lun, Mar, Mie, etc.
+                'completadas': completadas,
+                'fecha': dia['fecha'],
+                'es_hoy': dia['es_hoy'],
+                'es_futuro': dia['es_futuro']
+            })
         
-        conn.close()
+        # Calcular altura máxima para normalizar las columnas (mínimo 5 para que se vea bien)
+        altura_maxima = max(max_completadas, 5) if max_completadas > 0 else 5
         
     except Exception as e:
         print(f"⚠️ Error en /progreso: {type(e).__name__}: {str(e)}")
@@ -2461,155 +2289,112 @@ def registros_actividades():
     generar_items_diarios(id_usuario)
     
     try:
-        conn = get_db_connection()
-        with conn.cursor(pymysql.cursors.DictCursor) as cur:
-            
-            # Calcular progreso de los 7 días de la semana seleccionada
-            progreso_dias = []
-            total_tareas_semana = 0
-            tareas_completadas_semana = 0
-            dias_con_actividad = 0
-            dias_perfectos = 0
-            mejor_dia = {'porcentaje': 0, 'nombre': ''}
-            racha_actual = 0
-            racha_maxima = 0
+        # Calcular progreso de los 7 días de la semana seleccionada
+        progreso_dias = []
+        total_tareas_semana = 0
+        tareas_completadas_semana = 0
+        dias_con_actividad = 0
+        dias_perfectos = 0
+        mejor_dia = {'porcentaje': 0, 'nombre': ''}
+        racha_actual = 0
+        racha_maxima = 0
+        
+        # Los 7 días de la semana seleccionada en 2 consultas
+        dias_calculados = calcular_progreso_dias(id_usuario, inicio_semana_seleccionada, hoy)
+        for i, dia_calculado in enumerate(dias_calculados):
+            fecha_dia = inicio_semana_seleccionada + timedelta(days=i)
+            nombre_dia = dia_calculado['nombre_dia']
+            total_tareas = dia_calculado['total_tareas']
+            tareas_completadas = dia_calculado['tareas_completadas']
             
-            for i in range(7):
-                fecha_dia = inicio_semana_seleccionada + timedelta(days=i)
-                
-                # Nombre del día
-                dias_nombres = {
-                    'Monday': 'Lunes', 'Tuesday': 'Martes', 'Wednesday': 'Miércoles',
-                    'Thursday': 'Jueves', 'Friday': 'Viernes', 'Saturday': 'Sábado', 'Sunday': 'Domingo'
-                }
-                nombre_dia = dias_nombres[fecha_dia.strftime('%A')]
-                
-                # Si es día pasado o presente, usar item_diario
-                if fecha_dia <= hoy:
-                    # Obtener tareas totales del día
-                    cur.execute("""
-                        SELECT COUNT(*) as total_tareas
-                        FROM item_diario 
-                        WHERE id_usuario = %s AND fecha = %s
-                    """, (id_usuario, fecha_dia))
-                    
-                    total_result = cur.fetchone()
-                    total_tareas = total_result['total_tareas'] if total_result else 0
-                    
-                    # Obtener tareas completadas del día
-                    cur.execute("""
-                        SELECT COUNT(*) as tareas_completadas
-                        FROM item_diario 
-                        WHERE id_usuario = %s AND fecha = %s AND completado = TRUE
-                    """, (id_usuario, fecha_dia))
-                    
-                    completadas_result = cur.fetchone()
-                    tareas_completadas = completadas_result['tareas_completadas'] if completadas_result else 0
-                    
-                else:
-                    # Si es día futuro, calcular basado en rutinas programadas
-                    # Buscar rutinas que tienen este día programado
-                    cur.execute("""
-                        SELECT COUNT(ri.id_item) as total_tareas
-                        FROM rutina r
-                        JOIN rutina_item ri ON r.id_rutina = ri.id_rutina
-                        WHERE r.id_usuario = %s AND r.dias LIKE %s
-                    """, (id_usuario, f"%{nombre_dia}%"))
-                    
-                    total_result = cur.fetchone()
-                    total_tareas = total_result['total_tareas'] if total_result else 0
-                    tareas_completadas = 0  # Día futuro, nada completado aún
-                
-                # Calcular porcentaje
-                if total_tareas > 0:
-                    porcentaje = round((tareas_completadas / total_tareas) * 100)
-                    # Solo contar para estadísticas si no es día futuro
-                    if fecha_dia <= hoy:
-                        dias_con_actividad += 1
-                        if porcentaje == 100:
-                            dias_perfectos += 1
-                            racha_actual += 1
-                            racha_maxima = max(racha_maxima, racha_actual)
-                        else:
-                            racha_actual = 0
-                else:
-                    porcentaje = 0
-                
-                # Estadísticas semanales (solo días pasados/presente)
+            # Calcular porcentaje
+            if total_tareas > 0:
+                porcentaje = round((tareas_completadas / total_tareas) * 100)
+                # Solo contar para estadísticas si no es día futuro
                 if fecha_dia <= hoy:
-                    total_tareas_semana += total_tareas
-                    tareas_completadas_semana += tareas_completadas
-                
-                # Mejor día (solo días pasados/presente)
-                if fecha_dia <= hoy and porcentaje > mejor_dia['porcentaje']:
-                    mejor_dia['porcentaje'] = porcentaje
-                    mejor_dia['nombre'] = fecha_dia.strftime('%A')
-                
-                progreso_dias.append({
-                    'fecha': fecha_dia.strftime('%d/%m'),
-                    'fecha_completa': fecha_dia.strftime('%Y-%m-%d'),
-                    'nombre_dia': nombre_dia,
-                    'total_tareas': total_tareas,
-                    'tareas_completadas': tareas_completadas,
-                    'porcentaje': porcentaje,
-                    'es_hoy': fecha_dia == hoy,
-                    'es_futuro': fecha_dia > hoy
-                })
-            
-            # Calcular porcentaje semanal
-            if total_tareas_semana > 0:
-                porcentaje_semanal = round((tareas_completadas_semana / total_tareas_semana) * 100)
+                    dias_con_actividad += 1
+                    if porcentaje == 100:
+                        dias_perfectos += 1
+                        racha_actual += 1
+                        racha_maxima = max(racha_maxima, racha_actual)
+                    else:
+                        racha_actual = 0
             else:
-                porcentaje_semanal = 0
+                porcentaje = 0
             
-            # Calcular promedio diario (solo días no futuros con tareas)
-            porcentajes_validos = [dia['porcentaje'] for dia in progreso_dias if dia['total_tareas'] > 0 and not dia['es_futuro']]
-            promedio_diario = round(sum(porcentajes_validos) / len(porcentajes_validos)) if porcentajes_validos else 0
+            # Estadísticas semanales (solo días pasados/presente)
+            if fecha_dia <= hoy:
+                total_tareas_semana += total_tareas
+                tareas_completadas_semana += tareas_completadas
             
-            # Traducir nombre del mejor día
-            dias_nombres_es = {
-                'Monday': 'Lunes', 'Tuesday': 'Martes', 'Wednesday': 'Miércoles',
-                'Thursday': 'Jueves', 'Friday': 'Viernes', 'Saturday': 'Sábado', 'Sunday': 'Domingo'
-            }
-            mejor_dia['nombre'] = dias_nombres_es.get(mejor_dia['nombre'], mejor_dia['nombre'])
+            # Mejor día (solo días pasados/presente)
+            if fecha_dia <= hoy and porcentaje > mejor_dia['porcentaje']:
+                mejor_dia['porcentaje'] = porcentaje
+                mejor_dia['nombre'] = fecha_dia.strftime('%A')
             
-            # Información de la semana actual
-            semana_actual = {
-                'offset': semana_offset,
-                'max_offset': max_offset,
-                'es_actual': semana_offset == 0,
-                'fecha_inicio': inicio_semana_seleccionada.strftime('%d/%m/%Y'),
-                'fecha_fin': fin_semana_seleccionada.strftime('%d/%m/%Y'),
-                'total_tareas': total_tareas_semana,
-                'tareas_completadas': tareas_completadas_semana,
-                'porcentaje_semanal': porcentaje_semanal,
-                'dias_con_actividad': dias_con_actividad,
-                'dias_perfectos': dias_perfectos,
-                'mejor_dia': mejor_dia,
-                'racha_dias': racha_maxima,
-                'promedio_diario': promedio_diario
-            }
-            
-            # Datos para la gráfica de columnas (solo tareas completadas)
-            grafica_datos = []
-            max_completadas = 0
-            for dia in progreso_dias:
-                completadas = dia['tareas_completadas']
-                if completadas > max_completadas:
-                    max_completadas = completadas
-                
-                grafica_datos.append({
-                    'dia': dia['nombre_dia'][:3],  # Lun, Mar, Mie, etc.
-                    'completadas': completadas,
-                    'fecha': dia['fecha'],
-                    'es_hoy': dia['es_hoy'],
-                    'es_futuro': False  # En registros históricos no hay días futuros
-                })
+            progreso_dias.append({
+                'fecha': fecha_dia.strftime('%d/%m'),
+                'fecha_completa': fecha_dia.strftime('%Y-%m-%d'),
+                'nombre_dia': nombre_dia,
+                'total_tareas': total_tareas,
+                'tareas_completadas': tareas_completadas,
+                'porcentaje': porcentaje,
+                'es_hoy': fecha_dia == hoy,
+                'es_futuro': fecha_dia > hoy
+            })
+        
+        # Calcular porcentaje semanal
+        if total_tareas_semana > 0:
+            porcentaje_semanal = round((tareas_completadas_semana / total_tareas_semana) * 100)
+        else:
+            porcentaje_semanal = 0
+        
+        # Calcular promedio diario (solo días no futuros con tareas)
+        porcentajes_validos = [dia['porcentaje'] for dia in progreso_dias if dia['total_tareas'] > 0 and not dia['es_futuro']]
+        promedio_diario = round(sum(porcentajes_validos) / len(porcentajes_validos)) if porcentajes_validos else 0
+        
+        # Traducir nombre del mejor día
+        dias_nombres_es = {
+            'Monday': 'Lunes', 'Tuesday': 'Martes', 'Wednesday': 'Miércoles',
+            'Thursday': 'Jueves', 'Friday': 'Viernes', 'Saturday': 'Sábado', 'Sunday': 'Domingo'
+        }
+        mejor_dia['nombre'] = dias_nombres_es.get(mejor_dia['nombre'], mejor_dia['nombre'])
+        
+        # Información de la semana actual
+        semana_actual = {
+            'offset': semana_offset,
+            'max_offset': max_offset,
+            'es_actual': semana_offset == 0,
+            'fecha_inicio': inicio_semana_seleccionada.strftime('%d/%m/%Y'),
+            'fecha_fin': fin_semana_seleccionada.strftime('%d/%m/%Y'),
+            'total_tareas': total_tareas_semana,
+            'tareas_completadas': tareas_completadas_semana,
+            'porcentaje_semanal': porcentaje_semanal,
+            'dias_con_actividad': dias_con_actividad,
+            'dias_perfectos': dias_perfectos,
+            'mejor_dia': mejor_dia,
+            'racha_dias': racha_maxima,
+            'promedio_diario': promedio_diario
+        }
+        
+        # Datos para la gráfica de columnas (solo tareas completadas)
+        grafica_datos = []
+        max_completadas = 0
+        for dia in progreso_dias:
+            completadas = dia['tareas_completadas']
+            if completadas > max_completadas:
+                max_completadas = completadas
             
-            # Calcular altura máxima para normalizar las columnas (mínimo 5 para que se vea bien)
-            altura_maxima = max(max_completadas, 5) if max_completadas > 0 else 5
+            grafica_datos.append({
+                'dia': dia['nombre_dia'][:3],  # Lun, Mar, Mie, etc.
+                'completadas': completadas,
+                'fecha': dia['fecha'],
+                'es_hoy': dia['es_hoy'],
+                'es_futuro': False  # En registros históricos no hay días futuros
+            })
         
-        conn.close()
+        # Calcular altura máxima para normalizar las columnas (mínimo 5 para que se vea bien)
+        altura_maxima = max(max_completadas, 5) if max_completadas > 0 else 5
         
     except Exception as e:
         print("⚠️ Error en /registros_actividades:", e)
@@ -0,0 +1,143 @@
+"""
+Caché en memoria con caducidad (TTL) y tamaño máximo (LRU).
+
+Es local a cada proceso: sirve para lecturas caras que toleran unos segundos de
+retraso (paneles de admin, contadores). Uso:
+
+    from models.cache import TTLCache, cached
+
+    _stats = TTLCache(ttl=60, maxsize=32)
+    valor = _stats.get_or_set(('global', periodo), lambda: calcular(periodo))
+
+    @cached(ttl=60)
+    def get_admin_stats(): ...
+    get_admin_stats.cache.clear()
+
+Las cachés creadas con nombre publican aciertos, fallos y tamaño en /metrics.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from models import metrics
+
+_MISSING = object()
+
+_CACHES = {}  # nombre -> TTLCache (para /metrics)
+
+
+class TTLCache:
+    """Diccionario con caducidad por entrada y expulsión del menos usado."""
+
+    def __init__(self, ttl=60, maxsize=256, nombre=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if nombre:
+            _CACHES[nombre] = self
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires, value = entry
+                if expires > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def peek(self, key, default=None):
+        """Como get, pero sin contar acierto/fallo ni mover la entrada en el LRU."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > time.monotonic():
+                return entry[1]
+            return default
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key, factory, ttl=None):
+        """Devuelve el valor en caché o lo calcula con factory() y lo guarda."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value, ttl)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def update(self, key, **campos):
+        """Modifica en su sitio un valor dict cacheado (sin renovar su caducidad). No hace nada si no está."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and isinstance(entry[1], dict):
+                entry[1].update(campos)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data), 'maxsize': self.maxsize}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+@metrics.REGISTRY.add_collector
+def _cache_metrics():
+    if not _CACHES:
+        return []
+    lines = []
+    for sufijo, tipo, clave in (('hits_total', 'counter', 'hits'), ('misses_total', 'counter', 'misses'),
+                                ('size', 'gauge', 'size')):
+        name = f'focusfit_cache_{sufijo}'
+        lines += [f'# HELP {name} Caché en memoria ({clave})', f'# TYPE {name} {tipo}']
+        for nombre, cache in sorted(_CACHES.items()):
+            lines.append(f'{name}{{cache="{nombre}"}} {cache.stats()[clave]}')
+    return lines
+
+
+def cached(ttl=60, maxsize=128, guardar_si=None):
+    """
+    Decorador: cachea el resultado por argumentos. func.cache da acceso a la caché.
+    guardar_si(resultado) decide si se guarda (p. ej. no guardar un panel a medias
+    tras un error de BD); por defecto se guarda siempre.
+    """
+
+    def decorator(func):
+        cache = TTLCache(ttl, maxsize)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            value = cache.get(key, _MISSING)
+            if value is _MISSING:
+                value = func(*args, **kwargs)
+                if guardar_si is None or guardar_si(value):
+                    cache.set(key, value)
+            return value
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
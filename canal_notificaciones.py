@@ -0,0 +1,178 @@
+"""
+Canal de publicación/suscripción por usuario para las notificaciones in-app.
+
+El despachador publica cada recordatorio al vencer y /api/notifications/stream
+(Server-Sent Events) lo reenvía a las pestañas abiertas del usuario, sin sondeo.
+
+Backends:
+    BackendMemoria  solo el proceso actual (por defecto)
+    BackendRedis    PUBLISH/PSUBSCRIBE en Redis, para repartir entre workers;
+                    se activa con NOTIF_PUBSUB_URL=redis://host:6379/0
+
+    from models.canal_notificaciones import canal_notificaciones
+
+    canal_notificaciones().publicar(user_id, {'id': 5, 'title': ..., 'message': ...})
+    with canal_notificaciones().suscribir(user_id) as sus:
+        mensaje = sus.esperar(timeout=15)
+"""
+
+import json
+import os
+import queue
+import threading
+
+try:
+    import redis
+except Exception:
+    redis = None
+
+
+class Suscripcion:
+    """Cola de mensajes de una conexión SSE. Si el cliente no lee, se descartan los más viejos."""
+
+    def __init__(self, canal, user_id, maxsize=100):
+        self.canal = canal
+        self.user_id = user_id
+        self._cola = queue.Queue(maxsize)
+
+    def entregar(self, mensaje):
+        while True:
+            try:
+                self._cola.put_nowait(mensaje)
+                return
+            except queue.Full:
+                try:
+                    self._cola.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def esperar(self, timeout=None):
+        """Siguiente mensaje, o None si pasa timeout sin ninguno."""
+        try:
+            return self._cola.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def cancelar(self):
+        self.canal.cancelar(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cancelar()
+
+
+class BackendMemoria:
+    """Reparte a las suscripciones de este proceso."""
+
+    def __init__(self):
+        self._subs = {}  # user_id -> set(Suscripcion)
+        self._lock = threading.Lock()
+
+    def publicar(self, user_id, mensaje, clave=None):
+        self.entregar_local(user_id, mensaje)
+
+    def entregar_local(self, user_id, mensaje):
+        with self._lock:
+            subs = list(self._subs.get(user_id, ()))
+        for sus in subs:
+            sus.entregar(mensaje)
+
+    def suscribir(self, sus):
+        with self._lock:
+            self._subs.setdefault(sus.user_id, set()).add(sus)
+
+    def cancelar(self, sus):
+        with self._lock:
+            subs = self._subs.get(sus.user_id)
+            if subs is not None:
+                subs.discard(sus)
+                if not subs:
+                    del self._subs[sus.user_id]
+
+    def conexiones(self):
+        with self._lock:
+            return sum(len(s) for s in self._subs.values())
+
+
+class BackendRedis(BackendMemoria):
+    """Publica en Redis; un hilo por proceso escucha todos los usuarios y reparte localmente."""
+
+    def __init__(self, url, prefijo='focusfit:notif:'):
+        super().__init__()
+        if redis is None:
+            raise RuntimeError('el paquete redis no está instalado')
+        self.prefijo = prefijo
+        self._redis = redis.Redis.from_url(url)
+        self._hilo = threading.Thread(target=self._escuchar, name='canal-notificaciones', daemon=True)
+        self._hilo.start()
+
+    def publicar(self, user_id, mensaje, clave=None):
+        # Cada worker tiene su despachador: con clave solo publica el primero
+        if clave is not None and not self._redis.set(f'{self.prefijo}enviada:{clave}', 1, nx=True, ex=3600):
+            return
+        self._redis.publish(f'{self.prefijo}{user_id}', json.dumps(mensaje, default=str))
+
+    def _escuchar(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f'{self.prefijo}*')
+                for item in pubsub.listen():
+                    canal = item['channel'].decode() if isinstance(item['channel'], bytes) else item['channel']
+                    try:
+                        user_id = int(canal[len(self.prefijo):])
+                    except ValueError:
+                        continue
+                    self.entregar_local(user_id, json.loads(item['data']))
+            except Exception as e:
+                print(f'⚠️ Canal de notificaciones: conexión con Redis perdida ({e}), reintentando')
+                threading.Event().wait(2)
+
+
+class Canal:
+    """Fachada sobre el backend; limita las conexiones SSE abiertas en el proceso."""
+
+    def __init__(self, backend=None, max_conexiones=100):
+        self.backend = backend or BackendMemoria()
+        self.max_conexiones = max_conexiones  # cada SSE ocupa un hilo del servidor
+
+    def publicar(self, user_id, mensaje, clave=None):
+        """clave (p. ej. el id de la notificación) evita publicar dos veces lo mismo entre workers."""
+        self.backend.publicar(user_id, mensaje, clave)
+
+    def lleno(self):
+        return self.backend.conexiones() >= self.max_conexiones
+
+    def suscribir(self, user_id):
+        sus = Suscripcion(self, user_id)
+        self.backend.suscribir(sus)
+        return sus
+
+    def cancelar(self, sus):
+        self.backend.cancelar(sus)
+
+    def conexiones(self):
+        return self.backend.conexiones()
+
+
+_canal = None
+_canal_lock = threading.Lock()
+
+
+def canal_notificaciones():
+    """Devuelve el canal global, creándolo la primera vez que se usa."""
+    global _canal
+    if _canal is None:
+        with _canal_lock:
+            if _canal is None:
+                url = os.environ.get('NOTIF_PUBSUB_URL')
+                backend = None
+                if url:
+                    try:
+                        backend = BackendRedis(url)
+                    except Exception as e:
+                        print(f'⚠️ NOTIF_PUBSUB_URL no disponible ({e}); canal solo en memoria')
+                _canal = Canal(backend, max_conexiones=int(os.environ.get('NOTIF_SSE_MAX', 100)))
+    return _canal
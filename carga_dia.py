@@ -0,0 +1,97 @@
+"""
+Carga programada por usuario y día de la semana (user_day_load).
+
+total_items y total_minutes de cada (user_id, weekday) se mantienen al crear,
+editar o borrar rutinas, dentro de la misma transacción que el cambio. Los
+caminos calientes (rachas, estadísticas, gráficas) leen el denominador con una
+búsqueda por clave primaria en vez de contar rutina JOIN rutina_item.
+weekday sigue date.weekday(): 0 = Lunes ... 6 = Domingo.
+"""
+
+from models.db import get_db_connection
+from models import dias as _dias  # rutina.dias_mask debe existir antes del relleno
+from models.items_diarios import invalidar_generacion
+
+_SEMANA_SQL = ' UNION ALL '.join(f'SELECT {i} AS wd' for i in range(7))
+
+_RECALCULO_SQL = f"""
+    INSERT INTO user_day_load (user_id, weekday, total_items, total_minutes)
+    SELECT r.id_usuario, d.wd, COUNT(ri.id_item), COALESCE(SUM(ri.tiempo), 0)
+    FROM rutina r
+    JOIN rutina_item ri ON ri.id_rutina = r.id_rutina
+    JOIN ({_SEMANA_SQL}) d ON (r.dias_mask & (1 << d.wd)) <> 0
+    WHERE {{filtro}}
+    GROUP BY r.id_usuario, d.wd
+"""
+
+
+def ensure_user_day_load():
+    """Crea user_day_load y la rellena para todos los usuarios si estaba vacía."""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS user_day_load (
+                    user_id INT NOT NULL,
+                    weekday TINYINT NOT NULL,
+                    total_items INT NOT NULL DEFAULT 0,
+                    total_minutes INT NOT NULL DEFAULT 0,
+                    PRIMARY KEY (user_id, weekday),
+                    FOREIGN KEY (user_id) REFERENCES usuario(id) ON DELETE CASCADE
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """)
+            cur.execute("SELECT 1 FROM user_day_load LIMIT 1")
+            if not cur.fetchone():
+                cur.execute(_RECALCULO_SQL.format(filtro='r.id_usuario IS NOT NULL'))
+                print(f"✅ user_day_load rellenada ({cur.rowcount} filas)")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def recalcular_carga_usuario(user_id, cur=None):
+    """
+    Recalcula las 7 filas del usuario. Pasar el cursor del cambio de rutina para
+    que quede en la misma transacción; sin cursor usa la conexión de la petición.
+    El horario cambió, así que también se invalidan las marcas de item_diario desde hoy.
+    """
+    if cur is not None:
+        cur.execute('DELETE FROM user_day_load WHERE user_id = %s', (user_id,))
+        cur.execute(_RECALCULO_SQL.format(filtro='r.id_usuario = %s'), (user_id,))
+        invalidar_generacion(cur, user_id)
+        return
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            recalcular_carga_usuario(user_id, cur)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def obtener_carga_dia(cursor, user_id, weekday):
+    """(total_items, total_minutes) del usuario ese día de la semana."""
+    cursor.execute(
+        'SELECT total_items, total_minutes FROM user_day_load WHERE user_id = %s AND weekday = %s',
+        (user_id, weekday))
+    row = cursor.fetchone()
+    if not row:
+        return 0, 0
+    return int(row['total_items'] or 0), int(row['total_minutes'] or 0)
+
+
+def obtener_carga_semana(cursor, user_id):
+    """Lista de 7 tuplas (total_items, total_minutes), de Lunes a Domingo."""
+    cursor.execute(
+        'SELECT weekday, total_items, total_minutes FROM user_day_load WHERE user_id = %s',
+        (user_id,))
+    semana = [(0, 0)] * 7
+    for row in cursor.fetchall():
+        semana[row['weekday']] = (int(row['total_items'] or 0), int(row['total_minutes'] or 0))
+    return semana
+
+
+try:
+    ensure_user_day_load()
+except Exception:
+    pass
@@ -0,0 +1,60 @@
+"""
+Caché del contenido gestionado desde el panel (tabla contenido_admin).
+
+inicio y /community muestran banners, rutinas destacadas, recomendaciones y
+publicaciones de comunidad que solo cambian cuando un administrador los edita.
+Las listas se cachean por (tipo, límite, versión); las rutas de escritura del
+panel llaman a invalidar(), que sube la versión cuando el cambio queda
+confirmado. En un proceso distinto del que hizo el cambio (admin_app
+independiente) el contenido nuevo aparece al caducar la entrada.
+"""
+
+import threading
+
+import pymysql
+
+from models.cache import TTLCache
+from models.db import al_confirmar, get_db_connection
+
+CONTENIDO_TTL = 300
+
+_listas = TTLCache(ttl=CONTENIDO_TTL, maxsize=64, nombre='contenido_admin')
+_version = 0
+_version_lock = threading.Lock()
+
+
+def version():
+    return _version
+
+
+def _subir_version():
+    global _version
+    with _version_lock:
+        _version += 1
+    _listas.clear()
+
+
+def invalidar():
+    """Marca el contenido como cambiado (tras el commit de la petición en curso)."""
+    al_confirmar(_subir_version)
+
+
+def listar(tipo, limit=None):
+    """Filas de contenido_admin del tipo, más recientes primero (copias de la caché)."""
+
+    def _cargar():
+        conn = get_db_connection()
+        try:
+            with conn.cursor(pymysql.cursors.DictCursor) as cur:
+                if limit is None:
+                    cur.execute('SELECT * FROM contenido_admin WHERE tipo_contenido = %s ORDER BY actualizado_en DESC',
+                                (tipo,))
+                else:
+                    cur.execute('SELECT * FROM contenido_admin WHERE tipo_contenido = %s ORDER BY actualizado_en DESC LIMIT %s',
+                                (tipo, limit))
+                return cur.fetchall() or []
+        finally:
+            conn.close()
+
+    filas = _listas.get_or_set((tipo, limit, _version), _cargar)
+    return [dict(fila) for fila in filas]
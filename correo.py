@@ -0,0 +1,273 @@
+"""
+Envío de correo en segundo plano.
+
+Las peticiones no envían correo: encolar() lo deja para un hilo repartidor que
+envía por lotes reutilizando una sola conexión (un cliente SendGrid o una
+sesión SMTP) por lote. El mismo hilo drena, cada `intervalo` segundos o cuando
+el despachador avisa con despertar(), los recordatorios 'email_once' vencidos
+(notification.procesar_recordatorios_email: un UPDATE por lote).
+
+Transporte según el entorno (MAIL_SINK lo fuerza):
+    MAIL_SINK=consola | archivo:<carpeta> | smtp | sendgrid
+    SENDGRID_API_KEY            -> SendGrid
+    MAIL_HOST y MAIL_USE_CONSOLE=0 -> SMTP (MAIL_PORT, MAIL_USER, MAIL_PASSWORD)
+    en otro caso                -> consola
+
+    from models.correo import repartidor_correo
+    repartidor_correo().encolar(correo, 'Asunto', 'Cuerpo')
+"""
+
+import atexit
+import os
+import queue
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+
+from models.notification import procesar_recordatorios_email
+
+try:
+    from sendgrid import SendGridAPIClient
+    from sendgrid.helpers.mail import Mail
+except Exception:
+    SendGridAPIClient = None
+    Mail = None
+
+
+class TransporteConsola:
+    """Modo desarrollo: imprime el correo."""
+
+    def abrir(self):
+        pass
+
+    def enviar(self, para, asunto, cuerpo):
+        print('--- EMAIL (modo desarrollo) ---')
+        print(f'To: {para}')
+        print(f'Subject: {asunto}')
+        print(cuerpo)
+        print('--- FIN EMAIL ---')
+
+    def cerrar(self):
+        pass
+
+
+class TransporteArchivo:
+    """Para pruebas: cada correo se guarda como .eml en una carpeta."""
+
+    def __init__(self, carpeta, remitente):
+        self.carpeta = carpeta
+        self.remitente = remitente
+        os.makedirs(carpeta, exist_ok=True)
+
+    def abrir(self):
+        pass
+
+    def enviar(self, para, asunto, cuerpo):
+        mensaje = _mensaje(self.remitente, para, asunto, cuerpo)
+        ruta = os.path.join(self.carpeta, f'{time.time_ns()}.eml')
+        with open(ruta, 'wb') as f:
+            f.write(bytes(mensaje))
+
+    def cerrar(self):
+        pass
+
+
+class TransporteSMTP:
+    """Una sesión SMTP por lote (STARTTLS y login si hay usuario)."""
+
+    def __init__(self, host, port, usuario, password, remitente):
+        self.host = host
+        self.port = port or 587
+        self.usuario = usuario
+        self.password = password
+        self.remitente = remitente
+        self._smtp = None
+
+    def abrir(self):
+        if self._smtp is not None:
+            return
+        smtp = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.port != 25:
+            smtp.starttls()
+        if self.usuario:
+            smtp.login(self.usuario, self.password)
+        self._smtp = smtp
+
+    def enviar(self, para, asunto, cuerpo):
+        mensaje = _mensaje(self.remitente, para, asunto, cuerpo)
+        try:
+            self.abrir()
+            self._smtp.send_message(mensaje)
+        except smtplib.SMTPServerDisconnected:
+            # El servidor cerró la sesión (inactividad): se reabre una vez
+            self._smtp = None
+            self.abrir()
+            self._smtp.send_message(mensaje)
+
+    def cerrar(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+
+class TransporteSendGrid:
+    """Un único cliente SendGrid para todos los envíos."""
+
+    def __init__(self, api_key, remitente):
+        if SendGridAPIClient is None:
+            raise RuntimeError('el paquete sendgrid no está instalado')
+        self.remitente = remitente
+        self._cliente = SendGridAPIClient(api_key)
+
+    def abrir(self):
+        pass
+
+    def enviar(self, para, asunto, cuerpo):
+        respuesta = self._cliente.send(Mail(from_email=self.remitente, to_emails=para, subject=asunto,
+                                            plain_text_content=cuerpo))
+        if respuesta.status_code >= 400:
+            raise RuntimeError(f'SendGrid respondió {respuesta.status_code}')
+
+    def cerrar(self):
+        pass
+
+
+def _mensaje(remitente, para, asunto, cuerpo):
+    mensaje = EmailMessage()
+    mensaje['From'] = remitente
+    mensaje['To'] = para
+    mensaje['Subject'] = asunto
+    mensaje.set_content(cuerpo)
+    return mensaje
+
+
+def transporte_desde_entorno():
+    remitente = os.environ.get('MAIL_FROM', 'no-reply@focusfit.com')
+    sink = os.environ.get('MAIL_SINK', '')
+    api_key = os.environ.get('SENDGRID_API_KEY')
+    host = os.environ.get('MAIL_HOST')
+
+    if sink == 'consola':
+        return TransporteConsola()
+    if sink.startswith('archivo:'):
+        return TransporteArchivo(sink[len('archivo:'):], remitente)
+    if sink == 'sendgrid' or (not sink and api_key and SendGridAPIClient is not None):
+        return TransporteSendGrid(api_key, remitente)
+    if sink == 'smtp' or (not sink and host and os.environ.get('MAIL_USE_CONSOLE', '1') == '0'):
+        port = int(os.environ['MAIL_PORT']) if os.environ.get('MAIL_PORT') else None
+        return TransporteSMTP(host, port, os.environ.get('MAIL_USER', ''), os.environ.get('MAIL_PASSWORD', ''),
+                              remitente)
+    return TransporteConsola()
+
+
+_DRENAR = object()
+_PARAR = object()
+
+
+class RepartidorCorreo:
+    """Hilo que envía lo encolado y los recordatorios pendientes, por lotes."""
+
+    def __init__(self, transporte, lote=50, intervalo=30):
+        self.transporte = transporte
+        self.lote = lote
+        self.intervalo = intervalo  # cada cuánto se drenan los recordatorios aunque nadie avise
+        self._cola = queue.Queue()
+        self._hilo = threading.Thread(target=self._bucle, name='repartidor-correo', daemon=True)
+        self.enviados = 0
+        self.fallidos = 0
+
+    def iniciar(self):
+        self._hilo.start()
+        atexit.register(self.detener)
+        print(f"📧 Repartidor de correo iniciado ({type(self.transporte).__name__}, lote {self.lote})")
+
+    def encolar(self, para, asunto, cuerpo):
+        """No bloquea: el correo sale en el siguiente lote."""
+        self._cola.put((para, asunto, cuerpo))
+
+    def despertar(self):
+        """Drena ya los recordatorios vencidos (lo llama el despachador al vencer uno)."""
+        self._cola.put(_DRENAR)
+
+    def detener(self, timeout=10):
+        """Envía lo que quede en la cola y para el hilo."""
+        if self._hilo.is_alive():
+            self._cola.put(_PARAR)
+            self._hilo.join(timeout)
+
+    def _siguiente_lote(self):
+        """Espera el primer elemento y junta lo que ya esté en cola. Devuelve (correos, drenar, parar)."""
+        try:
+            item = self._cola.get(timeout=self.intervalo)
+        except queue.Empty:
+            item = _DRENAR
+        correos, drenar, parar = [], False, False
+        while True:
+            if item is _PARAR:
+                parar = True
+            elif item is _DRENAR:
+                drenar = True
+            else:
+                correos.append(item)
+            if parar or len(correos) >= self.lote:
+                break
+            try:
+                item = self._cola.get_nowait()
+            except queue.Empty:
+                break
+        return correos, drenar, parar
+
+    def _enviar(self, para, asunto, cuerpo):
+        self.transporte.enviar(para, asunto, cuerpo)
+        self.enviados += 1
+
+    def _bucle(self):
+        parar = False
+        while not parar:
+            correos, drenar, parar = self._siguiente_lote()
+            try:
+                for para, asunto, cuerpo in correos:
+                    try:
+                        self._enviar(para, asunto, cuerpo)
+                    except Exception as e:
+                        self.fallidos += 1
+                        print(f'Error al enviar email a {para}: {e}')
+                if drenar:
+                    while True:
+                        enviados, fallidos = procesar_recordatorios_email(
+                            lambda fila: self._enviar(fila['correo'], fila['title'], fila['message']),
+                            limit=self.lote)
+                        self.fallidos += fallidos
+                        # Las fallidas quedan aplazadas (envio_siguiente): un lote lleno
+                        # de fallos no se vuelve a reclamar y no frena a las nuevas
+                        if enviados + fallidos < self.lote:
+                            break
+            except Exception as e:
+                print(f'⚠️ Repartidor de correo: {e}')
+            finally:
+                self.transporte.cerrar()
+
+    def stats(self):
+        return {'pendientes': self._cola.qsize(), 'enviados': self.enviados, 'fallidos': self.fallidos}
+
+
+_repartidor = None
+_repartidor_lock = threading.Lock()
+
+
+def repartidor_correo():
+    """Devuelve el repartidor global; la primera vez lo crea y arranca su hilo."""
+    global _repartidor
+    if _repartidor is None:
+        with _repartidor_lock:
+            if _repartidor is None:
+                repartidor = RepartidorCorreo(transporte_desde_entorno(),
+                                              lote=int(os.environ.get('MAIL_LOTE', 50)),
+                                              intervalo=int(os.environ.get('MAIL_INTERVALO', 30)))
+                repartidor.iniciar()
+                _repartidor = repartidor
+    return _repartidor
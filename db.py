@@ -1,5 +1,22 @@
 import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
 import pymysql
+from pymysql.constants import SERVER_STATUS
+
+from models import metrics, nplusone
+
+try:
+    from flask import g, has_request_context
+except Exception:
+    # Sin Flask (scripts/CLI): no hay unidad de trabajo por petición
+    g = None
+
+    def has_request_context():
+        return False
 
 # Configuración de conexión (ajusta según tu entorno)
 DB_CONFIG = {
@@ -11,10 +28,526 @@ DB_CONFIG = {
     'cursorclass': pymysql.cursors.DictCursor
 }
 
+# Configuración del pool de conexiones (se puede sobrescribir con variables de entorno)
+POOL_CONFIG = {
+    'min_size': int(os.environ.get('DB_POOL_MIN', 1)),
+    'max_size': int(os.environ.get('DB_POOL_MAX', 10)),
+    'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),          # segundos esperando una conexión libre
+    'recycle': int(os.environ.get('DB_POOL_RECYCLE', 3600)),          # segundos de vida máxima de una conexión
+    'ping_interval': int(os.environ.get('DB_POOL_PING_INTERVAL', 30)),  # ping si estuvo inactiva más de N segundos
+}
+
+
+class PoolTimeoutError(pymysql.err.OperationalError):
+    """No se obtuvo una conexión libre del pool dentro del tiempo de espera."""
+
+
+class TransaccionAbortada(pymysql.err.OperationalError):
+    """El servidor deshizo la transacción de la petición (deadlock, savepoint perdido): no se confirma nada."""
+
+
+# Errores tras los que MySQL ya no conserva la transacción (ni sus savepoints)
+ER_LOCK_DEADLOCK = 1213
+ER_SP_DOES_NOT_EXIST = 1305
+
+
+class InstrumentedCursor:
+    """Cursor que mide cada sentencia (models.metrics) y la pasa al detector N+1 (models.nplusone)."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._cursor.close()
+
+    def _timed(self, method, query, args):
+        nplusone.record(query)
+        start = time.perf_counter()
+        error = False
+        try:
+            return method(query, args)
+        except Exception:
+            error = True
+            raise
+        finally:
+            metrics.observe_statement(query, time.perf_counter() - start, self._cursor.rowcount, error)
+
+    def execute(self, query, args=None):
+        return self._timed(self._cursor.execute, query, args)
+
+    def executemany(self, query, args):
+        return self._timed(self._cursor.executemany, query, args)
+
+
+class PooledConnection:
+    """
+    Conexión prestada por el pool. Se comporta como una conexión de pymysql,
+    pero close() la devuelve al pool en lugar de cerrar el socket.
+    """
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get('_raw')
+        if raw is None:
+            raise pymysql.err.InterfaceError(0, 'La conexión ya fue devuelta al pool')
+        return getattr(raw, name)
+
+    @property
+    def closed(self):
+        return self._raw is None
+
+    def cursor(self, cursor=None):
+        raw = self._raw
+        if raw is None:
+            raise pymysql.err.InterfaceError(0, 'La conexión ya fue devuelta al pool')
+        return InstrumentedCursor(raw.cursor(cursor) if cursor else raw.cursor())
+
+    def close(self):
+        """Devuelve la conexión al pool. Llamarlo varias veces es seguro."""
+        raw = self._raw
+        if raw is None:
+            return
+        self._raw = None
+        self._pool.release(raw, self._created_at)
+
+    def discard(self):
+        """Cierra el socket en lugar de devolverlo al pool (p. ej. con un resultado sin leer)."""
+        raw = self._raw
+        if raw is None:
+            return
+        self._raw = None
+        self._pool.discard(raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Pool de conexiones acotado y seguro entre hilos.
+
+    - min_size: conexiones que se abren al crear el pool.
+    - max_size: máximo de conexiones abiertas (libres + prestadas).
+    - timeout: segundos que acquire() espera a que se libere una conexión.
+    - recycle: las conexiones con más de N segundos de vida se reemplazan.
+    - ping_interval: las conexiones inactivas más de N segundos se validan con ping.
+    """
+
+    def __init__(self, config=None, min_size=1, max_size=10, timeout=10.0, recycle=3600, ping_interval=30):
+        if max_size < 1:
+            raise ValueError('max_size debe ser >= 1')
+        self._config = dict(config or DB_CONFIG)
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+        self._idle = deque()   # (conexión, creada_en, último_uso)
+        self._size = 0         # conexiones abiertas (libres + prestadas)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._fill()
+
+    def _connect(self):
+        return pymysql.connect(**self._config), time.monotonic()
+
+    def _fill(self):
+        """Abre conexiones hasta llegar a min_size (sin fallar si la BD no responde)."""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                raw, created = self._connect()
+            except Exception as e:
+                with self._cond:
+                    self._size -= 1
+                print(f'[DB POOL] No se pudo precargar conexión: {e}')
+                return
+            with self._cond:
+                self._idle.append((raw, created, time.monotonic()))
+                self._cond.notify()
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _validate(self, raw, created, last_used):
+        """Devuelve la conexión si sigue sana, o None si hay que reemplazarla."""
+        now = time.monotonic()
+        if self.recycle and now - created > self.recycle:
+            return None
+        if not raw.open:
+            return None
+        if self.ping_interval is not None and now - last_used > self.ping_interval:
+            try:
+                raw.ping(reconnect=False)
+            except Exception:
+                return None
+        return raw
+
+    def acquire(self, timeout=None):
+        """Obtiene una conexión del pool (bloquea hasta `timeout` segundos si está lleno)."""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise pymysql.err.InterfaceError(0, 'El pool de conexiones está cerrado')
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    entry = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    metrics.observe_pool_wait(time.monotonic() - start, timed_out=True)
+                    raise PoolTimeoutError(
+                        2013, f'Sin conexiones libres en el pool tras {timeout}s (max_size={self.max_size})'
+                    )
+                self._cond.wait(remaining)
+
+        # Validar o abrir fuera del lock: ping y connect hacen red
+        if entry is not None:
+            raw, created, last_used = entry
+            if self._validate(raw, created, last_used) is not None:
+                metrics.observe_pool_wait(time.monotonic() - start)
+                return PooledConnection(self, raw, created)
+            self._discard(raw)
+        try:
+            raw, created = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        metrics.observe_pool_wait(time.monotonic() - start)
+        return PooledConnection(self, raw, created)
+
+    def release(self, raw, created_at):
+        """Devuelve una conexión al pool, deshaciendo cualquier transacción abierta."""
+        healthy = raw.open
+        if healthy and raw.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+            try:
+                raw.rollback()
+            except Exception:
+                healthy = False
+        with self._cond:
+            if healthy and not self._closed:
+                self._idle.append((raw, created_at, time.monotonic()))
+            else:
+                self._size -= 1
+                self._discard(raw)
+            self._cond.notify()
+
+    def discard(self, raw):
+        """Cierra una conexión prestada sin devolverla (libera su hueco en el pool)."""
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+        self._discard(raw)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager: `with pool.connection() as conn: ...`"""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def close(self):
+        """Cierra las conexiones libres; las prestadas se cierran al devolverse."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                raw, _, _ = self._idle.pop()
+                self._size -= 1
+                self._discard(raw)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.max_size,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Devuelve el pool global, creándolo la primera vez que se usa."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_CONFIG, **POOL_CONFIG)
+    return _pool
+
+
+@metrics.REGISTRY.add_collector
+def _pool_gauges():
+    if _pool is None:
+        return []
+    lines = []
+    for key, value in _pool.stats().items():
+        name = f'focusfit_db_pool_{key}'
+        lines += [f'# HELP {name} Conexiones del pool ({key})', f'# TYPE {name} gauge', f'{name} {value}']
+    return lines
+
+
+def close_pool():
+    """Cierra el pool global (útil en tests o al apagar el proceso)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+class UnitOfWork:
+    """
+    Conexión y transacción compartidas por todos los helpers durante una petición.
+    La conexión se toma del pool la primera vez que alguien la pide y se hace
+    un único commit al final de la petición (ver init_app). Cada helper trabaja
+    dentro de su propio SAVEPOINT (ver RequestConnection).
+    """
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._conn = None
+        self._savepoints = 0
+        self.commit_requested = False
+        self.aborted = False
+        self.after_commit = []  # funciones a ejecutar tras el commit real (ver al_confirmar)
+
+    @property
+    def active(self):
+        return self._conn is not None
+
+    @property
+    def connection(self):
+        if self._conn is None:
+            self._conn = self._pool.acquire()
+        return self._conn
+
+    def commit(self):
+        """Commit real de todo lo escrito en la petición hasta ahora."""
+        if self.aborted:
+            raise TransaccionAbortada(ER_LOCK_DEADLOCK, 'La transacción de la petición fue abortada; no se confirma')
+        if self._conn is not None:
+            self._conn.commit()
+        self.commit_requested = False
+        callbacks, self.after_commit = self.after_commit, []
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception as e:
+                print(f'[DB] Error en callback tras commit: {e}')
+
+    def rollback(self):
+        """Deshace todo lo escrito en la petición hasta ahora."""
+        if self._conn is not None:
+            self._conn.rollback()
+        self.commit_requested = False
+        self.after_commit = []
+
+    def abortar(self, error):
+        """
+        La transacción ya no es fiable: el servidor la deshizo entera (deadlock) o
+        se perdió un savepoint. Lo escrito antes desapareció, así que no se confirma
+        nada de la petición ni se ejecutan sus callbacks de al_confirmar.
+        """
+        if not self.aborted:
+            print(f'[DB] Transacción de la petición abortada: {error}')
+        self.aborted = True
+        self.commit_requested = False
+        self.after_commit = []
+        if self._conn is not None:
+            try:
+                self._conn.rollback()
+            except Exception:
+                pass
+
+    def _savepoint_query(self, sql):
+        if self.aborted:
+            raise TransaccionAbortada(ER_LOCK_DEADLOCK, 'La transacción de la petición fue abortada')
+        try:
+            self.connection.query(sql)
+        except Exception as e:
+            # Sin el savepoint no se puede deshacer solo lo del helper
+            self.abortar(e)
+            raise TransaccionAbortada(ER_SP_DOES_NOT_EXIST, f'{sql}: {e}') from e
+
+    def savepoint(self):
+        """Abre un SAVEPOINT nuevo y devuelve su nombre."""
+        self._savepoints += 1
+        nombre = f'helper_{self._savepoints}'
+        self._savepoint_query(f'SAVEPOINT {nombre}')
+        return nombre
+
+    def release_savepoint(self, nombre):
+        self._savepoint_query(f'RELEASE SAVEPOINT {nombre}')
+
+    def rollback_to_savepoint(self, nombre):
+        self._savepoint_query(f'ROLLBACK TO SAVEPOINT {nombre}')
+
+    def release(self):
+        """Devuelve la conexión al pool (lo no confirmado se deshace)."""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.close()
+
+
+class RequestConnection:
+    """
+    Vista de la conexión de la petición que reciben los helpers de modelos.
+    commit() solo marca que la petición debe confirmarse: así el código
+    existente (`conn.commit(); conn.close()`) funciona sin cambios.
+
+    El primer cursor() abre un SAVEPOINT. commit() lo libera (lo escrito entra
+    en el commit de la petición) y close() o rollback() sin commit vuelven a él,
+    igual que antes al cerrar una conexión propia sin confirmar: un helper que
+    falla a medias no deja escrituras parciales aunque la ruta se trague la
+    excepción y otro helper pida commit.
+
+    Si el servidor deshace la transacción entera (deadlock) o falla un savepoint,
+    la unidad de trabajo queda abortada: se lanza TransaccionAbortada y la
+    petición termina en error sin confirmar nada.
+    """
+
+    def __init__(self, uow):
+        self._uow = uow
+        self._savepoint = None
+        self._callbacks = 0
+
+    def __getattr__(self, name):
+        return getattr(self._uow.connection, name)
+
+    def cursor(self, cursor=None):
+        if self._savepoint is None:
+            self._savepoint = self._uow.savepoint()
+            self._callbacks = len(self._uow.after_commit)
+        return self._uow.connection.cursor(cursor)
+
+    def commit(self):
+        if self._savepoint is not None:
+            nombre, self._savepoint = self._savepoint, None
+            self._uow.release_savepoint(nombre)
+        self._uow.commit_requested = True
+
+    def rollback(self):
+        if self._savepoint is not None:
+            nombre, self._savepoint = self._savepoint, None
+            if self._uow.aborted:
+                return  # ya no hay nada que deshacer; la petición fallará al final
+            # Lo registrado con al_confirmar desde el savepoint ya no aplica
+            del self._uow.after_commit[self._callbacks:]
+            self._uow.rollback_to_savepoint(nombre)
+
+    def close(self):
+        self.rollback()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def current_unit_of_work():
+    """Unidad de trabajo de la petición actual, o None fuera de una petición."""
+    if g is None or not has_request_context():
+        return None
+    return g.get('_db_uow')
+
+
+def al_confirmar(fn):
+    """
+    Ejecuta fn() cuando lo escrito quede confirmado: dentro de una petición, tras
+    el commit real del final de la petición (no se ejecuta si se deshace); fuera
+    de ella, en el momento (el llamador ya hizo commit). Útil para invalidar
+    cachés sin que otra petición vuelva a cachear datos aún sin confirmar.
+    """
+    uow = current_unit_of_work()
+    if uow is None:
+        fn()
+    else:
+        uow.after_commit.append(fn)
+
 
 def get_db_connection():
-    """Crea y devuelve una conexión a la base de datos."""
-    return pymysql.connect(**DB_CONFIG)
+    """
+    Devuelve una conexión a la base de datos.
+    Dentro de una petición Flask (con init_app) es la conexión compartida de la
+    petición; fuera de ella es una conexión del pool. close() la devuelve al pool.
+    """
+    uow = current_unit_of_work()
+    if uow is not None:
+        return RequestConnection(uow)
+    return get_pool().acquire()
+
+
+def init_app(app):
+    """Registra la unidad de trabajo por petición: una conexión y un commit por petición."""
+
+    @app.before_request
+    def _db_begin_request():
+        g._db_uow = UnitOfWork(get_pool())
+
+    @app.after_request
+    def _db_commit_request(response):
+        uow = g.get('_db_uow')
+        if uow is not None and uow.aborted and not g.get('_db_uow_fallida'):
+            # Aunque la ruta se tragara el error, la petición no puede responder como si todo se hubiera guardado
+            # (una sola vez: after_request vuelve a ejecutarse con la respuesta de error)
+            g._db_uow_fallida = True
+            raise TransaccionAbortada(ER_LOCK_DEADLOCK, 'La transacción de la petición fue abortada; no se confirmó nada')
+        if uow is not None and uow.active and uow.commit_requested:
+            uow.commit()
+        return response
+
+    @app.teardown_request
+    def _db_end_request(exc):
+        uow = g.pop('_db_uow', None)
+        if uow is not None:
+            uow.release()
+
+    return app
+
+
+@contextmanager
+def db_connection(timeout=None):
+    """Context manager sobre el pool: `with db_connection() as conn: ...`"""
+    with get_pool().connection(timeout) as conn:
+        yield conn
 
 
 def init_db_schema_only(admin_email='admin@focusfit.com', admin_password='admin123'):
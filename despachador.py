@@ -0,0 +1,254 @@
+"""
+Despachador de recordatorios en proceso.
+
+Un hilo carga de user_notifications las pendientes de la próxima ventana
+(por defecto 10 minutos, rango por el índice de fecha_programada) en un heap
+ordenado por hora y duerme hasta la siguiente. Al vencer, cada notificación que
+siga sin leer se entrega a los sumideros:
+
+    BandejaApp     bandeja en memoria de los usuarios que la piden;
+                   /api/notifications/due la lee sin consultar MySQL salvo al
+                   refrescarla cada pocos minutos
+    SumideroPush   publica en el canal del usuario (models.canal_notificaciones)
+                   para las conexiones SSE abiertas
+    SumideroEmail  recordatorios tipo 'email_once': avisa al repartidor de
+                   correo (models.correo), que los envía por lotes
+
+Cada `resync` segundos carga solo lo nuevo: el tramo que entra en la ventana y
+lo creado desde la carga anterior (por id). Tras crear recordatorios se puede
+adelantar con resincronizar().
+
+Es local a cada proceso: con varios workers cada uno tiene su bandeja (el
+cliente descarta duplicados por id) y el envío de correos no se repite porque
+el repartidor reclama las filas antes de enviarlas.
+"""
+
+import heapq
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from time import monotonic as _monotonic
+
+from models import metrics
+from models.correo import repartidor_correo
+from models.notification import (get_due_notifications, ids_sin_leer, notificaciones_creadas,
+                                 notificaciones_en_ventana, ultimo_id_notificacion)
+
+RETRASO_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+DESPACHO_RETRASO_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    'focusfit_notificaciones_retraso_seconds', 'Retraso entre fecha_programada y la entrega del despachador',
+    ('sumidero',), RETRASO_BUCKETS))
+
+
+class BandejaApp:
+    """
+    Notificaciones vencidas y sin leer de los usuarios activos, a la espera de
+    que el navegador las recoja. La bandeja de un usuario se lee de MySQL
+    (get_due_notifications, por su índice de usuario) la primera vez que la pide
+    y cada `caducidad` segundos; entre medias el despachador añade lo que vence y
+    mark_delivered quita lo leído. Así no se guarda ni se reescanea lo de todos.
+    """
+
+    def __init__(self, caducidad=300, tope=50, cargar=None):
+        self.caducidad = caducidad
+        self.tope = tope  # filas leídas por usuario; si había más se relee al bajar de `limit`
+        self._cargar = cargar or (lambda user_id, limit: get_due_notifications(limit=limit, user_id=user_id))
+        self._por_usuario = {}  # user_id -> (caduca, completa, OrderedDict(id -> fila))
+        self._lock = threading.Lock()
+
+    def __call__(self, fila):
+        with self._lock:
+            entrada = self._por_usuario.get(fila['user_id'])
+            if entrada is None:
+                return False  # no la ha pedido: la leerá de MySQL cuando la pida
+            entrada[2][fila['id']] = fila
+        return True
+
+    def pendientes(self, user_id, limit=10):
+        """Las más antiguas primero, como get_due_notifications."""
+        ahora = _monotonic()
+        with self._lock:
+            entrada = self._por_usuario.get(user_id)
+            if entrada is not None and entrada[0] > ahora and (entrada[1] or len(entrada[2]) >= limit):
+                return [_visible(f) for f in list(entrada[2].values())[:limit]]
+        filas = self._cargar(user_id, self.tope)
+        with self._lock:
+            # Se sueltan los usuarios que dejaron de pedirla
+            for uid in [uid for uid, (caduca, _, _) in self._por_usuario.items() if caduca <= ahora]:
+                del self._por_usuario[uid]
+            self._por_usuario[user_id] = (ahora + self.caducidad, len(filas) < self.tope,
+                                          OrderedDict((f['id'], f) for f in filas))
+        return [_visible(f) for f in filas[:limit]]
+
+    def confirmar(self, notification_id, user_id=None):
+        """El usuario ya la vio (mark_delivered): sale de su bandeja (sin user_id, de la que la tenga)."""
+        with self._lock:
+            if user_id is not None:
+                entradas = [self._por_usuario.get(user_id)]
+            else:
+                entradas = list(self._por_usuario.values())
+            for entrada in entradas:
+                if entrada is not None:
+                    entrada[2].pop(notification_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(e[2]) for e in self._por_usuario.values())
+
+
+def _visible(fila):
+    return {'id': fila['id'], 'title': fila['title'], 'message': fila['message']}
+
+
+class SumideroPush:
+    """Publica la notificación en el canal del usuario (Server-Sent Events)."""
+
+    def __init__(self, canal):
+        self.canal = canal
+
+    def __call__(self, fila):
+        mensaje = {'id': fila['id'], 'title': fila['title'], 'message': fila['message']}
+        self.canal.publicar(fila['user_id'], mensaje, clave=fila['id'])
+        return True
+
+
+class SumideroEmail:
+    """Al vencer un recordatorio 'email_once' despierta al repartidor, que drena los pendientes en lote."""
+
+    def __call__(self, fila):
+        if fila.get('tipo') != 'email_once':
+            return False
+        repartidor_correo().despertar()
+        return True
+
+
+class Despachador:
+    """Heap de (fecha_programada, id) de la ventana actual y un hilo que entrega al vencer."""
+
+    def __init__(self, sumideros, ventana=600, resync=30, atraso_max=600):
+        self.sumideros = dict(sumideros)  # nombre -> callable(fila), True si la entregó
+        self.ventana = ventana
+        self.resync = resync
+        self.atraso_max = atraso_max  # no se entregan las vencidas hace más de esto (la bandeja sí las lee)
+        self._heap = []
+        self._filas = {}   # id -> fila aún por entregar
+        self._vistas = {}  # id -> fecha_programada de todo lo cargado (para no entregar dos veces)
+        self._ultimo_id = None  # mayor id ya leído: lo creado después se busca por clave primaria
+        self._hasta = None      # extremo de la ventana ya leída
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._parar = threading.Event()
+        self._proximo_resync = 0.0
+        self._hilo = None
+        self.cargas = 0
+        self.entregadas = 0
+
+    def cargar(self, ahora=None):
+        """
+        Añade al heap lo nuevo y devuelve cuántas. La primera vez lee la ventana
+        [ahora - atraso_max, ahora + ventana); después solo el tramo que entró en
+        la ventana desde la carga anterior (rango por fecha_programada) y lo
+        creado desde entonces (rango por id), sin releer lo ya cargado.
+        """
+        ahora = ahora or datetime.now()
+        desde = ahora - timedelta(seconds=self.atraso_max)
+        hasta = ahora + timedelta(seconds=self.ventana)
+        if self._hasta is None:
+            ultimo_id = ultimo_id_notificacion()
+            filas = list(notificaciones_en_ventana(desde, hasta))
+        else:
+            filas = list(notificaciones_en_ventana(max(self._hasta, desde), hasta))
+            ultimo_id = ultimo_id_notificacion()
+            if ultimo_id > self._ultimo_id:
+                filas += notificaciones_creadas(self._ultimo_id, ultimo_id, desde, hasta)
+        nuevas = 0
+        with self._lock:
+            for fila in filas:
+                if fila['id'] in self._vistas:
+                    continue
+                self._vistas[fila['id']] = fila['fecha_programada']
+                self._filas[fila['id']] = fila
+                heapq.heappush(self._heap, (fila['fecha_programada'], fila['id']))
+                nuevas += 1
+            for nid in [nid for nid, fecha in self._vistas.items() if fecha < desde]:
+                del self._vistas[nid]
+            self._ultimo_id = ultimo_id
+            self._hasta = hasta
+            self.cargas += 1
+        return nuevas
+
+    def entregar_vencidas(self, ahora=None):
+        """Saca del heap lo vencido y lo pasa a los sumideros. Devuelve cuántas entregó."""
+        ahora = ahora or datetime.now()
+        vencidas = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= ahora:
+                _, nid = heapq.heappop(self._heap)
+                fila = self._filas.pop(nid, None)
+                if fila is not None:
+                    vencidas.append(fila)
+        if vencidas:
+            # Leídas o borradas desde que se cargaron: una consulta por clave primaria
+            try:
+                sin_leer = ids_sin_leer(f['id'] for f in vencidas)
+                vencidas = [f for f in vencidas if f['id'] in sin_leer]
+            except Exception as e:
+                print(f"⚠️ Despachador: no se pudo comprobar si siguen sin leer: {e}")
+
+        for fila in vencidas:
+            for nombre, sumidero in self.sumideros.items():
+                try:
+                    if not sumidero(fila):
+                        continue
+                    retraso = (datetime.now() - fila['fecha_programada']).total_seconds()
+                    DESPACHO_RETRASO_SECONDS.observe(max(retraso, 0.0), nombre)
+                except Exception as e:
+                    print(f"⚠️ Despachador: error en '{nombre}' con la notificación {fila['id']}: {e}")
+        self.entregadas += len(vencidas)
+        return len(vencidas)
+
+    def _segundos_hasta_siguiente(self):
+        espera = self._proximo_resync - _monotonic()
+        with self._lock:
+            if self._heap:
+                espera = min(espera, (self._heap[0][0] - datetime.now()).total_seconds())
+        return max(espera, 0.05)
+
+    def _bucle(self):
+        while not self._parar.is_set():
+            if _monotonic() >= self._proximo_resync:
+                try:
+                    self.cargar()
+                except Exception as e:
+                    print(f"⚠️ Despachador: no se pudo cargar la ventana: {e}")
+                self._proximo_resync = _monotonic() + self.resync
+            self.entregar_vencidas()
+            self._despertar.wait(self._segundos_hasta_siguiente())
+            self._despertar.clear()
+
+    def resincronizar(self):
+        """Adelanta la próxima carga (p. ej. tras crear recordatorios que vencen enseguida)."""
+        self._proximo_resync = 0.0
+        self._despertar.set()
+
+    def iniciar(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._parar.clear()
+            self._hilo = threading.Thread(target=self._bucle, name='despachador-notificaciones', daemon=True)
+            self._hilo.start()
+            print(f"🔔 Despachador de notificaciones iniciado (ventana {self.ventana}s, resync {self.resync}s)")
+
+    def detener(self, timeout=5):
+        self._parar.set()
+        self._despertar.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+
+    @property
+    def activo(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def stats(self):
+        with self._lock:
+            return {'programadas': len(self._filas), 'cargas': self.cargas, 'entregadas': self.entregadas}
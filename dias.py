@@ -0,0 +1,90 @@
+"""
+Días de la semana de las rutinas como máscara de bits.
+
+rutina.dias guarda "Lunes,Martes,..." (lo que ve el usuario) y rutina.dias_mask
+el mismo horario en 7 bits: bit i = date.weekday() i (Lunes = 1, Domingo = 64).
+Las consultas usan (dias_mask & %s) <> 0 con el índice (id_usuario, dias_mask)
+en lugar de FIND_IN_SET / LIKE sobre la cadena. En SQL, el bit de una fecha es
+1 << WEEKDAY(fecha).
+"""
+
+from models.db import get_db_connection
+
+DIAS_ORDEN = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+
+DIAS_SEMANA = {
+    'Monday': 'Lunes', 'Tuesday': 'Martes', 'Wednesday': 'Miércoles',
+    'Thursday': 'Jueves', 'Friday': 'Viernes', 'Saturday': 'Sábado', 'Sunday': 'Domingo'
+}
+
+TODOS = 0x7F
+
+
+def nombre_dia(fecha):
+    """Nombre en español del día de la semana de una fecha."""
+    return DIAS_ORDEN[fecha.weekday()]
+
+
+def bit_dia(dia):
+    """Bit de un día: acepta una fecha o un nombre en español."""
+    if isinstance(dia, str):
+        return 1 << DIAS_ORDEN.index(dia.strip())
+    return 1 << dia.weekday()
+
+
+def mask_de_dias(dias):
+    """Máscara a partir de "Lunes,Martes" o de una lista de nombres. Ignora valores desconocidos."""
+    if not dias:
+        return 0
+    if isinstance(dias, str):
+        dias = dias.split(',')
+    mask = 0
+    for dia in dias:
+        dia = dia.strip()
+        if dia in DIAS_ORDEN:
+            mask |= 1 << DIAS_ORDEN.index(dia)
+    return mask
+
+
+def dias_de_mask(mask):
+    """Lista de nombres de los días incluidos en la máscara."""
+    return [dia for i, dia in enumerate(DIAS_ORDEN) if mask & (1 << i)]
+
+
+def masks_con_dia(dia):
+    """Todas las máscaras que incluyen ese día (para dias_mask IN (...) sin filtrar por usuario)."""
+    bit = bit_dia(dia)
+    return [m for m in range(1, TODOS + 1) if m & bit]
+
+
+def backfill_dias_mask(cur):
+    """Rellena dias_mask desde la cadena dias en una sola sentencia."""
+    partes = ' + '.join(
+        f"(FIND_IN_SET('{dia}', REPLACE(dias, ' ', '')) > 0) * {1 << i}" for i, dia in enumerate(DIAS_ORDEN)
+    )
+    cur.execute(f"UPDATE rutina SET dias_mask = {partes} WHERE dias IS NOT NULL")
+    return cur.rowcount
+
+
+def ensure_dias_mask():
+    """Añade rutina.dias_mask y sus índices si faltan, y rellena las filas existentes."""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SHOW COLUMNS FROM rutina LIKE 'dias_mask'")
+            if cur.fetchone():
+                return
+            cur.execute("ALTER TABLE rutina ADD COLUMN dias_mask TINYINT UNSIGNED NOT NULL DEFAULT 0 AFTER dias")
+            cur.execute("CREATE INDEX idx_rutina_usuario_dias_mask ON rutina (id_usuario, dias_mask)")
+            cur.execute("CREATE INDEX idx_rutina_dias_mask ON rutina (dias_mask)")
+            filas = backfill_dias_mask(cur)
+            print(f"✅ rutina.dias_mask creado y rellenado ({filas} rutinas)")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+try:
+    ensure_dias_mask()
+except Exception:
+    pass
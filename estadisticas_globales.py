@@ -0,0 +1,257 @@
+"""
+Resúmenes globales para el panel de administración.
+
+Tablas pequeñas que el panel y las exportaciones CSV/PDF leen en lugar de
+recorrer item_diario, rutina_item y rutina en cada carga:
+
+    stats_diarias_tipo    (fecha, tipo) -> actividades completadas
+    stats_rutina          id_rutina -> completadas (días ya cerrados)
+    stats_usuario         user_id -> completadas (días ya cerrados)
+    stats_usuarios_nuevos fecha -> usuarios creados
+
+Los totales de usuarios y rutinas no se resumen: contar_totales() los cuenta
+en vivo con COUNT(*).
+
+refrescar() parte de la marca de agua (stats_watermark): recalcula en
+stats_diarias_tipo/stats_usuarios_nuevos los días >= marca y los
+DIAS_REABIERTOS anteriores (para recoger cambios tardíos en días pasados). El
+primer refresco de cada día recalcula enteros los rankings por rutina y
+usuario, que van, por tanto, hasta ayer.
+
+El panel llama a asegurar_refresco(): si el último refresco tiene más de
+STATS_REFRESCO_SEGUNDOS (300 por defecto) o es de otro día, lanza uno en
+segundo plano. También puede ir en cron:
+
+    python estadisticas_globales.py
+    python estadisticas_globales.py --reconstruir
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+from models.db import get_db_connection
+
+_TABLAS = """
+    CREATE TABLE IF NOT EXISTS stats_watermark (
+        nombre VARCHAR(50) PRIMARY KEY,
+        fecha DATE NOT NULL,
+        actualizado_en DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+    CREATE TABLE IF NOT EXISTS stats_diarias_tipo (
+        fecha DATE NOT NULL,
+        tipo VARCHAR(20) NOT NULL,
+        completadas INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (fecha, tipo)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+    CREATE TABLE IF NOT EXISTS stats_rutina (
+        id_rutina INT PRIMARY KEY,
+        completadas INT NOT NULL DEFAULT 0,
+        INDEX idx_stats_rutina_completadas (completadas),
+        FOREIGN KEY (id_rutina) REFERENCES rutina(id_rutina) ON DELETE CASCADE
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+    CREATE TABLE IF NOT EXISTS stats_usuario (
+        user_id INT PRIMARY KEY,
+        completadas INT NOT NULL DEFAULT 0,
+        INDEX idx_stats_usuario_completadas (completadas),
+        FOREIGN KEY (user_id) REFERENCES usuario(id) ON DELETE CASCADE
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+    CREATE TABLE IF NOT EXISTS stats_usuarios_nuevos (
+        fecha DATE PRIMARY KEY,
+        nuevos INT NOT NULL DEFAULT 0
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+_WATERMARK = 'global'
+
+DIAS_REABIERTOS = 7
+REFRESCO_MAX_EDAD = int(os.environ.get('STATS_REFRESCO_SEGUNDOS', 300))
+
+_refrescando = threading.Lock()  # un solo refresco en segundo plano por proceso
+
+
+def ensure_estadisticas_globales():
+    """Crea las tablas de resúmenes si faltan."""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            for sentencia in _TABLAS.split(';'):
+                if sentencia.strip():
+                    cur.execute(sentencia)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _marca_de_agua(cur, bloquear=False):
+    # FOR UPDATE: dos refrescos simultáneos no suman dos veces los mismos días
+    cur.execute('SELECT fecha FROM stats_watermark WHERE nombre = %s' + (' FOR UPDATE' if bloquear else ''),
+                (_WATERMARK,))
+    row = cur.fetchone()
+    return row['fecha'] if row else None
+
+
+def _primera_fecha(cur, hoy):
+    """Para la primera ejecución: la fecha más antigua con actividad o usuarios."""
+    cur.execute('SELECT MIN(fecha) AS f FROM item_diario')
+    primera_item = (cur.fetchone() or {}).get('f')
+    cur.execute('SELECT DATE(MIN(fecha_creacion)) AS f FROM usuario')
+    primer_usuario = (cur.fetchone() or {}).get('f')
+    return min([f for f in (primera_item, primer_usuario, hoy) if f is not None])
+
+
+def refrescar(hoy=None, reconstruir=False):
+    """Refresco incremental (o completo con reconstruir). Devuelve desde, hasta, rankings y segundos."""
+    hoy = hoy or date.today()
+    inicio = time.monotonic()
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            marca = None if reconstruir else _marca_de_agua(cur, bloquear=True)
+            if marca is None:
+                for tabla in ('stats_diarias_tipo', 'stats_usuarios_nuevos'):
+                    cur.execute(f'DELETE FROM {tabla}')
+                desde = _primera_fecha(cur, hoy)
+            else:
+                desde = min(marca, hoy - timedelta(days=DIAS_REABIERTOS))
+            rankings = marca is None or marca < hoy
+
+            # Actividades por día y tipo: días abiertos (>= marca) y los reabiertos
+            cur.execute('DELETE FROM stats_diarias_tipo WHERE fecha >= %s', (desde,))
+            cur.execute("""
+                INSERT INTO stats_diarias_tipo (fecha, tipo, completadas)
+                SELECT id.fecha, COALESCE(r.tipo, 'sin_tipo'), COUNT(*)
+                FROM item_diario id
+                JOIN rutina_item ri ON ri.id_item = id.id_item
+                JOIN rutina r ON r.id_rutina = ri.id_rutina
+                WHERE id.completado = 1 AND id.fecha >= %s
+                GROUP BY id.fecha, r.tipo
+            """, (desde,))
+
+            # Rankings por rutina y usuario: una vez al día se recalculan enteros
+            # con los días terminados (< hoy), así recogen también los cambios
+            # hechos después en días pasados
+            if rankings:
+                cur.execute('DELETE FROM stats_rutina')
+                cur.execute("""
+                    INSERT INTO stats_rutina (id_rutina, completadas)
+                    SELECT ri.id_rutina, COUNT(*)
+                    FROM item_diario id
+                    JOIN rutina_item ri ON ri.id_item = id.id_item
+                    WHERE id.completado = 1 AND id.fecha < %s
+                    GROUP BY ri.id_rutina
+                """, (hoy,))
+                cur.execute('DELETE FROM stats_usuario')
+                cur.execute("""
+                    INSERT INTO stats_usuario (user_id, completadas)
+                    SELECT id.id_usuario, COUNT(*)
+                    FROM item_diario id
+                    WHERE id.completado = 1 AND id.fecha < %s
+                    GROUP BY id.id_usuario
+                """, (hoy,))
+
+            # Usuarios nuevos por día
+            cur.execute('DELETE FROM stats_usuarios_nuevos WHERE fecha >= %s', (desde,))
+            cur.execute("""
+                INSERT INTO stats_usuarios_nuevos (fecha, nuevos)
+                SELECT DATE(fecha_creacion), COUNT(*)
+                FROM usuario
+                WHERE fecha_creacion >= %s
+                GROUP BY DATE(fecha_creacion)
+            """, (desde,))
+
+            cur.execute("""
+                INSERT INTO stats_watermark (nombre, fecha) VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE fecha = VALUES(fecha), actualizado_en = CURRENT_TIMESTAMP
+            """, (_WATERMARK, hoy))
+        conn.commit()
+    finally:
+        conn.close()
+
+    return {'desde': desde, 'hasta': hoy, 'rankings': rankings, 'segundos': time.monotonic() - inicio}
+
+
+def _refrescar_en_segundo_plano():
+    """Lanza refrescar() en un hilo (con su propia conexión) salvo que ya haya uno en marcha."""
+    if not _refrescando.acquire(blocking=False):
+        return
+
+    def _trabajo():
+        try:
+            refrescar()
+        except Exception as e:
+            print(f'⚠️ Refresco de resúmenes globales: {e}')
+        finally:
+            _refrescando.release()
+
+    threading.Thread(target=_trabajo, name='refresco-estadisticas', daemon=True).start()
+
+
+def asegurar_refresco(max_edad=None):
+    """
+    Si los resúmenes nunca se calcularon, los construye ahora (primera carga del
+    panel). Si el último refresco es de otro día o tiene más de max_edad
+    segundos, lanza uno en segundo plano y el panel sigue con los actuales.
+    """
+    max_edad = REFRESCO_MAX_EDAD if max_edad is None else max_edad
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT fecha, TIMESTAMPDIFF(SECOND, actualizado_en, NOW()) AS edad
+                FROM stats_watermark WHERE nombre = %s
+            """, (_WATERMARK,))
+            row = cur.fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        refrescar()
+    elif row['fecha'] < date.today() or (row['edad'] or 0) > max_edad:
+        _refrescar_en_segundo_plano()
+
+
+def version_datos(cur):
+    """Momento del último refresco: identifica la versión de los resúmenes (para cachear informes)."""
+    cur.execute('SELECT actualizado_en FROM stats_watermark WHERE nombre = %s', (_WATERMARK,))
+    row = cur.fetchone()
+    return str(row['actualizado_en']) if row else None
+
+
+def contar_totales(cur):
+    """Usuarios y rutinas (total y rutinas_<tipo>) en vivo: COUNT(*) baratos que no esperan al refresco."""
+    cur.execute('SELECT COUNT(*) AS total FROM usuario')
+    totales = {'usuarios': int(cur.fetchone()['total'])}
+    cur.execute("SELECT COALESCE(tipo, 'sin_tipo') AS tipo, COUNT(*) AS total FROM rutina GROUP BY tipo")
+    for row in cur.fetchall():
+        totales[f"rutinas_{row['tipo']}"] = int(row['total'])
+    totales['rutinas'] = sum(v for k, v in totales.items() if k.startswith('rutinas_'))
+    return totales
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Refresca los resúmenes globales del panel de administración.')
+    parser.add_argument('--reconstruir', action='store_true', help='Borra los resúmenes y los calcula desde cero.')
+    args = parser.parse_args(argv)
+
+    resumen = refrescar(reconstruir=args.reconstruir)
+    print(f"✅ Resúmenes globales del {resumen['desde']} al {resumen['hasta']}"
+          f"{' (rankings recalculados)' if resumen['rankings'] else ''} en {resumen['segundos']:.2f}s")
+    return 0
+
+
+try:
+    ensure_estadisticas_globales()
+except Exception:
+    pass
+
+
+if __name__ == '__main__':
+    sys.exit(main())
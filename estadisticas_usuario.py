@@ -30,110 +30,24 @@ def calcular_estadisticas_usuario(user_id):
         # 2. ESTADÍSTICAS DE CUMPLIMIENTO (últimos 30 días)
         fecha_inicio = date.today() - timedelta(days=30)
         
-        # Obtener días con rutinas programadas
+        # Resumen diario pre-agregado (user_daily_stats): una fila por día con tareas
         cursor.execute("""
-            SELECT DISTINCT DATE(fecha) as fecha_dia
-            FROM (
-                SELECT CURDATE() - INTERVAL (a.a + (10 * b.a) + (100 * c.a)) DAY as fecha
-                FROM (SELECT 0 AS a UNION ALL SELECT 1 UNION ALL SELECT 2 UNION ALL SELECT 3 UNION ALL SELECT 4 UNION ALL SELECT 5 UNION ALL SELECT 6 UNION ALL SELECT 7 UNION ALL SELECT 8 UNION ALL SELECT 9) AS a
-                CROSS JOIN (SELECT 0 AS a UNION ALL SELECT 1 UNION ALL SELECT 2 UNION ALL SELECT 3 UNION ALL SELECT 4 UNION ALL SELECT 5 UNION ALL SELECT 6 UNION ALL SELECT 7 UNION ALL SELECT 8 UNION ALL SELECT 9) AS b
-                CROSS JOIN (SELECT 0 AS a UNION ALL SELECT 1 UNION ALL SELECT 2 UNION ALL SELECT 3 UNION ALL SELECT 4 UNION ALL SELECT 5 UNION ALL SELECT 6 UNION ALL SELECT 7 UNION ALL SELECT 8 UNION ALL SELECT 9) AS c
-            ) fechas
-            WHERE fecha >= %s AND fecha <= CURDATE()
-            AND EXISTS (
-                SELECT 1 FROM rutina r 
-                WHERE r.id_usuario = %s 
-                AND FIND_IN_SET(
-                    CASE WEEKDAY(fecha)
-                        WHEN 0 THEN 'Lunes'
-                        WHEN 1 THEN 'Martes' 
-                        WHEN 2 THEN 'Miércoles'
-                        WHEN 3 THEN 'Jueves'
-                        WHEN 4 THEN 'Viernes'
-                        WHEN 5 THEN 'Sábado'
-                        WHEN 6 THEN 'Domingo'
-                    END, 
-                    r.dias
-                ) > 0
-            )
-        """, (fecha_inicio, user_id))
-        
-        dias_programados = cursor.fetchall()
-        total_dias_programados = len(dias_programados)
-        
-        # Obtener días completados
-        dias_completados = 0
-        if total_dias_programados > 0:
-            for dia_info in dias_programados:
-                fecha_dia = dia_info['fecha_dia']
-                
-                # Contar tareas del día
-                cursor.execute("""
-                    SELECT COUNT(*) as total_tareas
-                    FROM rutina r
-                    JOIN rutina_item ri ON r.id_rutina = ri.id_rutina
-                    WHERE r.id_usuario = %s 
-                    AND FIND_IN_SET(
-                        CASE WEEKDAY(%s)
-                            WHEN 0 THEN 'Lunes'
-                            WHEN 1 THEN 'Martes'
-                            WHEN 2 THEN 'Miércoles' 
-                            WHEN 3 THEN 'Jueves'
-                            WHEN 4 THEN 'Viernes'
-                            WHEN 5 THEN 'Sábado'
-                            WHEN 6 THEN 'Domingo'
-                        END, 
-                        r.dias
-                    ) > 0
-                """, (user_id, fecha_dia))
-                
-                total_tareas = cursor.fetchone()['total_tareas']
-                
-                if total_tareas > 0:
-                    # Contar tareas completadas
-                    cursor.execute("""
-                        SELECT COUNT(*) as completadas
-                        FROM item_diario id
-                        JOIN rutina_item ri ON id.id_item = ri.id_item
-                        JOIN rutina r ON ri.id_rutina = r.id_rutina
-                        WHERE id.id_usuario = %s 
-                        AND id.fecha = %s 
-                        AND id.completado = 1
-                        AND FIND_IN_SET(
-                            CASE WEEKDAY(%s)
-                                WHEN 0 THEN 'Lunes'
-                                WHEN 1 THEN 'Martes'
-                                WHEN 2 THEN 'Miércoles'
-                                WHEN 3 THEN 'Jueves'
-                                WHEN 4 THEN 'Viernes'
-                                WHEN 5 THEN 'Sábado'
-                                WHEN 6 THEN 'Domingo'
-                            END,
-                            r.dias
-                        ) > 0
-                    """, (user_id, fecha_dia, fecha_dia))
-                    
-                    completadas = cursor.fetchone()['completadas']
-                    
-                    if completadas == total_tareas:
-                        dias_completados += 1
+            SELECT COUNT(*) as dias_programados,
+                   COALESCE(SUM(is_complete), 0) as dias_completados,
+                   COALESCE(SUM(IF(is_complete, minutes, 0)), 0) as minutos_completados
+            FROM user_daily_stats
+            WHERE user_id = %s AND fecha BETWEEN %s AND CURDATE() AND scheduled > 0
+        """, (user_id, fecha_inicio))
+        resumen = cursor.fetchone()
+        total_dias_programados = int(resumen['dias_programados'] or 0)
+        dias_completados = int(resumen['dias_completados'] or 0)
+        tiempo_total_minutos = int(resumen['minutos_completados'] or 0)
         
         # Calcular porcentaje de cumplimiento
         porcentaje_cumplimiento = round((dias_completados / total_dias_programados * 100) if total_dias_programados > 0 else 0)
         
-        # 3. TIEMPO TOTAL ESTIMADO (basado en rutinas)
-        cursor.execute("""
-            SELECT SUM(ri.tiempo) as tiempo_total_minutos
-            FROM rutina r
-            JOIN rutina_item ri ON r.id_rutina = ri.id_rutina  
-            WHERE r.id_usuario = %s AND ri.tiempo IS NOT NULL
-        """, (user_id,))
-        
-        tiempo_result = cursor.fetchone()
-        tiempo_por_dia_minutos = tiempo_result['tiempo_total_minutos'] if tiempo_result['tiempo_total_minutos'] else 0
-        
-        # Estimar tiempo total basado en días completados
-        tiempo_total_horas = round((tiempo_por_dia_minutos * dias_completados) / 60, 1) if tiempo_por_dia_minutos > 0 else 0
+        # 3. TIEMPO TOTAL ESTIMADO (minutos de los días completados)
+        tiempo_total_horas = round(tiempo_total_minutos / 60, 1) if tiempo_total_minutos > 0 else 0
         
         # 4. ESTADÍSTICAS ADICIONALES
         cursor.execute("""
@@ -202,29 +116,14 @@ def obtener_estadisticas_racha_historica(user_id, dias=90):
         cursor.execute("""
             SELECT 
                 fecha,
-                COUNT(*) as tareas_completadas,
-                (SELECT COUNT(*) FROM rutina_item ri 
-                 JOIN rutina r ON ri.id_rutina = r.id_rutina 
-                 WHERE r.id_usuario = %s 
-                 AND FIND_IN_SET(
-                    CASE WEEKDAY(id.fecha)
-                        WHEN 0 THEN 'Lunes'
-                        WHEN 1 THEN 'Martes'
-                        WHEN 2 THEN 'Miércoles'
-                        WHEN 3 THEN 'Jueves' 
-                        WHEN 4 THEN 'Viernes'
-                        WHEN 5 THEN 'Sábado'
-                        WHEN 6 THEN 'Domingo'
-                    END,
-                    r.dias
-                 ) > 0) as tareas_programadas
-            FROM item_diario id
-            WHERE id.id_usuario = %s 
-            AND id.completado = 1
-            AND id.fecha >= %s
-            GROUP BY fecha
+                completed as tareas_completadas,
+                scheduled as tareas_programadas
+            FROM user_daily_stats
+            WHERE user_id = %s 
+            AND completed > 0
+            AND fecha >= %s
             ORDER BY fecha
-        """, (user_id, user_id, fecha_inicio))
+        """, (user_id, fecha_inicio))
         
         historial = cursor.fetchall()
         conn.close()
@@ -0,0 +1,116 @@
+"""
+Exportaciones CSV de datos crudos en streaming para el panel de administración.
+
+A diferencia del informe de estadísticas globales (que se arma en memoria),
+estas exportaciones pueden tener millones de filas: se leen con un cursor de
+servidor (SSCursor) y se envían al navegador en bloques, así que la memoria es
+constante. Usan los mismos filtros que /admin/global-statistics:
+
+    /admin/global-statistics?export=csv&datos=completados&tipo=estudio&periodo=año
+    /admin/global-statistics?export=csv&datos=usuarios&periodo=mes
+
+Cada exportación usa su propia conexión del pool (no la de la petición), porque
+el cuerpo se sigue generando después de que la vista haya devuelto la respuesta.
+"""
+
+import csv
+import io
+from datetime import date, timedelta
+
+import pymysql
+
+from models.db import get_pool
+
+# Mismos periodos que get_global_statistics
+DIAS_PERIODO = {'semana': 7, 'mes': 30, 'año': 365}
+
+FILAS_POR_BLOQUE = 1000
+
+# nombre -> (cabecera, consulta); {filtro_tipo} se sustituye por el filtro de tipo de rutina
+EXPORTACIONES = {
+    'completados': (
+        ['fecha', 'completado_en', 'id_usuario', 'usuario', 'id_rutina', 'rutina', 'tipo', 'item', 'minutos'],
+        """
+        SELECT id.fecha, id.completado_en, id.id_usuario, u.nombre, r.id_rutina, r.nombre, r.tipo,
+               ri.nombre_item, ri.tiempo
+        FROM item_diario id
+        JOIN rutina_item ri ON ri.id_item = id.id_item
+        JOIN rutina r ON r.id_rutina = ri.id_rutina
+        JOIN usuario u ON u.id = id.id_usuario
+        WHERE id.completado = 1 AND id.fecha >= %(desde)s {filtro_tipo}
+        ORDER BY id.fecha
+        """,
+    ),
+    'usuarios': (
+        ['fecha', 'id_usuario', 'usuario', 'actividades_completadas', 'minutos'],
+        """
+        SELECT id.fecha, id.id_usuario, u.nombre, COUNT(*), COALESCE(SUM(ri.tiempo), 0)
+        FROM item_diario id
+        JOIN rutina_item ri ON ri.id_item = id.id_item
+        JOIN rutina r ON r.id_rutina = ri.id_rutina
+        JOIN usuario u ON u.id = id.id_usuario
+        WHERE id.completado = 1 AND id.fecha >= %(desde)s {filtro_tipo}
+        GROUP BY id.fecha, id.id_usuario, u.nombre
+        ORDER BY id.fecha, id.id_usuario
+        """,
+    ),
+}
+
+
+def inicio_periodo(periodo, hoy=None):
+    """Primera fecha incluida en el periodo ('semana', 'mes' o 'año'; por defecto 'mes')."""
+    hoy = hoy or date.today()
+    return hoy - timedelta(days=DIAS_PERIODO.get(periodo, DIAS_PERIODO['mes']))
+
+
+def filas_csv(exportacion, filtro_tipo=None, periodo='mes'):
+    """
+    Generador de bloques de texto CSV (cabecera incluida) para la exportación
+    `exportacion`. Pensado para pasarlo a una respuesta Flask en streaming.
+    """
+    columnas, sql = EXPORTACIONES[exportacion]
+    params = {'desde': inicio_periodo(periodo)}
+    filtro = ''
+    if filtro_tipo:
+        filtro = 'AND r.tipo = %(tipo)s'
+        params['tipo'] = filtro_tipo
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+    writer.writerow(columnas)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    conn = get_pool().acquire()
+    terminado = False
+    try:
+        with conn.cursor() as cur:
+            # Un cliente lento no debe hacer que MySQL corte el envío de filas
+            cur.execute('SET SESSION net_write_timeout = 600')
+
+        # Sin with: cerrar un SSCursor lee (y descarta) todas las filas pendientes
+        cur = conn.cursor(pymysql.cursors.SSCursor)
+        cur.execute(sql.format(filtro_tipo=filtro), params)
+        pendientes = 0
+        for fila in cur:
+            writer.writerow(fila)
+            pendientes += 1
+            if pendientes == FILAS_POR_BLOQUE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pendientes = 0
+        if pendientes:
+            yield buffer.getvalue()
+        cur.close()
+
+        with conn.cursor() as cur:
+            cur.execute('SET SESSION net_write_timeout = DEFAULT')
+        terminado = True
+    finally:
+        if terminado:
+            conn.close()
+        else:
+            # Descarga cancelada o error a mitad: el resultado quedó sin leer
+            conn.discard()
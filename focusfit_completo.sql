@@ -28,10 +28,13 @@ CREATE TABLE rutina (
     duracion_horas INT DEFAULT 0,
     duracion_minutos INT DEFAULT 0,
     dias VARCHAR(100),                 -- Ej: "Lunes,Martes,Miércoles"
+    dias_mask TINYINT UNSIGNED NOT NULL DEFAULT 0,  -- Mismos días en bits: Lunes=1 ... Domingo=64
     horario TIME,
     fecha_creacion DATETIME DEFAULT CURRENT_TIMESTAMP,
     id_usuario INT,
-    FOREIGN KEY (id_usuario) REFERENCES usuario(id) ON DELETE CASCADE
+    FOREIGN KEY (id_usuario) REFERENCES usuario(id) ON DELETE CASCADE,
+    INDEX idx_rutina_usuario_dias_mask (id_usuario, dias_mask),
+    INDEX idx_rutina_dias_mask (dias_mask)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- ==========================
@@ -67,6 +70,57 @@ CREATE TABLE item_diario (
 CREATE INDEX idx_item_diario_usuario_fecha ON item_diario (id_usuario, fecha);
 CREATE INDEX idx_item_diario_completado ON item_diario (completado, fecha);
 
+-- ==========================
+-- TABLA: item_diario_generado (usuario/fecha con item_diario ya generado)
+-- ==========================
+CREATE TABLE item_diario_generado (
+    user_id INT NOT NULL,
+    fecha DATE NOT NULL,
+    generado_en DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, fecha),
+    FOREIGN KEY (user_id) REFERENCES usuario(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- ==========================
+-- TABLA: user_daily_stats (resumen diario: contador del motor de rachas y estadísticas)
+-- ==========================
+CREATE TABLE user_daily_stats (
+    user_id INT NOT NULL,
+    fecha DATE NOT NULL,
+    scheduled INT NOT NULL DEFAULT 0,       -- Items programados ese día
+    completed INT NOT NULL DEFAULT 0,       -- Items programados ya completados
+    minutes INT NOT NULL DEFAULT 0,         -- Minutos de los items completados
+    is_complete TINYINT(1) AS (scheduled > 0 AND completed >= scheduled) STORED,
+    PRIMARY KEY (user_id, fecha),
+    FOREIGN KEY (user_id) REFERENCES usuario(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- ==========================
+-- TABLA: streak_run (tramos de días consecutivos completos)
+-- ==========================
+CREATE TABLE streak_run (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    start_date DATE NOT NULL,
+    end_date DATE NOT NULL,
+    length INT NOT NULL,
+    UNIQUE KEY uniq_streak_run_inicio (user_id, start_date),
+    INDEX idx_streak_run_fin (user_id, end_date),
+    FOREIGN KEY (user_id) REFERENCES usuario(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- ==========================
+-- TABLA: user_day_load (carga programada por día de la semana, 0 = Lunes)
+-- ==========================
+CREATE TABLE user_day_load (
+    user_id INT NOT NULL,
+    weekday TINYINT NOT NULL,               -- date.weekday() / WEEKDAY(): 0 = Lunes ... 6 = Domingo
+    total_items INT NOT NULL DEFAULT 0,     -- Items de rutinas con ese día
+    total_minutes INT NOT NULL DEFAULT 0,   -- Suma de rutina_item.tiempo
+    PRIMARY KEY (user_id, weekday),
+    FOREIGN KEY (user_id) REFERENCES usuario(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
 -- ==========================
 -- TABLA: user_notifications (renombrada desde `notifications` para evitar conflictos)
 -- ==========================
@@ -79,11 +133,19 @@ CREATE TABLE user_notifications (
     is_read TINYINT(1) DEFAULT 0,
     fecha_envio DATETIME NULL,
     tipo VARCHAR(50) DEFAULT 'recordatorio',
+    rutina_id INT NULL,                     -- Rutina de origen (recordatorios)
+    kind VARCHAR(20) NOT NULL DEFAULT 'aviso', -- Origen: rutina, email_rutina, login, aviso
+    envio_reclamado DATETIME NULL,          -- Lote del repartidor de correo que lo está enviando
+    envio_intentos INT NOT NULL DEFAULT 0,  -- Envíos de correo fallidos
+    envio_siguiente DATETIME NULL,          -- Próximo reintento tras un fallo
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES usuario(id) ON DELETE CASCADE,
     INDEX (user_id),
     INDEX (is_read),
-    INDEX (fecha_programada)
+    INDEX (fecha_programada),
+    INDEX idx_notif_rutina (rutina_id),
+    INDEX idx_notif_envio (tipo, fecha_envio, fecha_programada),
+    UNIQUE KEY uniq_notif_origen (user_id, rutina_id, kind, fecha_programada)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- ==========================
@@ -112,6 +174,41 @@ CREATE TABLE log_admin (
     fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
+-- ==========================
+-- RESÚMENES GLOBALES DEL PANEL (estadisticas_globales.py)
+-- ==========================
+CREATE TABLE stats_watermark (
+    nombre VARCHAR(50) PRIMARY KEY,
+    fecha DATE NOT NULL,
+    actualizado_en DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE stats_diarias_tipo (
+    fecha DATE NOT NULL,
+    tipo VARCHAR(20) NOT NULL,
+    completadas INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, tipo)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE stats_rutina (
+    id_rutina INT PRIMARY KEY,
+    completadas INT NOT NULL DEFAULT 0,
+    INDEX idx_stats_rutina_completadas (completadas),
+    FOREIGN KEY (id_rutina) REFERENCES rutina(id_rutina) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE stats_usuario (
+    user_id INT PRIMARY KEY,
+    completadas INT NOT NULL DEFAULT 0,
+    INDEX idx_stats_usuario_completadas (completadas),
+    FOREIGN KEY (user_id) REFERENCES usuario(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE stats_usuarios_nuevos (
+    fecha DATE PRIMARY KEY,
+    nuevos INT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
 -- ==========================
 -- DATOS DE PRUEBA (OPCIONAL)
 -- ==========================
@@ -123,10 +220,10 @@ VALUES
 ('Admin FocusFit', 'admin@focusfit.com', 'admin123', 0, 0);
 
 -- Rutina de ejemplo
-INSERT INTO rutina (nombre, tipo, duracion_horas, duracion_minutos, dias, horario, id_usuario) 
+INSERT INTO rutina (nombre, tipo, duracion_horas, duracion_minutos, dias, dias_mask, horario, id_usuario) 
 VALUES 
-('Rutina Matutina', 'ejercicio', 1, 0, 'Lunes,Miércoles,Viernes', '07:00:00', 1),
-('Estudio Programación', 'estudio', 2, 0, 'Lunes,Martes,Miércoles,Jueves,Viernes', '09:00:00', 1);
+('Rutina Matutina', 'ejercicio', 1, 0, 'Lunes,Miércoles,Viernes', 21, '07:00:00', 1),
+('Estudio Programación', 'estudio', 2, 0, 'Lunes,Martes,Miércoles,Jueves,Viernes', 31, '09:00:00', 1);
 
 -- Items de rutina de ejemplo
 INSERT INTO rutina_item (id_rutina, nombre_item, series, repeticiones, tiempo, prioridad) 
@@ -139,6 +236,15 @@ VALUES
 (2, 'Hacer ejercicios', 1, 1, 60, 'alta'),
 (2, 'Proyecto personal', 1, 1, 30, 'media');
 
+-- Carga por día de la semana de las rutinas de ejemplo
+INSERT INTO user_day_load (user_id, weekday, total_items, total_minutes)
+VALUES
+(1, 0, 7, 160),
+(1, 1, 3, 120),
+(1, 2, 7, 160),
+(1, 3, 3, 120),
+(1, 4, 7, 160);
+
 
 -- Tablas mínimas para panel admin
 CREATE TABLE IF NOT EXISTS `admin` (
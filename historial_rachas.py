@@ -0,0 +1,128 @@
+"""
+Historial de rachas (streak_run) y mapa de calor.
+
+Cada fila de streak_run es un tramo de días consecutivos completos:
+(user_id, start_date, end_date, length). El motor de rachas actualiza el tramo
+abierto al cambiar current_streak (actualizar_tramo), liquidar_rachas.py lo
+hace en bloque y recalculo_rachas.py --todos reconstruye los tramos de cero.
+
+Las vistas de historial leen rangos por índice: streak_run por (user_id, end_date)
+y user_daily_stats por su clave primaria (user_id, fecha).
+"""
+
+from datetime import timedelta
+from models.db import get_db_connection
+
+
+def ensure_streak_run():
+    """Crea streak_run si falta."""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS streak_run (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    user_id INT NOT NULL,
+                    start_date DATE NOT NULL,
+                    end_date DATE NOT NULL,
+                    length INT NOT NULL,
+                    UNIQUE KEY uniq_streak_run_inicio (user_id, start_date),
+                    INDEX idx_streak_run_fin (user_id, end_date),
+                    FOREIGN KEY (user_id) REFERENCES usuario(id) ON DELETE CASCADE
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def actualizar_tramo(cursor, user_id, fecha, racha, completo):
+    """
+    Refleja en streak_run la racha de `fecha` tras un cambio: con el día completo
+    crea o extiende el tramo que termina en fecha; si el día deja de contar se
+    retira fecha de su tramo.
+    """
+    if completo and racha > 0:
+        cursor.execute("""
+            INSERT INTO streak_run (user_id, start_date, end_date, length)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE end_date = VALUES(end_date), length = VALUES(length)
+        """, (user_id, fecha - timedelta(days=racha - 1), fecha, racha))
+    else:
+        retirar_dia(cursor, user_id, fecha)
+
+
+def retirar_dia(cursor, user_id, fecha):
+    """Quita fecha del final de su tramo (borra el tramo si solo tenía ese día)."""
+    cursor.execute('DELETE FROM streak_run WHERE user_id = %s AND start_date = %s AND end_date = %s',
+                   (user_id, fecha, fecha))
+    cursor.execute("""
+        UPDATE streak_run SET end_date = DATE_SUB(end_date, INTERVAL 1 DAY), length = length - 1
+        WHERE user_id = %s AND end_date = %s
+    """, (user_id, fecha))
+
+
+def reemplazar_tramos(cursor, primero, ultimo, filas):
+    """Reconstrucción en bloque: borra los tramos de los usuarios [primero, ultimo] e inserta filas."""
+    cursor.execute('DELETE FROM streak_run WHERE user_id BETWEEN %s AND %s', (primero, ultimo))
+    if filas:
+        cursor.executemany(
+            'INSERT INTO streak_run (user_id, start_date, end_date, length) VALUES (%s, %s, %s, %s)', filas)
+
+
+def obtener_tramos(cursor, user_id, desde, hasta):
+    """Tramos que se solapan con [desde, hasta], por índice (user_id, end_date)."""
+    cursor.execute("""
+        SELECT start_date, end_date, length
+        FROM streak_run
+        WHERE user_id = %s AND end_date >= %s AND start_date <= %s
+        ORDER BY start_date
+    """, (user_id, desde, hasta))
+    return cursor.fetchall()
+
+
+def obtener_heatmap(cursor, user_id, desde, hasta):
+    """Días de user_daily_stats en el rango (solo días con tareas registradas)."""
+    cursor.execute("""
+        SELECT fecha, scheduled, completed
+        FROM user_daily_stats
+        WHERE user_id = %s AND fecha BETWEEN %s AND %s
+        ORDER BY fecha
+    """, (user_id, desde, hasta))
+    return cursor.fetchall()
+
+
+def historial(user_id, desde, hasta):
+    """Timeline y mapa de calor listos para JSON."""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            tramos = obtener_tramos(cur, user_id, desde, hasta)
+            dias = obtener_heatmap(cur, user_id, desde, hasta)
+    finally:
+        conn.close()
+
+    return {
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'tramos': [
+            {'inicio': t['start_date'].isoformat(), 'fin': t['end_date'].isoformat(), 'dias': t['length']}
+            for t in tramos
+        ],
+        'racha_maxima': max((t['length'] for t in tramos), default=0),
+        'heatmap': [
+            {
+                'fecha': d['fecha'].isoformat(),
+                'programadas': d['scheduled'],
+                'completadas': d['completed'],
+                'porcentaje': round(d['completed'] / d['scheduled'] * 100) if d['scheduled'] else 0,
+            }
+            for d in dias
+        ],
+    }
+
+
+try:
+    ensure_streak_run()
+except Exception:
+    pass
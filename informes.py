@@ -0,0 +1,141 @@
+"""
+Informes del panel de administración generados en segundo plano.
+
+Los informes (PDF/CSV de estadísticas globales) se encargan a un pool de hilos
+en lugar de construirse dentro de la petición. Cada informe se identifica por
+su clave, p. ej. (formato, filtro_tipo, periodo, versión de los datos), más el
+tramo de INFORMES_VENTANA segundos en que se pide: dentro del mismo tramo pedir
+dos veces el mismo informe lo genera una sola vez, y en el siguiente se vuelve a
+generar aunque la versión no haya cambiado (parte de los datos son en vivo).
+El resultado queda en disco y caduca a los INFORMES_TTL segundos.
+
+    cola = cola_informes()
+    id_informe = cola.enviar(('pdf', 'estudio', 'mes', version), 'pdf', lambda: generar_pdf(...))
+    cola.estado(id_informe)   # 'pendiente' | 'listo' | 'error' | 'desconocido'
+    cola.ruta(id_informe)     # ruta del fichero si está listo
+
+La cola es local a cada proceso; la caché en disco se comparte entre procesos
+que usen el mismo directorio.
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DIRECTORIO = os.environ.get('INFORMES_DIR',
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'informes_cache'))
+TTL = int(os.environ.get('INFORMES_TTL', 3600))
+VENTANA = int(os.environ.get('INFORMES_VENTANA', 300))
+TRABAJADORES = int(os.environ.get('INFORMES_WORKERS', 2))
+
+_ID_VALIDO = re.compile(r'[0-9a-f]{20}\.[a-z]{2,4}')
+
+
+class ColaInformes:
+    """Pool de hilos para generar informes y caché en disco de los resultados."""
+
+    def __init__(self, directorio=DIRECTORIO, ttl=TTL, trabajadores=TRABAJADORES, ventana=VENTANA):
+        self.directorio = directorio
+        self.ttl = ttl
+        self.ventana = ventana
+        self._executor = ThreadPoolExecutor(max_workers=trabajadores, thread_name_prefix='informe')
+        self._lock = threading.Lock()
+        self._pendientes = {}  # id -> Future
+        self._errores = {}     # id -> (momento, mensaje)
+        os.makedirs(directorio, exist_ok=True)
+
+    @staticmethod
+    def id_informe(clave, extension):
+        """Id estable para la clave; es también el nombre del fichero."""
+        return f"{hashlib.sha1(repr(clave).encode('utf-8')).hexdigest()[:20]}.{extension}"
+
+    def ruta(self, id_informe):
+        """Ruta del informe si existe y no ha caducado, o None."""
+        if not _ID_VALIDO.fullmatch(id_informe or ''):
+            return None
+        ruta = os.path.join(self.directorio, id_informe)
+        try:
+            if time.time() - os.path.getmtime(ruta) < self.ttl:
+                return ruta
+        except OSError:
+            pass
+        return None
+
+    def enviar(self, clave, extension, generar):
+        """
+        Encarga el informe `clave` (generar() devuelve sus bytes) y devuelve su id.
+        Si ya está en disco o en curso dentro del tramo actual no se vuelve a generar.
+        """
+        id_informe = self.id_informe((clave, int(time.time() // self.ventana)), extension)
+        self.limpiar()
+        if self.ruta(id_informe):
+            return id_informe
+        with self._lock:
+            if id_informe not in self._pendientes:
+                self._errores.pop(id_informe, None)
+                self._pendientes[id_informe] = self._executor.submit(self._generar, id_informe, generar)
+        return id_informe
+
+    def _generar(self, id_informe, generar):
+        try:
+            contenido = generar()
+            ruta = os.path.join(self.directorio, id_informe)
+            temporal = f'{ruta}.{threading.get_ident()}.tmp'
+            with open(temporal, 'wb') as f:
+                f.write(contenido)
+            os.replace(temporal, ruta)
+        except Exception as e:
+            print(f'❌ Error generando informe {id_informe}: {e}')
+            with self._lock:
+                self._errores[id_informe] = (time.time(), str(e))
+        finally:
+            with self._lock:
+                self._pendientes.pop(id_informe, None)
+
+    def estado(self, id_informe):
+        with self._lock:
+            if id_informe in self._pendientes:
+                return 'pendiente'
+            if id_informe in self._errores:
+                return 'error'
+        return 'listo' if self.ruta(id_informe) else 'desconocido'
+
+    def error(self, id_informe):
+        with self._lock:
+            _, mensaje = self._errores.get(id_informe, (None, None))
+            return mensaje
+
+    def limpiar(self):
+        """Borra los informes caducados (y temporales abandonados) y los errores viejos."""
+        limite = time.time() - self.ttl
+        with self._lock:
+            for id_informe in [i for i, (momento, _) in self._errores.items() if momento < limite]:
+                del self._errores[id_informe]
+        try:
+            nombres = os.listdir(self.directorio)
+        except OSError:
+            return
+        for nombre in nombres:
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                if os.path.getmtime(ruta) < limite:
+                    os.remove(ruta)
+            except OSError:
+                pass
+
+
+_cola = None
+_cola_lock = threading.Lock()
+
+
+def cola_informes():
+    """Devuelve la cola global, creándola la primera vez que se usa."""
+    global _cola
+    if _cola is None:
+        with _cola_lock:
+            if _cola is None:
+                _cola = ColaInformes()
+    return _cola
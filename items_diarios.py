@@ -0,0 +1,101 @@
+"""
+Generación de las filas de item_diario de un día.
+
+Una sola sentencia INSERT IGNORE ... SELECT crea las filas de todos los items
+programados ese día; la clave única unique_item_fecha (id_item, fecha) descarta
+las que ya existían. item_diario_generado marca (usuario, fecha) como generado
+para que las siguientes visitas a la página no repitan el trabajo. Al cambiar el
+horario de un usuario se borran sus marcas desde hoy (invalidar_generacion).
+"""
+
+from datetime import date
+from models.db import get_db_connection
+
+_GENERAR_SQL = """
+    INSERT IGNORE INTO item_diario (id_item, id_usuario, fecha, completado)
+    SELECT ri.id_item, r.id_usuario, %s, FALSE
+    FROM rutina r
+    JOIN rutina_item ri ON ri.id_rutina = r.id_rutina
+    WHERE {filtro} AND (r.dias_mask & (1 << WEEKDAY(%s))) <> 0
+"""
+
+
+def ensure_item_diario_generado():
+    """Crea la tabla de marcas de generación si falta."""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS item_diario_generado (
+                    user_id INT NOT NULL,
+                    fecha DATE NOT NULL,
+                    generado_en DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (user_id, fecha),
+                    FOREIGN KEY (user_id) REFERENCES usuario(id) ON DELETE CASCADE
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def generar_items_dia(cur, id_usuario, fecha):
+    """INSERT IGNORE ... SELECT de los items del día y marca de generado. Devuelve filas creadas."""
+    cur.execute(_GENERAR_SQL.format(filtro='r.id_usuario = %s'), (fecha, id_usuario, fecha))
+    creados = cur.rowcount
+    cur.execute('INSERT IGNORE INTO item_diario_generado (user_id, fecha) VALUES (%s, %s)', (id_usuario, fecha))
+    return creados
+
+
+def generar_items_usuarios(cur, ids_usuarios, fecha):
+    """Versión por lotes de generar_items_dia para una lista de usuarios (materializador)."""
+    if not ids_usuarios:
+        return 0
+    marcas = ', '.join(['%s'] * len(ids_usuarios))
+    cur.execute(_GENERAR_SQL.format(filtro=f'r.id_usuario IN ({marcas})'), (fecha, *ids_usuarios, fecha))
+    creados = cur.rowcount
+    cur.executemany('INSERT IGNORE INTO item_diario_generado (user_id, fecha) VALUES (%s, %s)',
+                    [(id_usuario, fecha) for id_usuario in ids_usuarios])
+    return creados
+
+
+def generar_items_diarios(id_usuario, fecha=None):
+    """
+    Genera los registros de item_diario de las rutinas del día si aún no se hizo.
+    Se llama al abrir lista_diaria, progreso y registros_actividades.
+    """
+    if fecha is None:
+        fecha = date.today()
+
+    try:
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1 FROM item_diario_generado WHERE user_id = %s AND fecha = %s',
+                            (id_usuario, fecha))
+                if cur.fetchone():
+                    return 0
+                items_creados = generar_items_dia(cur, id_usuario, fecha)
+            conn.commit()
+        finally:
+            conn.close()
+
+        if items_creados > 0:
+            print(f"✅ Generados {items_creados} items diarios para usuario {id_usuario} en {fecha}")
+        return items_creados
+
+    except Exception as e:
+        print(f"❌ Error generando items diarios: {e}")
+        return 0
+
+
+def invalidar_generacion(cur, id_usuario, desde=None):
+    """Borra las marcas desde esa fecha (hoy por defecto) tras un cambio de horario."""
+    cur.execute('DELETE FROM item_diario_generado WHERE user_id = %s AND fecha >= %s',
+                (id_usuario, desde or date.today()))
+
+
+try:
+    ensure_item_diario_generado()
+except Exception:
+    pass
@@ -0,0 +1,168 @@
+"""
+Liquidación nocturna de rachas.
+
+Tras la medianoche cierra el día anterior para todos los usuarios de una vez,
+en lugar de hacerlo la primera vez que cada usuario abre inicio. Por lotes de
+usuarios (por id):
+
+    1. Una tabla temporal recibe, con un INSERT ... SELECT, programadas
+       (user_day_load), completadas (item_diario) y la racha resultante.
+    2. user_daily_stats guarda el contador del día liquidado.
+    3. Un UPDATE ... JOIN deja current_streak, longest_streak, racha_base_hoy y
+       last_streak_date = hoy, igual que _abrir_dia en sistema_rachas_mejorado.
+    4. Los días completos extienden su tramo en streak_run.
+
+Racha resultante: racha_base_hoy + 1 si el día quedó completo (si el usuario no
+llegó a abrir ese día, la base es 0); 0 si quedó incompleto o no tenía tareas.
+Los usuarios con last_streak_date posterior al día ya están liquidados y se
+omiten, así que volver a ejecutarlo no cambia nada.
+
+Uso:
+    python liquidar_rachas.py                  # liquida ayer
+    python liquidar_rachas.py --fecha 2025-11-20 --dry-run
+"""
+
+import argparse
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from models.db import get_db_connection
+from models.dias import bit_dia
+from models import carga_dia as _carga_dia, historial_rachas as _historial  # user_day_load y streak_run
+
+_TMP = 'tmp_liquidacion_racha'
+
+_CALCULO_SQL = f"""
+    INSERT INTO {_TMP} (user_id, scheduled, completed, minutes, racha)
+    SELECT u.id,
+           COALESCE(l.total_items, 0),
+           COALESCE(c.completadas, 0),
+           COALESCE(c.minutos, 0),
+           IF(COALESCE(l.total_items, 0) > 0 AND COALESCE(c.completadas, 0) >= l.total_items,
+              IF(u.last_streak_date = %(fecha)s, COALESCE(u.racha_base_hoy, 0), 0) + 1,
+              0)
+    FROM usuario u
+    LEFT JOIN user_day_load l ON l.user_id = u.id AND l.weekday = %(weekday)s
+    LEFT JOIN (
+        SELECT id.id_usuario, COUNT(DISTINCT id.id_item) AS completadas, COALESCE(SUM(ri.tiempo), 0) AS minutos
+        FROM item_diario id
+        JOIN rutina_item ri ON ri.id_item = id.id_item
+        JOIN rutina r ON r.id_rutina = ri.id_rutina
+        WHERE id.fecha = %(fecha)s AND id.completado = 1
+        AND id.id_usuario BETWEEN %(primero)s AND %(ultimo)s
+        AND r.id_usuario = id.id_usuario AND (r.dias_mask & %(bit)s) <> 0
+        GROUP BY id.id_usuario
+    ) c ON c.id_usuario = u.id
+    WHERE u.id BETWEEN %(primero)s AND %(ultimo)s
+    AND (u.last_streak_date IS NULL OR u.last_streak_date <= %(fecha)s)
+"""
+
+
+def _fecha(valor):
+    return datetime.strptime(valor, '%Y-%m-%d').date()
+
+
+def liquidar_dia(fecha, lote=1000, dry_run=False):
+    """
+    Liquida el día `fecha` para todos los usuarios. Devuelve un resumen con
+    usuarios liquidados, completos, rachas rotas y segundos.
+    """
+    siguiente = fecha + timedelta(days=1)
+    params = {'fecha': fecha, 'weekday': fecha.weekday(), 'bit': bit_dia(fecha)}
+    resumen = {'usuarios': 0, 'completos': 0, 'rotas': 0, 'segundos': 0.0}
+    inicio = time.monotonic()
+    ultimo_id = 0
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f'DROP TEMPORARY TABLE IF EXISTS {_TMP}')
+            cur.execute(f"""
+                CREATE TEMPORARY TABLE {_TMP} (
+                    user_id INT PRIMARY KEY,
+                    scheduled INT NOT NULL,
+                    completed INT NOT NULL,
+                    minutes INT NOT NULL,
+                    racha INT NOT NULL
+                ) ENGINE=InnoDB
+            """)
+
+        while True:
+            with conn.cursor() as cur:
+                cur.execute('SELECT id FROM usuario WHERE id > %s ORDER BY id LIMIT %s', (ultimo_id, lote))
+                ids = [row['id'] for row in cur.fetchall()]
+                if not ids:
+                    break
+                ultimo_id = ids[-1]
+                t_lote = time.monotonic()
+
+                cur.execute(f'DELETE FROM {_TMP}')
+                cur.execute(_CALCULO_SQL, dict(params, primero=ids[0], ultimo=ultimo_id))
+                cur.execute(f"""
+                    SELECT COUNT(*) AS usuarios,
+                           COALESCE(SUM(t.racha > 0), 0) AS completos,
+                           COALESCE(SUM(t.racha = 0 AND u.current_streak > 0), 0) AS rotas
+                    FROM {_TMP} t JOIN usuario u ON u.id = t.user_id
+                """)
+                row = cur.fetchone()
+
+                if not dry_run:
+                    cur.execute(f"""
+                        INSERT INTO user_daily_stats (user_id, fecha, scheduled, completed, minutes)
+                        SELECT user_id, %s, scheduled, completed, minutes FROM {_TMP} WHERE scheduled > 0
+                        ON DUPLICATE KEY UPDATE scheduled = VALUES(scheduled), completed = VALUES(completed), minutes = VALUES(minutes)
+                    """, (fecha,))
+                    cur.execute(f"""
+                        UPDATE usuario u
+                        JOIN {_TMP} t ON t.user_id = u.id
+                        SET u.current_streak = t.racha,
+                            u.longest_streak = GREATEST(COALESCE(u.longest_streak, 0), t.racha),
+                            u.racha_base_hoy = t.racha,
+                            u.last_streak_date = %s
+                        WHERE u.last_streak_date IS NULL OR u.last_streak_date <= %s
+                    """, (siguiente, fecha))
+                    cur.execute(f"""
+                        INSERT INTO streak_run (user_id, start_date, end_date, length)
+                        SELECT user_id, DATE_SUB(%s, INTERVAL racha - 1 DAY), %s, racha FROM {_TMP} WHERE racha > 0
+                        ON DUPLICATE KEY UPDATE end_date = VALUES(end_date), length = VALUES(length)
+                    """, (fecha, fecha))
+            if dry_run:
+                conn.rollback()
+            else:
+                conn.commit()
+
+            for clave in ('usuarios', 'completos', 'rotas'):
+                resumen[clave] += int(row[clave] or 0)
+            print(f"{'🔎' if dry_run else '✅'} Usuarios {ids[0]}-{ultimo_id}: {row['usuarios']} liquidados, "
+                  f"{row['completos']} completos, {row['rotas']} rachas rotas ({time.monotonic() - t_lote:.2f}s)")
+
+        with conn.cursor() as cur:
+            cur.execute(f'DROP TEMPORARY TABLE IF EXISTS {_TMP}')
+    finally:
+        conn.close()
+
+    resumen['segundos'] = time.monotonic() - inicio
+    return resumen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Liquida las rachas del día anterior para todos los usuarios.')
+    parser.add_argument('--fecha', type=_fecha, help='Día a liquidar (YYYY-MM-DD). Por defecto, ayer.')
+    parser.add_argument('--lote', type=int, default=1000, help='Usuarios por lote (por defecto 1000).')
+    parser.add_argument('--dry-run', action='store_true', help='Calcula y muestra el resultado sin escribir.')
+    args = parser.parse_args(argv)
+
+    fecha = args.fecha or date.today() - timedelta(days=1)
+    if fecha >= date.today():
+        parser.error('solo se pueden liquidar días ya terminados')
+
+    print(f"🌙 Liquidando rachas del {fecha}{' (dry-run)' if args.dry_run else ''}")
+    resumen = liquidar_dia(fecha, args.lote, args.dry_run)
+    print(f"🏁 {resumen['usuarios']} usuarios, {resumen['completos']} completos, "
+          f"{resumen['rotas']} rachas rotas en {resumen['segundos']:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
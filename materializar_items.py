@@ -0,0 +1,128 @@
+"""
+Materializa item_diario de todos los usuarios para una fecha o un rango.
+
+Pensado para ejecutarse cada noche (cron) con la fecha del día siguiente, de
+modo que las páginas solo encuentren la marca de item_diario_generado y no
+generen nada. Recorre los usuarios por id en lotes: cada lote es un
+INSERT IGNORE ... SELECT por fecha y un commit. Tras cada lote se guarda el
+último id en el fichero de checkpoint, y --reanudar continúa desde ahí.
+
+Uso:
+    python materializar_items.py                          # mañana
+    python materializar_items.py --desde 2025-11-01 --hasta 2025-11-30
+    python materializar_items.py --desde 2025-11-01 --hasta 2025-11-30 --reanudar
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from models.db import get_db_connection
+from models.items_diarios import generar_items_usuarios
+
+CHECKPOINT_POR_DEFECTO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.materializar_items.json')
+
+
+def _fecha(valor):
+    return datetime.strptime(valor, '%Y-%m-%d').date()
+
+
+def _leer_checkpoint(ruta, desde, hasta):
+    """Último id completado si el checkpoint es del mismo rango; si no, 0."""
+    try:
+        with open(ruta, encoding='utf-8') as f:
+            datos = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if datos.get('desde') != desde.isoformat() or datos.get('hasta') != hasta.isoformat():
+        print(f"⚠️ El checkpoint {ruta} es de otro rango ({datos.get('desde')} - {datos.get('hasta')}); se empieza de cero")
+        return 0
+    return int(datos.get('ultimo_id') or 0)
+
+
+def _guardar_checkpoint(ruta, desde, hasta, ultimo_id):
+    tmp = ruta + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'desde': desde.isoformat(), 'hasta': hasta.isoformat(), 'ultimo_id': ultimo_id}, f)
+    os.replace(tmp, ruta)
+
+
+def materializar(desde, hasta, lote=500, desde_id=0, checkpoint=None):
+    """
+    Genera item_diario de todos los usuarios entre desde y hasta (ambas incluidas).
+    Devuelve un resumen con usuarios, filas creadas y segundos.
+    """
+    fechas = [desde + timedelta(days=i) for i in range((hasta - desde).days + 1)]
+    ultimo_id = desde_id
+    usuarios = 0
+    filas = 0
+    inicio = time.monotonic()
+
+    conn = get_db_connection()
+    try:
+        while True:
+            with conn.cursor() as cur:
+                cur.execute('SELECT id FROM usuario WHERE id > %s ORDER BY id LIMIT %s', (ultimo_id, lote))
+                ids = [row['id'] for row in cur.fetchall()]
+                if not ids:
+                    break
+                creadas_lote = 0
+                t_lote = time.monotonic()
+                for fecha in fechas:
+                    creadas_lote += generar_items_usuarios(cur, ids, fecha)
+            conn.commit()
+
+            ultimo_id = ids[-1]
+            usuarios += len(ids)
+            filas += creadas_lote
+            if checkpoint:
+                _guardar_checkpoint(checkpoint, desde, hasta, ultimo_id)
+
+            transcurrido = max(time.monotonic() - t_lote, 1e-6)
+            print(f"✅ Usuarios {ids[0]}-{ultimo_id}: {creadas_lote} filas "
+                  f"({creadas_lote / transcurrido:.0f} filas/s, {len(ids) * len(fechas) / transcurrido:.0f} usuario-días/s)")
+    finally:
+        conn.close()
+
+    segundos = time.monotonic() - inicio
+    return {'usuarios': usuarios, 'dias': len(fechas), 'filas': filas, 'segundos': segundos, 'ultimo_id': ultimo_id}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Materializa item_diario de todos los usuarios.')
+    parser.add_argument('--desde', type=_fecha, help='Primera fecha (YYYY-MM-DD). Por defecto, mañana.')
+    parser.add_argument('--hasta', type=_fecha, help='Última fecha (YYYY-MM-DD). Por defecto, igual a --desde.')
+    parser.add_argument('--lote', type=int, default=500, help='Usuarios por lote (por defecto 500).')
+    parser.add_argument('--checkpoint', default=CHECKPOINT_POR_DEFECTO, help='Fichero de checkpoint.')
+    parser.add_argument('--reanudar', action='store_true', help='Continuar desde el último usuario del checkpoint.')
+    args = parser.parse_args(argv)
+
+    desde = args.desde or date.today() + timedelta(days=1)
+    hasta = args.hasta or desde
+    if hasta < desde:
+        parser.error('--hasta no puede ser anterior a --desde')
+
+    desde_id = _leer_checkpoint(args.checkpoint, desde, hasta) if args.reanudar else 0
+    if desde_id:
+        print(f"↪️ Reanudando tras el usuario {desde_id}")
+
+    print(f"🗓️ Materializando item_diario del {desde} al {hasta} (lotes de {args.lote} usuarios)")
+    resumen = materializar(desde, hasta, args.lote, desde_id, args.checkpoint)
+
+    segundos = max(resumen['segundos'], 1e-6)
+    print(f"🏁 {resumen['usuarios']} usuarios x {resumen['dias']} días: {resumen['filas']} filas en "
+          f"{resumen['segundos']:.1f}s ({resumen['filas'] / segundos:.0f} filas/s)")
+
+    # Rango completo: el checkpoint ya no hace falta
+    try:
+        os.remove(args.checkpoint)
+    except OSError:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""
+Métricas de base de datos en formato texto de Prometheus.
+
+Registra la latencia de cada sentencia, las filas devueltas, las sentencias por
+petición y la espera por conexiones del pool. Se exponen en /metrics (app de
+usuario) y /admin/metrics (blueprint de administración), con METRICS_TOKEN o,
+en /admin/metrics, con sesión de administrador. Sin token solo se sirven en
+modo debug.
+"""
+
+import hmac
+import os
+import threading
+import time
+
+try:
+    from flask import current_app, g, has_request_context, request, Response
+except Exception:
+    current_app = None
+    g = None
+    request = None
+    Response = None
+
+    def has_request_context():
+        return False
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labelvalues):
+        key = tuple(labelvalues)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._series = {}   # labels -> [conteos por bucket, suma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        key = tuple(labelvalues)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = 'le="' + _format_number(float(bound)) + '"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_number(float(total))}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, fn):
+        """fn() devuelve líneas adicionales (p. ej. gauges calculados al vuelo)."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for fn in self._collectors:
+            try:
+                lines.extend(fn())
+            except Exception as e:
+                print('metrics collector error:', e)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+DB_STATEMENT_SECONDS = REGISTRY.register(Histogram(
+    'focusfit_db_statement_seconds', 'Latencia de cada sentencia SQL',
+    ('endpoint', 'operation'), LATENCY_BUCKETS))
+DB_STATEMENT_ROWS = REGISTRY.register(Histogram(
+    'focusfit_db_statement_rows', 'Filas devueltas o afectadas por sentencia',
+    ('endpoint', 'operation'), ROW_BUCKETS))
+DB_STATEMENTS_PER_REQUEST = REGISTRY.register(Histogram(
+    'focusfit_db_statements_per_request', 'Sentencias SQL ejecutadas por petición',
+    ('endpoint',), COUNT_BUCKETS))
+DB_SECONDS_PER_REQUEST = REGISTRY.register(Histogram(
+    'focusfit_db_request_seconds', 'Tiempo total en MySQL por petición',
+    ('endpoint',), LATENCY_BUCKETS))
+DB_POOL_WAIT_SECONDS = REGISTRY.register(Histogram(
+    'focusfit_db_pool_wait_seconds', 'Espera para obtener una conexión del pool',
+    (), LATENCY_BUCKETS))
+DB_POOL_TIMEOUTS = REGISTRY.register(Counter(
+    'focusfit_db_pool_timeouts_total', 'Peticiones de conexión que agotaron el tiempo de espera'))
+DB_STATEMENT_ERRORS = REGISTRY.register(Counter(
+    'focusfit_db_statement_errors_total', 'Sentencias SQL que lanzaron excepción',
+    ('endpoint', 'operation')))
+
+
+def _current_endpoint():
+    if has_request_context():
+        return request.endpoint or 'desconocido'
+    return 'fuera_de_peticion'
+
+
+def _operation(sql):
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    parts = str(sql).lstrip(' \t\r\n(').split(None, 1)
+    return parts[0].upper() if parts else 'OTRO'
+
+
+def observe_statement(sql, seconds, rows, error=False):
+    """Registra una sentencia ejecutada (la llama el cursor instrumentado de models.db)."""
+    endpoint = _current_endpoint()
+    operation = _operation(sql)
+    DB_STATEMENT_SECONDS.observe(seconds, endpoint, operation)
+    # Los cursores sin buffer (SSCursor) informan 2**64 - 1 filas: no se registran
+    if rows is not None and 0 <= rows < 2 ** 63:
+        DB_STATEMENT_ROWS.observe(rows, endpoint, operation)
+    if error:
+        DB_STATEMENT_ERRORS.inc(1, endpoint, operation)
+    if has_request_context():
+        stats = g.get('_db_stats')
+        if stats is not None:
+            stats['statements'] += 1
+            stats['seconds'] += seconds
+
+
+def observe_pool_wait(seconds, timed_out=False):
+    DB_POOL_WAIT_SECONDS.observe(seconds)
+    if timed_out:
+        DB_POOL_TIMEOUTS.inc()
+
+
+def render_prometheus():
+    return REGISTRY.render()
+
+
+def metrics_response(autorizado=False):
+    """
+    Respuesta Flask con las métricas. Exige METRICS_TOKEN (?token= o Bearer) salvo
+    que el llamador ya haya autorizado la petición (sesión de administrador).
+    Sin METRICS_TOKEN definido se deniegan, excepto en modo debug.
+    """
+    if not autorizado:
+        token = os.environ.get('METRICS_TOKEN')
+        if token:
+            provided = request.args.get('token') or request.headers.get('Authorization', '').replace('Bearer ', '', 1)
+            if not hmac.compare_digest(provided.encode('utf-8'), token.encode('utf-8')):
+                return Response('forbidden\n', status=403, mimetype='text/plain')
+        elif not current_app.debug:
+            return Response('forbidden: define METRICS_TOKEN\n', status=403, mimetype='text/plain')
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_app(app):
+    """Cuenta sentencias y tiempo de BD por petición."""
+
+    @app.before_request
+    def _metrics_begin_request():
+        g._db_stats = {'statements': 0, 'seconds': 0.0, 'start': time.perf_counter()}
+
+    @app.teardown_request
+    def _metrics_end_request(exc):
+        stats = g.pop('_db_stats', None)
+        if stats is None:
+            return
+        endpoint = request.endpoint or 'desconocido'
+        if endpoint == 'static':
+            return
+        DB_STATEMENTS_PER_REQUEST.observe(stats['statements'], endpoint)
+        DB_SECONDS_PER_REQUEST.observe(stats['seconds'], endpoint)
+
+    return app
@@ -1,7 +1,29 @@
 from datetime import datetime, date, time, timedelta
-from models.db import get_db_connection
+from models.db import al_confirmar, get_db_connection
+from time import monotonic as _monotonic
+from models.dias import masks_con_dia, nombre_dia
+from models.cache import TTLCache
 import pymysql
 
+# Contadores de no leídas para los context processors (por usuario y el global
+# del panel). Cada escritura en user_notifications invalida lo que cambia; la
+# TTL acota lo que tarda en verse un cambio hecho por otro proceso.
+_no_leidas = TTLCache(ttl=30, maxsize=10000, nombre='notificaciones_no_leidas')
+_TODAS = '__todas__'
+
+# Origen de la notificación (columna kind). Junto con rutina_id sustituye a los
+# antiguos marcadores en el mensaje ([RUTINA_ID:x], [EMAIL_RUTINA:x], [LOGIN_REMINDER]).
+KIND_RUTINA = 'rutina'
+KIND_EMAIL_RUTINA = 'email_rutina'
+KIND_LOGIN = 'login'
+KIND_AVISO = 'aviso'
+
+_MARCADORES = (
+    ('[RUTINA_ID:', KIND_RUTINA),
+    ('[EMAIL_RUTINA:', KIND_EMAIL_RUTINA),
+    ('[LOGIN_REMINDER]', KIND_LOGIN),
+)
+
 
 def ensure_notification_table():
     conn = get_db_connection()
@@ -17,10 +39,18 @@ def ensure_notification_table():
                     is_read TINYINT(1) DEFAULT 0,
                     fecha_envio DATETIME NULL,
                     tipo VARCHAR(50) DEFAULT 'recordatorio',
+                    rutina_id INT NULL,
+                    kind VARCHAR(20) NOT NULL DEFAULT 'aviso',
+                    envio_reclamado DATETIME NULL,
+                    envio_intentos INT NOT NULL DEFAULT 0,
+                    envio_siguiente DATETIME NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     INDEX (user_id),
                     INDEX (is_read),
-                    INDEX (fecha_programada)
+                    INDEX (fecha_programada),
+                    INDEX idx_notif_rutina (rutina_id),
+                    INDEX idx_notif_envio (tipo, fecha_envio, fecha_programada),
+                    UNIQUE KEY uniq_notif_origen (user_id, rutina_id, kind, fecha_programada)
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
             ''')
             needed = {
@@ -28,6 +58,9 @@ def ensure_notification_table():
                 'is_read': "TINYINT(1) DEFAULT 0",
                 'fecha_envio': "DATETIME NULL",
                 'tipo': "VARCHAR(50) DEFAULT 'recordatorio'",
+                'envio_reclamado': "DATETIME NULL",
+                'envio_intentos': "INT NOT NULL DEFAULT 0",
+                'envio_siguiente': "DATETIME NULL",
             }
             for col, col_def in needed.items():
                 cur.execute("SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'user_notifications' AND COLUMN_NAME = %s", (col,))
@@ -42,11 +75,102 @@ def ensure_notification_table():
                         print(f"[DB MIGRATE] Added column {col} to user_notifications")
                     except Exception as e:
                         print(f"[DB MIGRATE] Failed to add column {col}:", e)
+
+            cur.execute("SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'user_notifications' AND COLUMN_NAME = 'kind'")
+            exists = cur.fetchone()
+            count = exists[0] if isinstance(exists, (list, tuple)) else list(exists.values())[0]
+            if count == 0:
+                migrar_marcadores(cur)
+
+            # Índice de la cola de correos pendientes (tipo, fecha_envio IS NULL, rango de fechas)
+            cur.execute("SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'user_notifications' AND INDEX_NAME = 'idx_notif_envio'")
+            exists = cur.fetchone()
+            count = exists[0] if isinstance(exists, (list, tuple)) else list(exists.values())[0]
+            if count == 0:
+                cur.execute('ALTER TABLE user_notifications ADD INDEX idx_notif_envio (tipo, fecha_envio, fecha_programada)')
+                print('[DB MIGRATE] Added index idx_notif_envio to user_notifications')
         conn.commit()
     finally:
         conn.close()
 
 
+def migrar_marcadores(cur):
+    """
+    Migración única: añade rutina_id y kind, los rellena a partir de los
+    marcadores del mensaje (y los quita del texto), elimina duplicados y crea
+    la clave única (user_id, rutina_id, kind, fecha_programada).
+    """
+    cur.execute(f"ALTER TABLE user_notifications ADD COLUMN rutina_id INT NULL, ADD COLUMN kind VARCHAR(20) NOT NULL DEFAULT '{KIND_AVISO}'")
+    for marcador, kind in _MARCADORES:
+        if marcador.endswith(':'):
+            cur.execute("""
+                UPDATE user_notifications
+                SET kind = %s,
+                    rutina_id = CAST(SUBSTRING_INDEX(SUBSTRING(message, LENGTH(%s) + 1), ']', 1) AS UNSIGNED)
+                WHERE message LIKE %s
+            """, (kind, marcador, marcador + '%'))
+        else:
+            cur.execute('UPDATE user_notifications SET kind = %s WHERE message LIKE %s',
+                        (kind, marcador + '%'))
+        print(f"[DB MIGRATE] user_notifications: {cur.rowcount} filas con {marcador}")
+    cur.execute(f"""
+        UPDATE user_notifications
+        SET message = TRIM(SUBSTRING(message, LOCATE(']', message) + 1))
+        WHERE kind <> '{KIND_AVISO}' AND message LIKE '[%'
+    """)
+    # Duplicados exactos: se queda el más antiguo para poder crear la clave única
+    cur.execute("""
+        DELETE n FROM user_notifications n
+        JOIN user_notifications d
+          ON d.user_id = n.user_id AND d.rutina_id = n.rutina_id AND d.kind = n.kind
+         AND d.fecha_programada = n.fecha_programada AND d.id < n.id
+    """)
+    print(f"[DB MIGRATE] user_notifications: {cur.rowcount} duplicados eliminados")
+    cur.execute("""
+        ALTER TABLE user_notifications
+        ADD INDEX idx_notif_rutina (rutina_id),
+        ADD UNIQUE KEY uniq_notif_origen (user_id, rutina_id, kind, fecha_programada)
+    """)
+
+
+def contar_no_leidas(user_id=None):
+    """Notificaciones no leídas del usuario (o de todos con user_id=None), con caché."""
+    clave = _TODAS if user_id is None else user_id
+
+    def _contar():
+        conn = get_db_connection()
+        try:
+            with conn.cursor(pymysql.cursors.DictCursor) as cur:
+                if user_id is None:
+                    cur.execute('SELECT COUNT(*) AS total FROM user_notifications WHERE is_read = 0')
+                else:
+                    cur.execute('SELECT COUNT(*) AS total FROM user_notifications WHERE user_id = %s AND is_read = 0', (user_id,))
+                row = cur.fetchone()
+                return int(row.get('total', 0)) if row else 0
+        finally:
+            conn.close()
+
+    return _no_leidas.get_or_set(clave, _contar)
+
+
+def invalidar_no_leidas(user_id=None):
+    """Invalida el contador del usuario y el global; sin user_id, todos.
+    Tras escribir, llamar vía al_confirmar (ver models.db)."""
+    if user_id is None:
+        _no_leidas.clear()
+    else:
+        _no_leidas.delete(user_id)
+        _no_leidas.delete(_TODAS)
+
+
+def _usuario_de(cur, notification_id):
+    cur.execute('SELECT user_id FROM user_notifications WHERE id = %s', (notification_id,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    return row['user_id'] if isinstance(row, dict) else row[0]
+
+
 def create_notifications_for_routine(user_id, rutina_id, nombre, horario_time):
     if isinstance(horario_time, str):
         try:
@@ -65,16 +189,16 @@ def create_notifications_for_routine(user_id, rutina_id, nombre, horario_time):
     for minutes in intervals:
         due = scheduled + timedelta(minutes=minutes)
         title = f"Recordatorio: {nombre}"
-        message = f"[RUTINA_ID:{rutina_id}] Recordatorio: Rutina '{nombre}' programada a las {horario.strftime('%H:%M')}"
+        message = f"Recordatorio: Rutina '{nombre}' programada a las {horario.strftime('%H:%M')}"
         msgs.append((user_id, title, message, due))
 
     conn = get_db_connection()
     try:
         with conn.cursor() as cur:
-            sql = 'INSERT INTO user_notifications (user_id, title, message, fecha_programada, tipo) VALUES (%s, %s, %s, %s, %s)'
+            sql = 'INSERT IGNORE INTO user_notifications (user_id, title, message, fecha_programada, tipo, rutina_id, kind) VALUES (%s, %s, %s, %s, %s, %s, %s)'
             for u_id, title, msg, due in msgs:
                 try:
-                    cur.execute(sql, (u_id, title, msg, due, 'recordatorio'))
+                    cur.execute(sql, (u_id, title, msg, due, 'recordatorio', rutina_id, KIND_RUTINA))
                     try:
                         inserted_id = cur.lastrowid
                     except Exception:
@@ -85,6 +209,7 @@ def create_notifications_for_routine(user_id, rutina_id, nombre, horario_time):
         conn.commit()
     finally:
         conn.close()
+    al_confirmar(lambda: invalidar_no_leidas(user_id))
 
 
 def get_due_notifications(limit=20, user_id=None):
@@ -102,77 +227,129 @@ def get_due_notifications(limit=20, user_id=None):
         conn.close()
 
 
-def create_notifications_for_date(target_date):
-    dias_semana = {
-        'Monday': 'Lunes', 'Tuesday': 'Martes', 'Wednesday': 'Miércoles',
-        'Thursday': 'Jueves', 'Friday': 'Viernes', 'Saturday': 'Sábado', 'Sunday': 'Domingo'
-    }
-    day_name = dias_semana[target_date.strftime('%A')]
+OFFSETS_RECORDATORIO = [-6, -4, -2, 0, 2, 4]  # minutos respecto al horario de la rutina
+
+# Los ya creados (misma rutina, usuario y hora) los descarta la clave única
+_INSERT_RECORDATORIO = 'INSERT IGNORE INTO user_notifications (user_id, title, message, fecha_programada, tipo, rutina_id, kind) VALUES (%s, %s, %s, %s, %s, %s, %s)'
+
+
+def _hora(horario):
+    """rutina.horario (TIME llega como timedelta, o 'HH:MM[:SS]') como datetime.time; 09:00 si no se entiende."""
+    try:
+        parts = str(horario).split(':')
+        return time(int(parts[0]), int(parts[1]) if len(parts) > 1 else 0)
+    except Exception:
+        return time(9, 0)
+
+
+def filas_recordatorios(rutinas, target_date):
+    """Filas para _INSERT_RECORDATORIO: una por rutina y offset."""
+    filas = []
+    for r in rutinas:
+        base = datetime.combine(target_date, _hora(r['horario']))
+        title = f"Recordatorio: {r['nombre']}"
+        message = f"Recordatorio: Rutina '{r['nombre']}' programada a las {str(r['horario'])}"
+        for off in OFFSETS_RECORDATORIO:
+            filas.append((r['id_usuario'], title, message, base + timedelta(minutes=off), 'recordatorio',
+                          r['id_rutina'], KIND_RUTINA))
+    return filas
+
+
+def programar_dia(target_date, primero=None, ultimo=None, lote=5000):
+    """
+    Crea los recordatorios de target_date para todas las rutinas de ese día, o
+    solo las de usuarios con id entre primero y ultimo (para repartir el día
+    entre varios procesos). Una consulta trae las rutinas, las filas se calculan
+    en memoria y se escriben con INSERT IGNORE multi-fila en bloques de `lote`
+    (un commit por bloque). Devuelve rutinas, filas, insertadas y segundos.
+    """
+    inicio = _monotonic()
+    masks = masks_con_dia(nombre_dia(target_date))
+    sql = 'SELECT id_rutina, nombre, horario, id_usuario FROM rutina WHERE dias_mask IN (' + ','.join(['%s'] * len(masks)) + ')'
+    params = list(masks)
+    if primero is not None and ultimo is not None:
+        # Con rango usa el índice (id_usuario, dias_mask); sin él, idx_rutina_dias_mask
+        sql += ' AND id_usuario BETWEEN %s AND %s'
+        params += [primero, ultimo]
 
+    resumen = {'rutinas': 0, 'filas': 0, 'insertadas': 0, 'segundos': 0.0}
     conn = get_db_connection()
     try:
-        with conn.cursor() as cur:
-            cur.execute('SELECT id_rutina, nombre, horario, id_usuario FROM rutina WHERE dias LIKE %s', (f'%{day_name}%',))
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            cur.execute(sql, params)
             rutinas = cur.fetchall()
+            filas = filas_recordatorios(rutinas, target_date)
+            resumen['rutinas'] = len(rutinas)
+            resumen['filas'] = len(filas)
 
-            intervals = [-6, -4, -2, 0, 2, 4]
-            insert_sql = 'INSERT INTO user_notifications (user_id, title, message, fecha_programada, tipo) VALUES (%s, %s, %s, %s, %s)'
+            for i in range(0, len(filas), lote):
+                # pymysql convierte executemany de un INSERT ... VALUES en un INSERT multi-fila
+                cur.executemany(_INSERT_RECORDATORIO, filas[i:i + lote])
+                resumen['insertadas'] += max(cur.rowcount, 0)
+                conn.commit()
+    finally:
+        conn.close()
+    al_confirmar(invalidar_no_leidas)
 
-            for r in rutinas:
-                if isinstance(r, dict):
-                    rut_id = r.get('id_rutina')
-                    nombre = r.get('nombre')
-                    horario = r.get('horario')
-                    user_id = r.get('id_usuario')
-                else:
-                    try:
-                        rut_id, nombre, horario, user_id = r
-                    except Exception:
-                        continue
+    resumen['segundos'] = _monotonic() - inicio
+    return resumen
 
-                try:
-                    parts = str(horario).split(':')
-                    hh = int(parts[0]); mm = int(parts[1]) if len(parts) > 1 else 0
-                    from datetime import time as _time
-                    base_time = _time(hh, mm)
-                except Exception:
-                    from datetime import time as _time
-                    base_time = _time(9,0)
-
-                from datetime import datetime as _dt
-                for off in intervals:
-                    due = _dt.combine(target_date, base_time) + timedelta(minutes=off)
-                    marker = f"[RUTINA_ID:{rut_id}]"
-                    cur.execute('SELECT id FROM user_notifications WHERE message LIKE %s AND fecha_programada = %s AND user_id = %s', (f"%{marker}%", due, user_id))
-                    if cur.fetchone():
-                        continue
-                    title = f"Recordatorio: {nombre}"
-                    message = f"{marker} Recordatorio: Rutina '{nombre}' programada a las {str(horario)}"
-                    cur.execute(insert_sql, (user_id, title, message, due, 'recordatorio'))
+
+def create_notifications_for_date(target_date):
+    return programar_dia(target_date)
+
+
+def mark_delivered(notification_id, user_id=None):
+    """Marca la notificación como entregada; con user_id, solo si es de ese usuario."""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            if user_id is None:
+                cur.execute('UPDATE user_notifications SET is_read = 1, fecha_envio = %s WHERE id = %s', (datetime.now(), notification_id))
+                user_id = _usuario_de(cur, notification_id)
+            else:
+                cur.execute('UPDATE user_notifications SET is_read = 1, fecha_envio = %s WHERE id = %s AND user_id = %s',
+                            (datetime.now(), notification_id, user_id))
         conn.commit()
     finally:
         conn.close()
+    if user_id is not None:
+        al_confirmar(lambda: invalidar_no_leidas(user_id))
 
 
-def mark_delivered(notification_id):
+def mark_delivered_many(notification_ids, user_id=None):
+    """Confirma varias entregas en una sola sentencia (acuses agrupados del navegador).
+    Con user_id solo toca las notificaciones de ese usuario."""
+    ids = list(notification_ids)
+    if not ids:
+        return
+    marcas = ','.join(['%s'] * len(ids))
     conn = get_db_connection()
     try:
-        with conn.cursor() as cur:
-            cur.execute('UPDATE user_notifications SET is_read = 1, fecha_envio = %s WHERE id = %s', (datetime.now(), notification_id))
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            if user_id is None:
+                cur.execute(f'UPDATE user_notifications SET is_read = 1, fecha_envio = %s WHERE id IN ({marcas})', [datetime.now()] + ids)
+                cur.execute(f'SELECT DISTINCT user_id FROM user_notifications WHERE id IN ({marcas})', ids)
+                usuarios = [row['user_id'] for row in cur.fetchall()]
+            else:
+                cur.execute(f'UPDATE user_notifications SET is_read = 1, fecha_envio = %s WHERE id IN ({marcas}) AND user_id = %s',
+                            [datetime.now()] + ids + [user_id])
+                usuarios = [user_id]
         conn.commit()
     finally:
         conn.close()
+    al_confirmar(lambda: [invalidar_no_leidas(user_id) for user_id in usuarios])
 
 
 def delete_notifications_for_routine(rutina_id):
-    marker = f"[RUTINA_ID:{rutina_id}]"
     conn = get_db_connection()
     try:
         with conn.cursor() as cur:
-            cur.execute('DELETE FROM user_notifications WHERE message LIKE %s', (f"%{marker}%",))
+            cur.execute('DELETE FROM user_notifications WHERE rutina_id = %s', (rutina_id,))
         conn.commit()
     finally:
         conn.close()
+    al_confirmar(invalidar_no_leidas)
 
 
 def create_email_reminder_for_routine(user_id, rutina_id, nombre, horario_time, minutes_before=30):
@@ -191,20 +368,20 @@ def create_email_reminder_for_routine(user_id, rutina_id, nombre, horario_time,
 
     target_dt = datetime.combine(date.today(), horario) - timedelta(minutes=minutes_before)
     title = f"Recuerda tu rutina: {nombre}"
-    marker = f"[EMAIL_RUTINA:{rutina_id}]"
-    message = f"{marker} Te recordamos tu rutina '{nombre}' y te animamos a completarla hoy. ¡Tú puedes!"
+    message = f"Te recordamos tu rutina '{nombre}' y te animamos a completarla hoy. ¡Tú puedes!"
 
     conn = get_db_connection()
     try:
         with conn.cursor() as cur:
-            # Evitar duplicados exactos
-            cur.execute('SELECT id FROM user_notifications WHERE message LIKE %s AND fecha_programada = %s AND user_id = %s', (f"%{marker}%", target_dt, user_id))
-            if cur.fetchone():
-                return
-            cur.execute('INSERT INTO user_notifications (user_id, title, message, fecha_programada, tipo) VALUES (%s, %s, %s, %s, %s)', (user_id, title, message, target_dt, 'email_once'))
+            # Duplicados exactos: los descarta la clave única
+            cur.execute('INSERT IGNORE INTO user_notifications (user_id, title, message, fecha_programada, tipo, rutina_id, kind) VALUES (%s, %s, %s, %s, %s, %s, %s)',
+                        (user_id, title, message, target_dt, 'email_once', rutina_id, KIND_EMAIL_RUTINA))
+            insertada = cur.rowcount > 0
     finally:
         conn.commit()
         conn.close()
+    if insertada:
+        al_confirmar(lambda: invalidar_no_leidas(user_id))
 
 
 def get_pending_email_reminders(limit=100):
@@ -228,14 +405,174 @@ def get_pending_email_reminders(limit=100):
         conn.close()
 
 
+def notificaciones_en_ventana(desde, hasta):
+    """Pendientes (no leídas) con fecha_programada en [desde, hasta), por el índice de fecha_programada.
+    Retorna filas con campos: id, user_id, title, message, fecha_programada, tipo, correo
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            cur.execute("""
+                SELECT n.id, n.user_id, n.title, n.message, n.fecha_programada, n.tipo, u.correo
+                FROM user_notifications n
+                JOIN usuario u ON u.id = n.user_id
+                WHERE n.fecha_programada >= %s AND n.fecha_programada < %s AND n.is_read = 0
+                ORDER BY n.fecha_programada ASC
+            """, (desde, hasta))
+            return cur.fetchall()
+    finally:
+        conn.close()
+
+
+def ultimo_id_notificacion():
+    """Mayor id de user_notifications (0 si está vacía); extremo de la clave primaria."""
+    conn = get_db_connection()
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            cur.execute('SELECT COALESCE(MAX(id), 0) AS ultimo FROM user_notifications')
+            return int(cur.fetchone()['ultimo'])
+    finally:
+        conn.close()
+
+
+def notificaciones_creadas(despues_de_id, hasta_id, desde, hasta):
+    """Pendientes con id en (despues_de_id, hasta_id] (rango por clave primaria) y
+    fecha_programada en [desde, hasta). Mismos campos que notificaciones_en_ventana.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            cur.execute("""
+                SELECT n.id, n.user_id, n.title, n.message, n.fecha_programada, n.tipo, u.correo
+                FROM user_notifications n
+                JOIN usuario u ON u.id = n.user_id
+                WHERE n.id > %s AND n.id <= %s
+                AND n.fecha_programada >= %s AND n.fecha_programada < %s AND n.is_read = 0
+                ORDER BY n.fecha_programada ASC
+            """, (despues_de_id, hasta_id, desde, hasta))
+            return cur.fetchall()
+    finally:
+        conn.close()
+
+
+def ids_sin_leer(notification_ids):
+    """De los ids dados, los que siguen existiendo sin leer (consulta por clave primaria)."""
+    ids = list(notification_ids)
+    if not ids:
+        return set()
+    conn = get_db_connection()
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            cur.execute('SELECT id FROM user_notifications WHERE id IN (' + ','.join(['%s'] * len(ids)) + ') AND is_read = 0', ids)
+            return {row['id'] for row in cur.fetchall()}
+    finally:
+        conn.close()
+
+
+RECLAMO_EMAIL_MAX = timedelta(minutes=10)  # un reclamo más viejo es de un proceso caído: se puede volver a reclamar
+INTENTOS_EMAIL_MAX = 6  # tras tantos fallos (correo inválido, 550...) se deja de intentar
+
+
+def reclamar_recordatorios_email(limit=100, antiguedad_max=timedelta(days=1)):
+    """
+    Reclama un lote de recordatorios 'email_once' vencidos en una transacción
+    corta: FOR UPDATE SKIP LOCKED (por idx_notif_envio), marca envio_reclamado
+    y confirma. Van primero las que nunca fallaron; las fallidas esperan a su
+    envio_siguiente, así no acaparan el lote. Devuelve las filas con el correo
+    del usuario.
+    """
+    now = datetime.now()
+    conn = get_db_connection()
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            cur.execute("""
+                SELECT id, user_id, title, message, fecha_programada
+                FROM user_notifications
+                WHERE tipo = 'email_once' AND fecha_envio IS NULL
+                AND fecha_programada >= %s AND fecha_programada <= %s
+                AND (envio_reclamado IS NULL OR envio_reclamado < %s)
+                AND envio_intentos < %s AND (envio_siguiente IS NULL OR envio_siguiente <= %s)
+                ORDER BY envio_intentos ASC, fecha_programada ASC
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, (now - antiguedad_max, now, now - RECLAMO_EMAIL_MAX, INTENTOS_EMAIL_MAX, now, limit))
+            filas = cur.fetchall()
+            if filas:
+                marcas = ','.join(['%s'] * len(filas))
+                cur.execute(f'UPDATE user_notifications SET envio_reclamado = %s WHERE id IN ({marcas})',
+                            [now] + [f['id'] for f in filas])
+        conn.commit()
+        if filas:
+            # Fuera de la transacción del reclamo: no bloquea filas de usuario
+            with conn.cursor(pymysql.cursors.DictCursor) as cur:
+                user_ids = sorted({f['user_id'] for f in filas})
+                cur.execute('SELECT id, correo FROM usuario WHERE id IN (' + ','.join(['%s'] * len(user_ids)) + ')', user_ids)
+                correos = {row['id']: row['correo'] for row in cur.fetchall()}
+            conn.commit()
+            for fila in filas:
+                fila['correo'] = correos.get(fila['user_id'])
+        return filas
+    finally:
+        conn.close()
+
+
+def procesar_recordatorios_email(enviar, limit=100, antiguedad_max=timedelta(days=1)):
+    """
+    Envía un lote de recordatorios 'email_once' vencidos: los reclama
+    (reclamar_recordatorios_email), llama a enviar(fila) para cada uno sin
+    ninguna transacción abierta y marca las enviadas con un solo UPDATE. Las
+    que fallan se reintentan con espera creciente (1, 2, 4... minutos, hasta
+    una hora) hasta INTENTOS_EMAIL_MAX veces y mientras no tengan más de
+    antiguedad_max. Devuelve (enviadas, fallidas).
+    """
+    filas = reclamar_recordatorios_email(limit, antiguedad_max)
+    enviadas = []
+    fallidas = []
+    for fila in filas:
+        try:
+            enviar(fila)
+            enviadas.append(fila)
+        except Exception as e:
+            fallidas.append(fila)
+            print(f"⚠️ No se pudo enviar el recordatorio {fila['id']} a {fila['correo']}: {e}")
+    if not filas:
+        return 0, 0
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            if enviadas:
+                marcas = ','.join(['%s'] * len(enviadas))
+                cur.execute(f'UPDATE user_notifications SET fecha_envio = %s, is_read = 1, envio_reclamado = NULL WHERE id IN ({marcas})',
+                            [datetime.now()] + [f['id'] for f in enviadas])
+            if fallidas:
+                marcas = ','.join(['%s'] * len(fallidas))
+                cur.execute(f"""
+                    UPDATE user_notifications
+                    SET envio_reclamado = NULL,
+                        envio_siguiente = DATE_ADD(%s, INTERVAL LEAST(60 * POW(2, envio_intentos), 3600) SECOND),
+                        envio_intentos = envio_intentos + 1
+                    WHERE id IN ({marcas})
+                """, [datetime.now()] + [f['id'] for f in fallidas])
+        conn.commit()
+    finally:
+        conn.close()
+    usuarios = {f['user_id'] for f in enviadas}
+    al_confirmar(lambda: [invalidar_no_leidas(user_id) for user_id in usuarios])
+    return len(enviadas), len(fallidas)
+
+
 def mark_notification_sent(notification_id):
     conn = get_db_connection()
     try:
         with conn.cursor() as cur:
             cur.execute('UPDATE user_notifications SET fecha_envio = %s, is_read = 1 WHERE id = %s', (datetime.now(), notification_id))
+            user_id = _usuario_de(cur, notification_id)
         conn.commit()
     finally:
         conn.close()
+    if user_id is not None:
+        al_confirmar(lambda: invalidar_no_leidas(user_id))
 
 
 try:
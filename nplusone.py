@@ -0,0 +1,177 @@
+"""
+Detector de consultas N+1 para desarrollo y CI.
+
+Cada sentencia que pasa por el cursor instrumentado de models.db se normaliza
+(literales, listas IN y espacios) y se cuenta por "forma". Si una misma forma se
+ejecuta más de FOCUSFIT_NPLUSONE_UMBRAL veces en una petición (o dentro de
+detectar_n_mas_1() en scripts), se informa junto con las líneas del proyecto que
+la lanzaron.
+
+Variables de entorno:
+    FOCUSFIT_NPLUSONE         '' (solo con app.debug), 'warn', 'raise' o '0' (apagado)
+    FOCUSFIT_NPLUSONE_UMBRAL  repeticiones permitidas por forma (por defecto 5)
+"""
+
+import os
+import re
+import threading
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    from flask import g, has_request_context, request
+except Exception:
+    g = None
+    request = None
+
+    def has_request_context():
+        return False
+
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(_HERE) if os.path.basename(_HERE) == 'models' else _HERE
+_IGNORED_FILES = {'db.py', 'metrics.py', 'nplusone.py'}
+
+_RE_COMMENT = re.compile(r'(--[^\n]*|/\*.*?\*/)', re.S)
+_RE_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_RE_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_RE_PLACEHOLDER = re.compile(r'%\(\w+\)s|%s')
+_RE_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.I)
+_TUPLA = r'\(\s*\?(?:\s*,\s*\?)*\s*\)'
+_RE_VALUES_LIST = re.compile(r'\bVALUES\s*' + _TUPLA + r'(?:\s*,\s*' + _TUPLA + r')*', re.I)
+_RE_TUPLE_LIST = re.compile(_TUPLA + r'(?:\s*,\s*' + _TUPLA + r')+')
+_RE_SPACES = re.compile(r'\s+')
+
+_local = threading.local()
+
+
+class NPlusOneError(RuntimeError):
+    """Se lanza en modo 'raise' cuando una petición supera el umbral."""
+
+
+def normalize_sql(sql):
+    """Reduce una sentencia a su forma: sin literales, listas IN colapsadas y espacios únicos."""
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    sql = _RE_COMMENT.sub(' ', str(sql))
+    sql = _RE_STRING.sub('?', sql)
+    sql = _RE_PLACEHOLDER.sub('?', sql)
+    sql = _RE_NUMBER.sub('?', sql)
+    sql = _RE_IN_LIST.sub('IN (?)', sql)
+    sql = _RE_VALUES_LIST.sub('VALUES (?)', sql)
+    sql = _RE_TUPLE_LIST.sub('(?)', sql)
+    return _RE_SPACES.sub(' ', sql).strip()
+
+
+def _call_site():
+    """Primera línea del proyecto (fuera de la capa de BD) que lanzó la sentencia."""
+    for frame in reversed(traceback.extract_stack()[:-1]):
+        filename = os.path.abspath(frame.filename)
+        if not filename.startswith(PROJECT_DIR) or 'site-packages' in filename:
+            continue
+        if os.path.basename(filename) in _IGNORED_FILES:
+            continue
+        return f'{os.path.relpath(filename, PROJECT_DIR)}:{frame.lineno} ({frame.name})'
+    return 'desconocido'
+
+
+class QueryRecorder:
+    """Cuenta formas de sentencia y sus call sites."""
+
+    def __init__(self, umbral=None, modo='warn'):
+        self.umbral = umbral if umbral is not None else int(os.environ.get('FOCUSFIT_NPLUSONE_UMBRAL', '5'))
+        self.modo = modo
+        self.shapes = Counter()
+        self.sites = {}
+
+    def record(self, sql):
+        shape = normalize_sql(sql)
+        self.shapes[shape] += 1
+        self.sites.setdefault(shape, Counter())[_call_site()] += 1
+
+    def offenders(self):
+        """[(forma, veces, [(call site, veces), ...])] de las formas por encima del umbral."""
+        return [
+            (shape, count, self.sites[shape].most_common())
+            for shape, count in self.shapes.most_common()
+            if count > self.umbral
+        ]
+
+    def report(self, contexto=''):
+        lines = []
+        for shape, count, sites in self.offenders():
+            lines.append(f'⚠️ N+1 {contexto}: {count}x {shape}')
+            for site, n in sites[:5]:
+                lines.append(f'      {n}x desde {site}')
+        return '\n'.join(lines)
+
+    def check(self, contexto=''):
+        """Imprime el informe y, en modo 'raise', lanza NPlusOneError."""
+        text = self.report(contexto)
+        if not text:
+            return
+        print(text)
+        if self.modo == 'raise':
+            raise NPlusOneError(text)
+
+
+def _active_recorder():
+    if has_request_context():
+        recorder = g.get('_nplusone')
+        if recorder is not None:
+            return recorder
+    return getattr(_local, 'recorder', None)
+
+
+def record(sql):
+    """Llamado por el cursor instrumentado; no hace nada si no hay grabador activo."""
+    recorder = _active_recorder()
+    if recorder is not None:
+        recorder.record(sql)
+
+
+@contextmanager
+def detectar_n_mas_1(umbral=None, modo='warn', contexto='script'):
+    """Para scripts y tareas: graba las sentencias del bloque y las revisa al salir."""
+    previous = getattr(_local, 'recorder', None)
+    recorder = _local.recorder = QueryRecorder(umbral, modo)
+    try:
+        yield recorder
+    finally:
+        _local.recorder = previous
+    recorder.check(contexto)
+
+
+def _mode_for(app):
+    modo = os.environ.get('FOCUSFIT_NPLUSONE', '').strip().lower()
+    if modo in ('0', 'off', 'false', 'no'):
+        return None
+    if modo in ('warn', 'raise'):
+        return modo
+    if modo in ('1', 'true', 'on', 'yes'):
+        return 'warn'
+    return 'warn' if app.debug else None
+
+
+def init_app(app):
+    """Activa el grabador por petición en modo debug o si FOCUSFIT_NPLUSONE lo pide."""
+
+    @app.before_request
+    def _nplusone_begin_request():
+        modo = _mode_for(app)
+        if modo:
+            g._nplusone = QueryRecorder(modo=modo)
+
+    @app.after_request
+    def _nplusone_check_request(response):
+        recorder = g.pop('_nplusone', None)
+        if recorder is None:
+            return response
+        offenders = recorder.offenders()
+        if offenders:
+            response.headers['X-FocusFit-NPlusOne'] = str(len(offenders))
+            recorder.check(f'{request.method} {request.path}')
+        return response
+
+    return app
@@ -0,0 +1,89 @@
+"""
+Programa los recordatorios de rutina de un día para todos los usuarios.
+
+Sustituye a llamar create_notifications_for_date en bucle: una consulta trae
+las rutinas del día, las filas (6 recordatorios por rutina) se calculan en
+memoria y se escriben con INSERT IGNORE multi-fila por bloques. La clave única
+de user_notifications descarta lo ya programado, así que se puede repetir.
+
+Para llenar el día en paralelo, cada proceso toma un tramo de ids de usuario:
+
+    python programar_notificaciones.py                         # mañana
+    python programar_notificaciones.py --fecha 2025-11-21 --lote 10000
+    python programar_notificaciones.py --shard 0/4 &            # 4 procesos
+    python programar_notificaciones.py --shard 1/4 &
+    python programar_notificaciones.py --desde-id 1 --hasta-id 50000
+"""
+
+import argparse
+import sys
+from datetime import date, datetime, timedelta
+
+from models.db import get_db_connection
+from models.notification import programar_dia
+
+
+def _fecha(valor):
+    return datetime.strptime(valor, '%Y-%m-%d').date()
+
+
+def _shard(valor):
+    try:
+        k, n = (int(x) for x in valor.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('usa K/N, p. ej. 0/4')
+    if n < 1 or not 0 <= k < n:
+        raise argparse.ArgumentTypeError('K debe estar entre 0 y N-1')
+    return k, n
+
+
+def rango_shard(k, n):
+    """Tramo [primero, ultimo] de ids de usuario del shard k de n (partes iguales entre MIN(id) y MAX(id))."""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT MIN(id) AS primero, MAX(id) AS ultimo FROM usuario')
+            row = cur.fetchone() or {}
+    finally:
+        conn.close()
+    minimo, maximo = row.get('primero'), row.get('ultimo')
+    if minimo is None:
+        return None
+    tamano = (maximo - minimo + n) // n
+    primero = minimo + k * tamano
+    return primero, min(primero + tamano - 1, maximo)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Programa los recordatorios de rutina de un día para todos los usuarios.')
+    parser.add_argument('--fecha', type=_fecha, help='Día a programar (YYYY-MM-DD). Por defecto, mañana.')
+    parser.add_argument('--lote', type=int, default=5000, help='Filas por INSERT multi-fila y commit (por defecto 5000).')
+    parser.add_argument('--desde-id', type=int, help='Primer id de usuario del tramo.')
+    parser.add_argument('--hasta-id', type=int, help='Último id de usuario del tramo.')
+    parser.add_argument('--shard', type=_shard, help='K/N: toma el tramo K de N partes iguales de ids de usuario.')
+    args = parser.parse_args(argv)
+
+    fecha = args.fecha or date.today() + timedelta(days=1)
+    primero, ultimo = args.desde_id, args.hasta_id
+    if args.shard:
+        if primero is not None or ultimo is not None:
+            parser.error('--shard no se combina con --desde-id/--hasta-id')
+        tramo = rango_shard(*args.shard)
+        if tramo is None:
+            print('ℹ️ No hay usuarios')
+            return 0
+        primero, ultimo = tramo
+    elif (primero is None) != (ultimo is None):
+        parser.error('--desde-id y --hasta-id van juntos')
+
+    tramo = f" (usuarios {primero}-{ultimo})" if primero is not None else ''
+    print(f"🔔 Programando recordatorios del {fecha}{tramo}")
+    resumen = programar_dia(fecha, primero, ultimo, args.lote)
+    por_segundo = resumen['filas'] / resumen['segundos'] if resumen['segundos'] else 0
+    print(f"🏁 {resumen['rutinas']} rutinas, {resumen['filas']} filas ({resumen['insertadas']} nuevas) "
+          f"en {resumen['segundos']:.2f}s, {por_segundo:,.0f} filas/s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
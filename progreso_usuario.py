@@ -0,0 +1,111 @@
+"""
+Progreso semanal del usuario a partir del resumen diario.
+
+Antes cada vista lanzaba dos COUNT por día (14 consultas por semana). Aquí se
+leen las 7 filas de la semana de user_daily_stats (rango por clave primaria) y
+la carga semanal de user_day_load para hoy y los días futuros que aún no tienen
+resumen. La carga es la de hoy, así que no vale para el pasado: los días pasados
+sin resumen (sin liquidar o sin relleno) se cuentan de item_diario, como antes.
+"""
+
+from models.db import get_db_connection
+from models.dias import DIAS_ORDEN
+from models.carga_dia import obtener_carga_semana
+from models.resumen_diario import contar_dias, leer_dias
+from datetime import date, timedelta
+import pymysql.cursors
+
+
+def inicio_de_semana(fecha):
+    """Lunes de la semana de la fecha dada."""
+    return fecha - timedelta(days=fecha.weekday())
+
+
+def cargar_semana(id_usuario, inicio_semana, hoy=None):
+    """
+    Carga la semana que empieza en inicio_semana (lunes) con dos consultas
+    (tres si hay días pasados sin resumen).
+
+    Devuelve una lista de 7 dicts (lunes a domingo) con fecha, nombre_dia,
+    programadas, completadas y minutos. Hoy y los días futuros sin fila en
+    user_daily_stats toman programadas de user_day_load y 0 completadas; los
+    días pasados sin fila se cuentan de item_diario.
+    """
+    hoy = hoy or date.today()
+    fin_semana = inicio_semana + timedelta(days=6)
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            carga = obtener_carga_semana(cur, id_usuario)
+            resumen = leer_dias(cur, id_usuario, inicio_semana, fin_semana)
+            sin_resumen = [inicio_semana + timedelta(days=i) for i in range(7)]
+            sin_resumen = [fecha for fecha in sin_resumen if fecha < hoy and fecha not in resumen]
+            resumen.update(contar_dias(cur, id_usuario, sin_resumen))
+    finally:
+        conn.close()
+
+    semana = []
+    for i in range(7):
+        fecha = inicio_semana + timedelta(days=i)
+        fila = resumen.get(fecha)
+        if fila:
+            programadas = int(fila['scheduled'])
+        else:
+            programadas = carga[i][0] if fecha >= hoy else 0
+        semana.append({
+            'fecha': fecha,
+            'nombre_dia': DIAS_ORDEN[i],
+            'programadas': programadas,
+            'completadas': int(fila['completed']) if fila else 0,
+            'minutos': int(fila['minutes']) if fila else 0,
+        })
+    return semana
+
+
+def _porcentaje(completadas, total):
+    return round((completadas / total) * 100) if total > 0 else 0
+
+
+def progreso_semanal(id_usuario, hoy=None, detalle=False):
+    """
+    Gráfica semanal de inicio y de las APIs: [{'dia': 'Lun', 'porcentaje': 80}, ...].
+
+    Con detalle=True añade total_tareas y tareas_completadas (api_progreso_semanal).
+    """
+    hoy = hoy or date.today()
+    resultado = []
+    for d in cargar_semana(id_usuario, inicio_de_semana(hoy), hoy):
+        total = d['programadas']
+        completadas = d['completadas'] if total > 0 else 0
+        entrada = {'dia': d['nombre_dia'][:3], 'porcentaje': _porcentaje(completadas, total)}
+        if detalle:
+            entrada['total_tareas'] = total
+            entrada['tareas_completadas'] = completadas
+        resultado.append(entrada)
+    return resultado
+
+
+def progreso_dias(id_usuario, inicio_semana, hoy=None):
+    """
+    Días de la semana para /progreso y /registros_actividades.
+
+    Días pasados y hoy: resumen del día. Días futuros: items programados, sin completados.
+    """
+    hoy = hoy or date.today()
+    dias = []
+    for d in cargar_semana(id_usuario, inicio_semana, hoy):
+        fecha = d['fecha']
+        total_tareas = d['programadas']
+        tareas_completadas = d['completadas'] if fecha <= hoy else 0
+        dias.append({
+            'fecha': fecha.strftime('%d/%m'),
+            'fecha_completa': fecha.strftime('%Y-%m-%d'),
+            'nombre_dia': d['nombre_dia'],
+            'total_tareas': total_tareas,
+            'tareas_completadas': tareas_completadas,
+            'porcentaje': _porcentaje(tareas_completadas, total_tareas),
+            'es_hoy': fecha == hoy,
+            'es_futuro': fecha > hoy
+        })
+    return dias
@@ -0,0 +1,286 @@
+"""
+Recálculo de rachas a partir del historial completo.
+
+Carga una vez la carga semanal del usuario (user_day_load) y sus completadas
+por fecha (item_diario), construye por día dos arrays booleanos (programado y
+completo) y obtiene con run-length la racha actual, la máxima y todos los
+tramos. Con NumPy las operaciones son vectoriales; sin NumPy se usa el mismo
+algoritmo en Python puro.
+
+Días sin tareas programadas (politica):
+    'rompe'     cortan la racha (igual que el motor diario y liquidar_rachas.py)
+    'completo'  cuentan como completos (calcular_racha_hasta_fecha)
+    'neutral'   ni suman ni cortan
+
+El horario histórico no se guarda: todos los días usan el horario actual.
+
+Uso:
+    python recalculo_rachas.py --usuario 12
+    python recalculo_rachas.py --todos --dry-run
+"""
+
+import argparse
+import sys
+import time
+from bisect import bisect_right
+from datetime import date, timedelta
+
+from models.db import get_db_connection
+from models.carga_dia import obtener_carga_semana
+from models.historial_rachas import reemplazar_tramos
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+POLITICAS = ('rompe', 'completo', 'neutral')
+
+_COMPLETADAS_SQL = """
+    SELECT id.id_usuario, id.fecha, COUNT(DISTINCT id.id_item) AS completadas
+    FROM item_diario id
+    JOIN rutina_item ri ON ri.id_item = id.id_item
+    JOIN rutina r ON r.id_rutina = ri.id_rutina
+    WHERE {filtro} AND id.fecha <= %s AND id.completado = 1
+    AND r.id_usuario = id.id_usuario AND (r.dias_mask & (1 << WEEKDAY(id.fecha))) <> 0
+    GROUP BY id.id_usuario, id.fecha
+"""
+
+
+def construir_dias(semana, completadas_por_fecha, desde, hasta):
+    """
+    Arrays por día entre desde y hasta: (programado, completo).
+    semana: 7 tuplas (total_items, total_minutes) de Lunes a Domingo.
+    """
+    n = max((hasta - desde).days + 1, 0)
+    items_semana = [items for items, _ in semana]
+    programadas = [items_semana[(desde.weekday() + i) % 7] for i in range(n)]
+    completadas = [completadas_por_fecha.get(desde + timedelta(days=i), 0) for i in range(n)]
+    if np is not None:
+        programadas = np.array(programadas, dtype=np.int32)
+        completadas = np.array(completadas, dtype=np.int32)
+        programado = programadas > 0
+        return programado, programado & (completadas >= programadas)
+    programado = [p > 0 for p in programadas]
+    return programado, [p and c >= t for p, c, t in zip(programado, completadas, programadas)]
+
+
+def _dias_validos(programado, completo, politica):
+    """(ok, indices): día que suma a la racha y su posición en el calendario."""
+    if politica not in POLITICAS:
+        raise ValueError(f'Política desconocida: {politica}')
+    if np is not None:
+        if politica == 'completo':
+            ok = completo | ~programado
+        else:
+            ok = completo
+        indices = np.flatnonzero(programado) if politica == 'neutral' else np.arange(len(ok))
+        return ok[indices], indices
+    if politica == 'completo':
+        ok = [c or not p for p, c in zip(programado, completo)]
+    else:
+        ok = list(completo)
+    indices = [i for i, p in enumerate(programado) if p] if politica == 'neutral' else list(range(len(ok)))
+    return [ok[i] for i in indices], indices
+
+
+def tramos(ok):
+    """[(inicio, fin)] de cada tramo de True consecutivos (fin incluido)."""
+    if np is not None:
+        cambios = np.diff(np.concatenate(([0], np.asarray(ok, dtype=np.int8), [0])))
+        inicios = np.flatnonzero(cambios == 1)
+        fines = np.flatnonzero(cambios == -1) - 1
+        return list(zip(inicios.tolist(), fines.tolist()))
+    resultado = []
+    inicio = None
+    for i, valor in enumerate(ok):
+        if valor and inicio is None:
+            inicio = i
+        elif not valor and inicio is not None:
+            resultado.append((inicio, i - 1))
+            inicio = None
+    if inicio is not None:
+        resultado.append((inicio, len(ok) - 1))
+    return resultado
+
+
+def racha_en_cada_dia(ok):
+    """Longitud de la racha que termina en cada posición (0 donde ok es False)."""
+    if np is not None:
+        ok = np.asarray(ok, dtype=bool)
+        posiciones = np.arange(len(ok))
+        ultimo_fallo = np.maximum.accumulate(np.where(ok, -1, posiciones)) if len(ok) else posiciones
+        return (posiciones - ultimo_fallo).tolist()
+    resultado = []
+    racha = 0
+    for valor in ok:
+        racha = racha + 1 if valor else 0
+        resultado.append(racha)
+    return resultado
+
+
+def analizar(programado, completo, desde, politica='rompe', hoy_abierto=True):
+    """
+    Rachas de la serie que empieza en desde.
+
+    Con hoy_abierto, el último día es hoy y aún puede completarse: si no está
+    completo la racha actual es la que llega hasta ayer (como el motor diario).
+    Devuelve racha_actual, racha_base_hoy, racha_maxima y la lista de tramos
+    [{'inicio', 'fin', 'dias'}] en fechas.
+    """
+    ok, indices = _dias_validos(programado, completo, politica)
+    indices = [int(i) for i in indices]
+    por_dia = racha_en_cada_dia(ok)
+    lista = [(indices[a], indices[b], b - a + 1) for a, b in tramos(ok)]
+
+    def _racha_hasta(dia):
+        # Racha del último día válido <= dia
+        pos = bisect_right(indices, dia) - 1
+        return por_dia[pos] if pos >= 0 else 0
+
+    ultimo = len(programado) - 1
+    base = _racha_hasta(ultimo - 1)
+    if hoy_abierto:
+        actual = _racha_hasta(ultimo) if indices and indices[-1] == ultimo and ok[-1] else base
+    else:
+        actual = _racha_hasta(ultimo)
+
+    return {
+        'racha_actual': actual,
+        'racha_base_hoy': base,
+        'racha_maxima': max([dias for _, _, dias in lista], default=0),
+        'tramos': [
+            {'inicio': desde + timedelta(days=a), 'fin': desde + timedelta(days=b), 'dias': dias}
+            for a, b, dias in lista
+        ],
+    }
+
+
+def racha_hasta_fecha(cursor, user_id, desde, hasta, politica='rompe'):
+    """Racha que termina en hasta (0 si ese día no suma), usando solo [desde, hasta]."""
+    semana = obtener_carga_semana(cursor, user_id)
+    cursor.execute(_COMPLETADAS_SQL.format(filtro='id.id_usuario = %s AND id.fecha >= %s'),
+                   (user_id, desde, hasta))
+    completadas = {row['fecha']: int(row['completadas'] or 0) for row in cursor.fetchall()}
+    programado, completo = construir_dias(semana, completadas, desde, hasta)
+    return analizar(programado, completo, desde, politica, hoy_abierto=False)['racha_actual']
+
+
+def recalcular_usuario(user_id, politica='rompe', hoy=None):
+    """Historial completo de un usuario: racha actual, base de hoy, máxima y tramos."""
+    hoy = hoy or date.today()
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            semana = obtener_carga_semana(cursor, user_id)
+            cursor.execute(_COMPLETADAS_SQL.format(filtro='id.id_usuario = %s'), (user_id, hoy))
+            completadas = {row['fecha']: int(row['completadas'] or 0) for row in cursor.fetchall()}
+    finally:
+        conn.close()
+    desde = min(completadas, default=hoy)
+    programado, completo = construir_dias(semana, completadas, desde, hoy)
+    return analizar(programado, completo, desde, politica)
+
+
+def recalcular_todos(lote=500, politica='rompe', dry_run=False, hoy=None):
+    """
+    Repara current_streak, longest_streak y racha_base_hoy de todos los usuarios en
+    una pasada: por lote, una consulta de carga, una de completadas y un executemany.
+    También reconstruye sus tramos en streak_run.
+    """
+    hoy = hoy or date.today()
+    resumen = {'usuarios': 0, 'cambiados': 0, 'segundos': 0.0}
+    inicio = time.monotonic()
+    ultimo_id = 0
+
+    conn = get_db_connection()
+    try:
+        while True:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT id, current_streak, longest_streak, racha_base_hoy FROM usuario
+                    WHERE id > %s ORDER BY id LIMIT %s
+                """, (ultimo_id, lote))
+                usuarios = cur.fetchall()
+                if not usuarios:
+                    break
+                primero, ultimo_id = usuarios[0]['id'], usuarios[-1]['id']
+
+                cur.execute("""
+                    SELECT user_id, weekday, total_items, total_minutes FROM user_day_load
+                    WHERE user_id BETWEEN %s AND %s
+                """, (primero, ultimo_id))
+                semanas = {}
+                for row in cur.fetchall():
+                    semana = semanas.setdefault(row['user_id'], [(0, 0)] * 7)
+                    semana[row['weekday']] = (int(row['total_items'] or 0), int(row['total_minutes'] or 0))
+
+                cur.execute(_COMPLETADAS_SQL.format(filtro='id.id_usuario BETWEEN %s AND %s'),
+                            (primero, ultimo_id, hoy))
+                completadas = {}
+                for row in cur.fetchall():
+                    completadas.setdefault(row['id_usuario'], {})[row['fecha']] = int(row['completadas'] or 0)
+
+                cambios = []
+                filas_tramos = []
+                for usuario in usuarios:
+                    historial = completadas.get(usuario['id'], {})
+                    desde = min(historial, default=hoy)
+                    programado, completo = construir_dias(
+                        semanas.get(usuario['id'], [(0, 0)] * 7), historial, desde, hoy)
+                    r = analizar(programado, completo, desde, politica)
+                    filas_tramos.extend(
+                        (usuario['id'], t['inicio'], t['fin'], t['dias']) for t in r['tramos'])
+                    calculado = (r['racha_actual'], r['racha_maxima'], r['racha_base_hoy'])
+                    guardado = (usuario['current_streak'] or 0, usuario['longest_streak'] or 0, usuario['racha_base_hoy'] or 0)
+                    if calculado != guardado:
+                        cambios.append((r['racha_actual'], r['racha_maxima'], r['racha_base_hoy'], hoy, usuario['id']))
+
+                if cambios and not dry_run:
+                    cur.executemany("""
+                        UPDATE usuario
+                        SET current_streak = %s, longest_streak = %s, racha_base_hoy = %s, last_streak_date = %s
+                        WHERE id = %s
+                    """, cambios)
+                if not dry_run:
+                    reemplazar_tramos(cur, primero, ultimo_id, filas_tramos)
+            if not dry_run:
+                conn.commit()
+
+            resumen['usuarios'] += len(usuarios)
+            resumen['cambiados'] += len(cambios)
+            print(f"{'🔎' if dry_run else '✅'} Usuarios {primero}-{ultimo_id}: {len(cambios)} rachas corregidas")
+    finally:
+        conn.close()
+
+    resumen['segundos'] = time.monotonic() - inicio
+    return resumen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Recalcula rachas desde el historial de item_diario.')
+    grupo = parser.add_mutually_exclusive_group(required=True)
+    grupo.add_argument('--usuario', type=int, help='Muestra el recálculo de un usuario.')
+    grupo.add_argument('--todos', action='store_true', help='Repara las rachas de todos los usuarios.')
+    parser.add_argument('--politica', choices=POLITICAS, default='rompe', help='Días sin tareas (por defecto rompe).')
+    parser.add_argument('--lote', type=int, default=500, help='Usuarios por lote (por defecto 500).')
+    parser.add_argument('--dry-run', action='store_true', help='No escribe en usuario.')
+    args = parser.parse_args(argv)
+
+    if np is None:
+        print("⚠️ NumPy no está instalado: se usa el cálculo en Python puro")
+
+    if args.usuario:
+        r = recalcular_usuario(args.usuario, args.politica)
+        print(f"📊 Usuario {args.usuario}: actual={r['racha_actual']}, base hoy={r['racha_base_hoy']}, máxima={r['racha_maxima']}")
+        for tramo in r['tramos']:
+            print(f"   {tramo['inicio']} → {tramo['fin']}: {tramo['dias']} días")
+        return 0
+
+    resumen = recalcular_todos(args.lote, args.politica, args.dry_run)
+    print(f"🏁 {resumen['usuarios']} usuarios, {resumen['cambiados']} corregidos en {resumen['segundos']:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
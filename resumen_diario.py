@@ -0,0 +1,131 @@
+"""
+Resumen diario por usuario (user_daily_stats).
+
+Una fila por (user_id, fecha) con scheduled, completed, minutes (minutos de los
+items completados) e is_complete (columna generada). La mantiene el motor de
+rachas al marcar/desmarcar items y la liquidación nocturna; este módulo la
+rellena para fechas pasadas y la lee para /estadisticas, progreso y
+registros_actividades (7 a 90 filas por clave primaria en vez de recalcular).
+
+Uso del relleno:
+    python resumen_diario.py --desde 2025-08-01 --hasta 2025-11-30
+"""
+
+import argparse
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from models.db import get_db_connection
+from models import carga_dia as _carga_dia  # user_day_load
+
+_RELLENO_SQL = """
+    INSERT INTO user_daily_stats (user_id, fecha, scheduled, completed, minutes)
+    SELECT l.user_id, %(fecha)s, l.total_items, COALESCE(c.completadas, 0), COALESCE(c.minutos, 0)
+    FROM user_day_load l
+    LEFT JOIN (
+        SELECT id.id_usuario, COUNT(DISTINCT id.id_item) AS completadas, COALESCE(SUM(ri.tiempo), 0) AS minutos
+        FROM item_diario id
+        JOIN rutina_item ri ON ri.id_item = id.id_item
+        JOIN rutina r ON r.id_rutina = ri.id_rutina
+        WHERE id.fecha = %(fecha)s AND id.completado = 1
+        AND id.id_usuario BETWEEN %(primero)s AND %(ultimo)s
+        AND r.id_usuario = id.id_usuario AND (r.dias_mask & %(bit)s) <> 0
+        GROUP BY id.id_usuario
+    ) c ON c.id_usuario = l.user_id
+    WHERE l.weekday = %(weekday)s AND l.total_items > 0
+    AND l.user_id BETWEEN %(primero)s AND %(ultimo)s
+    ON DUPLICATE KEY UPDATE scheduled = VALUES(scheduled), completed = VALUES(completed), minutes = VALUES(minutes)
+"""
+
+
+def leer_dias(cursor, user_id, desde, hasta):
+    """{fecha: fila} del resumen entre desde y hasta (rango por clave primaria)."""
+    cursor.execute("""
+        SELECT fecha, scheduled, completed, minutes, is_complete
+        FROM user_daily_stats
+        WHERE user_id = %s AND fecha BETWEEN %s AND %s
+    """, (user_id, desde, hasta))
+    return {row['fecha']: row for row in cursor.fetchall()}
+
+
+def contar_dias(cursor, user_id, fechas):
+    """
+    {fecha: fila} contado de item_diario para días pasados sin fila en el resumen
+    (no se abrió la app, no corrió la liquidación ni el relleno). Mismas claves
+    que leer_dias; los días sin items no aparecen.
+    """
+    fechas = list(fechas)
+    if not fechas:
+        return {}
+    cursor.execute(f"""
+        SELECT id.fecha, COUNT(*) AS scheduled, COALESCE(SUM(id.completado = 1), 0) AS completed,
+               COALESCE(SUM(IF(id.completado = 1, ri.tiempo, 0)), 0) AS minutes
+        FROM item_diario id
+        LEFT JOIN rutina_item ri ON ri.id_item = id.id_item
+        WHERE id.id_usuario = %s AND id.fecha IN ({','.join(['%s'] * len(fechas))})
+        GROUP BY id.fecha
+    """, [user_id] + fechas)
+    dias = {}
+    for row in cursor.fetchall():
+        row['is_complete'] = int(row['scheduled']) > 0 and int(row['completed']) >= int(row['scheduled'])
+        dias[row['fecha']] = row
+    return dias
+
+
+def rellenar(desde, hasta, lote=1000):
+    """Recalcula el resumen de todos los usuarios entre desde y hasta. Devuelve filas escritas y segundos."""
+    fechas = [desde + timedelta(days=i) for i in range((hasta - desde).days + 1)]
+    resumen = {'filas': 0, 'segundos': 0.0}
+    inicio = time.monotonic()
+    ultimo_id = 0
+
+    conn = get_db_connection()
+    try:
+        while True:
+            with conn.cursor() as cur:
+                cur.execute('SELECT id FROM usuario WHERE id > %s ORDER BY id LIMIT %s', (ultimo_id, lote))
+                ids = [row['id'] for row in cur.fetchall()]
+                if not ids:
+                    break
+                primero, ultimo_id = ids[0], ids[-1]
+                filas = 0
+                for fecha in fechas:
+                    cur.execute(_RELLENO_SQL, {
+                        'fecha': fecha, 'weekday': fecha.weekday(), 'bit': 1 << fecha.weekday(),
+                        'primero': primero, 'ultimo': ultimo_id,
+                    })
+                    filas += cur.rowcount
+            conn.commit()
+            resumen['filas'] += filas
+            print(f"✅ Usuarios {primero}-{ultimo_id}: {filas} filas")
+    finally:
+        conn.close()
+
+    resumen['segundos'] = time.monotonic() - inicio
+    return resumen
+
+
+def main(argv=None):
+    def _fecha(valor):
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+
+    parser = argparse.ArgumentParser(description='Rellena user_daily_stats para un rango de fechas.')
+    parser.add_argument('--desde', type=_fecha, help='Primera fecha (YYYY-MM-DD). Por defecto, hace 90 días.')
+    parser.add_argument('--hasta', type=_fecha, help='Última fecha (YYYY-MM-DD). Por defecto, ayer.')
+    parser.add_argument('--lote', type=int, default=1000, help='Usuarios por lote (por defecto 1000).')
+    args = parser.parse_args(argv)
+
+    hasta = args.hasta or date.today() - timedelta(days=1)
+    desde = args.desde or hasta - timedelta(days=89)
+    if hasta < desde:
+        parser.error('--hasta no puede ser anterior a --desde')
+
+    print(f"📊 Rellenando user_daily_stats del {desde} al {hasta}")
+    resumen = rellenar(desde, hasta, args.lote)
+    print(f"🏁 {resumen['filas']} filas en {resumen['segundos']:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
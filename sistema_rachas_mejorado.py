@@ -3,7 +3,12 @@ Sistema de rachas DEFINITIVAMENTE CORREGIDO
 Versión con manejo robusto de conexiones y lógica simplificada
 """
 
-from models.db import get_db_connection
+from models.db import al_confirmar, get_db_connection
+from models.dias import bit_dia
+from models.carga_dia import obtener_carga_dia
+from models.recalculo_rachas import racha_hasta_fecha
+from models.historial_rachas import actualizar_tramo
+from models.user import actualizar_usuario_en_cache
 from datetime import datetime, timedelta, date
 import pymysql.cursors
 
@@ -21,189 +26,272 @@ def evaluar_racha_forzar_recalculo(user_id):
     """
     return _evaluar_racha_interna(user_id, forzar_recalculo=True)
 
+def _dia_completo(scheduled, completed):
+    return scheduled > 0 and completed >= scheduled
+
+
+def _estado(racha_actual, scheduled, completed):
+    """Forma del dict que devuelven las funciones de racha."""
+    completo = _dia_completo(scheduled, completed)
+    estado = {
+        'racha_actual': racha_actual,
+        'racha_activa': completo,
+        'dia_completo': completo,
+        'total_tareas': scheduled,
+        'tareas_completadas': completed,
+        'tiene_rutinas': scheduled > 0
+    }
+    if scheduled == 0:
+        estado['sin_rutinas'] = True
+    return estado
+
+
+def _recontar_dia(cursor, user_id, fecha):
+    """
+    Recalcula el contador (programadas vs hechas) de un día y lo guarda en
+    user_daily_stats. Programadas sale de user_day_load (clave primaria).
+    """
+    scheduled = obtener_carga_dia(cursor, user_id, fecha.weekday())[0]
+    completed = 0
+    minutes = 0
+    if scheduled:
+        cursor.execute("""
+            SELECT COUNT(*) AS completed, COALESCE(SUM(ri.tiempo), 0) AS minutes
+            FROM item_diario id
+            JOIN rutina_item ri ON ri.id_item = id.id_item
+            JOIN rutina r ON r.id_rutina = ri.id_rutina
+            WHERE id.id_usuario = %s AND id.fecha = %s AND id.completado = 1
+            AND r.id_usuario = %s AND (r.dias_mask & %s) <> 0
+        """, (user_id, fecha, user_id, bit_dia(fecha)))
+        row = cursor.fetchone() or {}
+        completed = int(row.get('completed') or 0)
+        minutes = int(row.get('minutes') or 0)
+    cursor.execute("""
+        INSERT INTO user_daily_stats (user_id, fecha, scheduled, completed, minutes)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE scheduled = VALUES(scheduled), completed = VALUES(completed), minutes = VALUES(minutes)
+    """, (user_id, fecha, scheduled, completed, minutes))
+    return scheduled, completed
+
+
+def _leer_contador(cursor, user_id, fecha, bloquear=False):
+    cursor.execute(
+        'SELECT scheduled, completed FROM user_daily_stats WHERE user_id = %s AND fecha = %s'
+        + (' FOR UPDATE' if bloquear else ''),
+        (user_id, fecha))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return int(row['scheduled'] or 0), int(row['completed'] or 0)
+
+
+def _leer_usuario(cursor, user_id, bloquear=False):
+    cursor.execute(
+        'SELECT current_streak, longest_streak, last_streak_date, racha_base_hoy FROM usuario WHERE id = %s'
+        + (' FOR UPDATE' if bloquear else ''),
+        (user_id,))
+    return cursor.fetchone()
+
+
+def _abrir_dia(cursor, user_id, usuario_data, hoy):
+    """
+    Cambio de día: liquida el último día evaluado (contador de ese día) y deja
+    hoy abierto con racha_base_hoy = racha que llega de ayer.
+    Normalmente ya lo hizo liquidar_rachas.py por la noche (last_streak_date = hoy);
+    queda como respaldo si el job no se ejecutó.
+    Devuelve la racha base de hoy.
+    """
+    racha_actual = usuario_data.get('current_streak', 0) or 0
+    ultimo_dia_racha = usuario_data.get('last_streak_date')
+
+    if ultimo_dia_racha and ultimo_dia_racha != hoy:
+        contador = _leer_contador(cursor, user_id, ultimo_dia_racha)
+        if contador is None:
+            contador = _recontar_dia(cursor, user_id, ultimo_dia_racha)
+        dias_diferencia = (hoy - ultimo_dia_racha).days
+
+        if not _dia_completo(*contador):
+            racha_actual = 0
+            print(f"💥 RACHA ROTA: El último día evaluado ({ultimo_dia_racha}) estaba incompleto. Reset a 0.")
+        elif dias_diferencia > 1:
+            racha_actual = 0
+            print(f"💥 RACHA ROTA: Más de 1 día sin evaluar ({dias_diferencia} días). Reset a 0.")
+
+    cursor.execute("""
+        UPDATE usuario
+        SET current_streak = %s, last_streak_date = %s, racha_base_hoy = %s
+        WHERE id = %s
+    """, (racha_actual, hoy, racha_actual, user_id))
+    usuario_data['current_streak'] = racha_actual
+    usuario_data['last_streak_date'] = hoy
+    usuario_data['racha_base_hoy'] = racha_actual
+    al_confirmar(lambda: actualizar_usuario_en_cache(user_id, current_streak=racha_actual))
+    return racha_actual
+
+
+def _aplicar_contador(cursor, user_id, usuario_data, scheduled, completed):
+    """
+    Transición O(1): racha de hoy = base + 1 si el día está completo, base si no.
+    Solo escribe en usuario si algo cambió.
+    """
+    base = usuario_data.get('racha_base_hoy', 0) or 0
+    racha_previa = usuario_data.get('current_streak', 0) or 0
+    racha_maxima = usuario_data.get('longest_streak', 0) or 0
+
+    completo = _dia_completo(scheduled, completed)
+    racha_actual = base + 1 if completo else base
+    if racha_actual != racha_previa or racha_actual > racha_maxima:
+        racha_maxima = max(racha_maxima, racha_actual)
+        cursor.execute(
+            'UPDATE usuario SET current_streak = %s, longest_streak = %s WHERE id = %s',
+            (racha_actual, racha_maxima, user_id))
+        actualizar_tramo(cursor, user_id, date.today(), racha_actual, completo)
+        usuario_data['current_streak'] = racha_actual
+        usuario_data['longest_streak'] = racha_maxima
+        al_confirmar(lambda: actualizar_usuario_en_cache(user_id, current_streak=racha_actual,
+                                                         longest_streak=racha_maxima))
+    return racha_actual
+
+
 def _evaluar_racha_interna(user_id, forzar_recalculo=False):
     """
-    Función interna que maneja ambos casos: normal y forzado
+    Lectura del estado de racha de hoy.
+
+    Camino normal (ya abierto hoy y con contador): dos SELECT, sin escrituras.
+    Primera visita del día: liquida el día anterior y abre hoy.
+    forzar_recalculo: vuelve a contar hoy desde item_diario (reparación).
     """
-    
     hoy = date.today()
-    dias_semana = {
-        'Monday': 'Lunes', 'Tuesday': 'Martes', 'Wednesday': 'Miércoles',
-        'Thursday': 'Jueves', 'Friday': 'Viernes', 'Saturday': 'Sábado', 'Sunday': 'Domingo'
-    }
-    dia_actual = dias_semana[hoy.strftime('%A')]
-    
+
     conn = get_db_connection()
     try:
         cursor = conn.cursor(pymysql.cursors.DictCursor)
-        
-        # 1. Obtener estado actual de racha
-        cursor.execute('SELECT current_streak, longest_streak, last_streak_date, racha_base_hoy FROM usuario WHERE id = %s', (user_id,))
-        usuario_data = cursor.fetchone()
-        
+
+        usuario_data = _leer_usuario(cursor, user_id)
         if not usuario_data:
             conn.close()
             return {'racha_actual': 0, 'racha_activa': False, 'dia_completo': False}
-        
-        racha_actual = usuario_data.get('current_streak', 0) or 0
-        racha_maxima = usuario_data.get('longest_streak', 0) or 0
-        ultimo_dia_racha = usuario_data.get('last_streak_date')
-        racha_base_guardada = usuario_data.get('racha_base_hoy', 0) or 0
-        
-        print(f"🔍 DEBUG Racha - Usuario {user_id}: Racha={racha_actual}, Último día={ultimo_dia_racha}, Hoy={hoy}")
-        
-        # 🔥 VERIFICAR SI ÚLTIMO DÍA EVALUADO ESTABA INCOMPLETO
-        if ultimo_dia_racha and ultimo_dia_racha != hoy and not forzar_recalculo:
-            # Verificar si el último día evaluado estaba completo
-            progreso_ultimo_dia = obtener_estado_racha_dia(user_id, ultimo_dia_racha)
-            dias_diferencia = (hoy - ultimo_dia_racha).days
-            
-            print(f"🔍 Verificando último día evaluado ({ultimo_dia_racha}): {progreso_ultimo_dia['completadas']}/{progreso_ultimo_dia['total_tareas']} = {'Completo' if progreso_ultimo_dia['completo'] else 'INCOMPLETO'}")
-            
-            if not progreso_ultimo_dia['completo']:
-                # El último día evaluado estaba incompleto, romper la racha
-                cursor.execute('UPDATE usuario SET current_streak = 0, last_streak_date = NULL, racha_base_hoy = 0 WHERE id = %s', (user_id,))
-                conn.commit()
-                racha_actual = 0
-                ultimo_dia_racha = None
-                print(f"💥 RACHA ROTA: El último día evaluado estaba incompleto. Reset a 0.")
-            elif dias_diferencia > 1:
-                # Día completo pero han pasado más de 1 día, romper racha por discontinuidad  
-                cursor.execute('UPDATE usuario SET current_streak = 0, last_streak_date = NULL, racha_base_hoy = 0 WHERE id = %s', (user_id,))
-                conn.commit()
-                racha_actual = 0
-                ultimo_dia_racha = None
-                print(f"💥 RACHA ROTA: Más de 1 día sin evaluar ({dias_diferencia} días). Reset a 0.")
-        
-        # ⚠️ CONTROL ANTI-DUPLICACIÓN: Si ya evaluamos hoy Y no es recálculo forzado
-        if ultimo_dia_racha == hoy and not forzar_recalculo:
-            print(f"✅ Ya evaluado hoy. Racha se mantiene en: {racha_actual}")
-            # Solo verificar estado actual sin modificar nada
-            progreso_hoy = obtener_estado_racha_dia(user_id, hoy)
-            conn.close()
-            return {
-                'racha_actual': racha_actual,
-                'racha_activa': progreso_hoy['completo'],
-                'dia_completo': progreso_hoy['completo'],
-                'total_tareas': progreso_hoy['total_tareas'],
-                'tareas_completadas': progreso_hoy['completadas']
-            }
-        
-        # RECÁLCULO FORZADO - Usar racha base correcta
-        if forzar_recalculo and ultimo_dia_racha == hoy:
-            print(f"🔄 RECÁLCULO FORZADO - Racha actual: {racha_actual}, Base guardada: {racha_base_guardada}")
-            
-            # Si la racha actual es 0 (se rompió), NO usar la base guardada
-            # Si la racha actual > 0, usar la base guardada
-            if racha_actual == 0:
-                racha_base_para_reset = 0
-                print(f"   Racha rota (0) - usando base = 0")
-            else:
-                racha_base_para_reset = racha_base_guardada
-                print(f"   Racha activa - usando base guardada = {racha_base_guardada}")
-            
-            # Reset al estado de ayer
-            ayer = hoy - timedelta(days=1)
-            
-            cursor.execute("""
-                UPDATE usuario 
-                SET current_streak = %s, last_streak_date = %s
-                WHERE id = %s
-            """, (racha_base_para_reset, ayer, user_id))
-            conn.commit()
-            
-            print(f"   Reset: racha {racha_actual} → {racha_base_para_reset}, fecha → {ayer}")
-            
-            # Actualizar variables para que siga el flujo normal
-            racha_actual = racha_base_para_reset
-            ultimo_dia_racha = ayer
-        
-        # 2. Verificar el progreso del día (tanto para primera vez como recálculo)
-        progreso_hoy = obtener_estado_racha_dia(user_id, hoy)
-        dia_completo = progreso_hoy['completo']
-        tiene_rutinas = progreso_hoy['total_tareas'] > 0
-        
-        print(f"📊 Progreso hoy: {progreso_hoy['completadas']}/{progreso_hoy['total_tareas']} = {dia_completo}")
-        
-        # 🔥 NUEVA LÓGICA: Si no hay rutinas programadas, no evaluar racha
-        if not tiene_rutinas:
-            print(f"📅 Sin rutinas programadas para hoy. Racha no se evalúa (mantiene: {racha_actual})")
-            # Marcar que ya se evaluó hoy pero SIN cambiar la racha
-            cursor.execute("""
-                UPDATE usuario 
-                SET last_streak_date = %s, racha_base_hoy = %s
-                WHERE id = %s
-            """, (hoy, racha_actual, user_id))
+
+        if usuario_data.get('last_streak_date') == hoy and not forzar_recalculo:
+            contador = _leer_contador(cursor, user_id, hoy)
+            if contador is not None:
+                conn.close()
+                return _estado(usuario_data.get('current_streak', 0) or 0, *contador)
+
+        # Camino con escritura: bloquear la fila del usuario para no duplicar la racha
+        usuario_data = _leer_usuario(cursor, user_id, bloquear=True)
+        if usuario_data.get('last_streak_date') != hoy:
+            _abrir_dia(cursor, user_id, usuario_data, hoy)
+        scheduled, completed = _recontar_dia(cursor, user_id, hoy)
+        racha_actual = _aplicar_contador(cursor, user_id, usuario_data, scheduled, completed)
+        conn.commit()
+
+        print(f"📊 Racha usuario {user_id}: {completed}/{scheduled} hoy, racha={racha_actual}")
+        conn.close()
+        return _estado(racha_actual, scheduled, completed)
+
+    except Exception as e:
+        print(f"❌ Error en evaluar_racha_inteligente: {e}")
+        conn.close()
+        return {'racha_actual': 0, 'racha_activa': False, 'dia_completo': False}
+
+
+def registrar_evento_item(user_id, id_item, completado_antes, completado_ahora, dias_mask=None, fecha=None, tiempo=None):
+    """
+    Evento de marcar/desmarcar un item (ya escrito en item_diario).
+
+    Ajusta el resumen del día (completadas ±1, minutos ±tiempo) si el item está
+    programado ese día y mueve la racha en O(1) desde racha_base_hoy. Solo los
+    cambios de hoy afectan a la racha; los de días pasados recuentan su fila.
+    """
+    hoy = date.today()
+    fecha = fecha or hoy
+    if isinstance(fecha, str):
+        fecha = datetime.strptime(fecha, '%Y-%m-%d').date()
+    if fecha != hoy:
+        try:
+            conn = get_db_connection()
+            with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+                _recontar_dia(cursor, user_id, fecha)
             conn.commit()
-            
             conn.close()
-            return {
-                'racha_actual': racha_actual,
-                'racha_activa': False,  # No activa porque no hay rutinas
-                'dia_completo': False,
-                'total_tareas': 0,
-                'tareas_completadas': 0,
-                'sin_rutinas': True
-            }
-        
-        # 3. Lógica de evaluación (primera vez o después de reset) - SOLO SI HAY RUTINAS
-        if True:  # Siempre usar lógica de primera vez ahora
-            # PRIMERA VEZ DEL DÍA: Lógica normal + guardar racha base
-            # Guardar la racha actual como "base" para futuros recálculos
-            racha_base_para_hoy = racha_actual
-            
-            if dia_completo:
-                # Si la racha era 0, empezar en 1; si no, incrementar
-                if racha_actual == 0:
-                    racha_actual = 1
-                else:
-                    racha_actual += 1
-                
-                if racha_actual > racha_maxima:
-                    racha_maxima = racha_actual
-                
-                # Actualizar en BD MARCANDO QUE YA SE EVALUÓ HOY + guardar racha base
-                cursor.execute("""
-                    UPDATE usuario 
-                    SET current_streak = %s, longest_streak = %s, last_streak_date = %s, racha_base_hoy = %s
-                    WHERE id = %s
-                """, (racha_actual, racha_maxima, hoy, racha_base_para_hoy, user_id))
-                conn.commit()
-                
-                print(f"🎉 Día completo! Racha incrementada a: {racha_actual} (base guardada: {racha_base_para_hoy})")
-                racha_activa = True
-            else:
-                # Día incompleto - MANTENER racha base (sin incluir hoy)
-                racha_actual = racha_base_para_hoy
-                cursor.execute("""
-                    UPDATE usuario 
-                    SET current_streak = %s, racha_base_hoy = %s, last_streak_date = %s
-                    WHERE id = %s
-                """, (racha_actual, racha_base_para_hoy, hoy, user_id))
-                conn.commit()
-                
-                racha_activa = False
-                print(f"⏳ Día incompleto. Racha mantenida en: {racha_actual} (base guardada: {racha_base_para_hoy})")
-        
+        except Exception as e:
+            print(f"❌ Error actualizando resumen de {fecha}: {e}")
+        return evaluar_racha_inteligente(user_id)
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor(pymysql.cursors.DictCursor)
+
+        usuario_data = _leer_usuario(cursor, user_id, bloquear=True)
+        if not usuario_data:
+            conn.close()
+            return {'racha_actual': 0, 'racha_activa': False, 'dia_completo': False}
+
+        contador = None
+        if usuario_data.get('last_streak_date') == hoy:
+            contador = _leer_contador(cursor, user_id, hoy, bloquear=True)
+        else:
+            _abrir_dia(cursor, user_id, usuario_data, hoy)
+
+        if contador is None:
+            # Sin contador para hoy: se inicializa desde item_diario (ya incluye este cambio)
+            scheduled, completed = _recontar_dia(cursor, user_id, hoy)
+        else:
+            scheduled, completed = contador
+            delta = int(bool(completado_ahora)) - int(bool(completado_antes))
+            if delta:
+                if dias_mask is None:
+                    cursor.execute("""
+                        SELECT r.dias_mask, ri.tiempo FROM rutina_item ri
+                        JOIN rutina r ON ri.id_rutina = r.id_rutina
+                        WHERE ri.id_item = %s
+                    """, (id_item,))
+                    row = cursor.fetchone() or {}
+                    dias_mask = row.get('dias_mask') or 0
+                    tiempo = row.get('tiempo')
+                if (dias_mask or 0) & bit_dia(hoy):
+                    completed = max(0, min(scheduled, completed + delta))
+                    cursor.execute("""
+                        UPDATE user_daily_stats
+                        SET completed = %s, minutes = GREATEST(0, minutes + %s)
+                        WHERE user_id = %s AND fecha = %s
+                    """, (completed, delta * (tiempo or 0), user_id, hoy))
+
+        racha_actual = _aplicar_contador(cursor, user_id, usuario_data, scheduled, completed)
+        conn.commit()
         conn.close()
-        
-        return {
-            'racha_actual': racha_actual,
-            'racha_activa': racha_activa,
-            'dia_completo': dia_completo,
-            'total_tareas': progreso_hoy['total_tareas'],
-            'tareas_completadas': progreso_hoy['completadas'],
-            'tiene_rutinas': progreso_hoy['total_tareas'] > 0
-        }
-        
+        return _estado(racha_actual, scheduled, completed)
+
     except Exception as e:
-        print(f"❌ Error en evaluar_racha_inteligente: {e}")
+        print(f"❌ Error en registrar_evento_item: {e}")
         conn.close()
         return {'racha_actual': 0, 'racha_activa': False, 'dia_completo': False}
 
+
+def invalidar_contador_dia(user_id, fecha=None):
+    """
+    Tras cambiar el horario (rutinas/items) vuelve a contar el resumen del día.
+    Para hoy también reaplica la racha, así progreso y estadísticas no ven un
+    día sin resumen.
+    """
+    fecha = fecha or date.today()
+    if fecha == date.today():
+        evaluar_racha_forzar_recalculo(user_id)
+        return
+    try:
+        conn = get_db_connection()
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            _recontar_dia(cursor, user_id, fecha)
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"❌ Error invalidando contador diario: {e}")
+
 def verificar_racha_perdida(user_id):
     """
     Verifica si se perdió la racha por no completar días anteriores.
+    Ya no se llama desde inicio: lo resuelve la liquidación nocturna (liquidar_rachas.py).
     """
     try:
         conn = get_db_connection()
@@ -244,6 +332,7 @@ def verificar_racha_perdida(user_id):
             if dias_diferencia > 2:  # Más de 2 días sin evaluar = racha perdida
                 cursor.execute('UPDATE usuario SET current_streak = 0, last_streak_date = NULL WHERE id = %s', (user_id,))
                 conn.commit()
+                al_confirmar(lambda: actualizar_usuario_en_cache(user_id, current_streak=0))
                 print(f"💥 Racha perdida por {dias_diferencia} días sin completar. Reseteo a 0.")
             else:
                 print(f"✅ Racha mantenida. Solo {dias_diferencia} días de diferencia (aceptable).")
@@ -270,15 +359,8 @@ def obtener_estado_racha_dia(user_id, fecha=None):
         }
         dia_nombre = dias_semana[fecha.strftime('%A')]
         
-        # Verificar si hay rutinas para ese día
-        cursor.execute("""
-            SELECT COUNT(*) as total_tareas
-            FROM rutina r
-            JOIN rutina_item ri ON r.id_rutina = ri.id_rutina
-            WHERE r.id_usuario = %s AND FIND_IN_SET(%s, r.dias)
-        """, (user_id, dia_nombre))
-        
-        total_tareas = cursor.fetchone()['total_tareas'] or 0
+        # Items programados ese día (user_day_load, clave primaria)
+        total_tareas = obtener_carga_dia(cursor, user_id, fecha.weekday())[0]
         
         if total_tareas == 0:
             conn.close()
@@ -296,11 +378,11 @@ def obtener_estado_racha_dia(user_id, fecha=None):
             JOIN rutina_item ri ON r.id_rutina = ri.id_rutina
             JOIN item_diario id ON ri.id_item = id.id_item
             WHERE r.id_usuario = %s 
-            AND FIND_IN_SET(%s, r.dias)
+            AND (r.dias_mask & %s) <> 0
             AND id.fecha = %s 
             AND id.completado = 1
             AND id.id_usuario = %s
-        """, (user_id, dia_nombre, fecha, user_id))
+        """, (user_id, bit_dia(dia_nombre), fecha, user_id))
         
         completadas = cursor.fetchone()['completadas'] or 0
         porcentaje = round((completadas / total_tareas) * 100) if total_tareas > 0 else 0
@@ -356,70 +438,11 @@ def debug_racha_sistema(user_id):
 def calcular_racha_hasta_fecha(user_id, fecha_limite, cursor):
     """
     Calcula cuál debería ser la racha del usuario hasta una fecha específica (sin incluirla).
-    Recorre desde hace tiempo atrás hasta encontrar la racha correcta.
+    Mira los 30 días anteriores; los días sin rutinas cuentan como completos.
     """
     from datetime import timedelta
     
-    dias_semana = {
-        'Monday': 'Lunes', 'Tuesday': 'Martes', 'Wednesday': 'Miércoles',
-        'Thursday': 'Jueves', 'Friday': 'Viernes', 'Saturday': 'Sábado', 'Sunday': 'Domingo'
-    }
-    
-    # Empezar desde hace 30 días y contar hacia adelante hasta fecha_limite
-    fecha_inicio = fecha_limite - timedelta(days=30)
-    fecha_actual = fecha_inicio
-    racha_consecutiva = 0
-    
-    while fecha_actual <= fecha_limite:
-        dia_nombre = dias_semana[fecha_actual.strftime('%A')]
-        
-        # ¿Tenía rutinas este día?
-        cursor.execute("""
-            SELECT COUNT(*) as total_rutinas
-            FROM rutina r
-            WHERE r.id_usuario = %s AND FIND_IN_SET(%s, r.dias)
-        """, (user_id, dia_nombre))
-        
-        tiene_rutinas = (cursor.fetchone()['total_rutinas'] or 0) > 0
-        
-        if not tiene_rutinas:
-            # Sin rutinas = día automáticamente completo
-            racha_consecutiva += 1
-        else:
-            # Con rutinas - verificar si completó todas
-            cursor.execute("""
-                SELECT COUNT(ri.id_item) as total_items
-                FROM rutina r
-                JOIN rutina_item ri ON r.id_rutina = ri.id_rutina
-                WHERE r.id_usuario = %s AND FIND_IN_SET(%s, r.dias)
-            """, (user_id, dia_nombre))
-            
-            total_items = cursor.fetchone()['total_items'] or 0
-            
-            cursor.execute("""
-                SELECT COUNT(DISTINCT id.id_item) as completados
-                FROM rutina r
-                JOIN rutina_item ri ON r.id_rutina = ri.id_rutina
-                LEFT JOIN item_diario id ON ri.id_item = id.id_item 
-                WHERE r.id_usuario = %s 
-                AND FIND_IN_SET(%s, r.dias)
-                AND id.fecha = %s 
-                AND id.completado = 1
-                AND id.id_usuario = %s
-            """, (user_id, dia_nombre, fecha_actual, user_id))
-            
-            completados = cursor.fetchone()['completados'] or 0
-            
-            if total_items > 0 and completados >= total_items:
-                # Día completo
-                racha_consecutiva += 1
-            else:
-                # Día incompleto - racha se rompe
-                racha_consecutiva = 0
-        
-        fecha_actual += timedelta(days=1)
-    
-    return racha_consecutiva
+    return racha_hasta_fecha(cursor, user_id, fecha_limite - timedelta(days=30), fecha_limite, politica='completo')
 
 def obtener_racha_base_hasta_ayer(user_id, cursor):
     """
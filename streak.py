@@ -1,5 +1,7 @@
 from datetime import datetime, date, timedelta
-from models.db import get_db_connection
+from models.db import al_confirmar, get_db_connection
+from models.dias import bit_dia
+from models.user import actualizar_usuario_en_cache
 
 __all__ = ['mark_task_completed', 'get_global_streak', 'evaluate_daily_streak', 'check_and_reset_missed_streaks', 'debug_streak_status']
 
@@ -24,6 +26,32 @@ def ensure_streak_tables():
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
             """)
             
+            # Contador por usuario y día (programadas vs hechas) del motor de rachas
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS user_daily_stats (
+                    user_id INT NOT NULL,
+                    fecha DATE NOT NULL,
+                    scheduled INT NOT NULL DEFAULT 0,
+                    completed INT NOT NULL DEFAULT 0,
+                    minutes INT NOT NULL DEFAULT 0,
+                    is_complete TINYINT(1) AS (scheduled > 0 AND completed >= scheduled) STORED,
+                    PRIMARY KEY (user_id, fecha),
+                    FOREIGN KEY (user_id) REFERENCES usuario(id) ON DELETE CASCADE
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """)
+            
+            # Columnas del resumen diario (minutos completados y día completo)
+            cur.execute("SHOW COLUMNS FROM user_daily_stats LIKE 'minutes'")
+            if not cur.fetchone():
+                cur.execute("ALTER TABLE user_daily_stats ADD COLUMN minutes INT NOT NULL DEFAULT 0")
+            
+            cur.execute("SHOW COLUMNS FROM user_daily_stats LIKE 'is_complete'")
+            if not cur.fetchone():
+                cur.execute("""
+                    ALTER TABLE user_daily_stats
+                    ADD COLUMN is_complete TINYINT(1) AS (scheduled > 0 AND completed >= scheduled) STORED
+                """)
+            
             # Asegurar que usuario tiene las columnas de racha
             cur.execute("SHOW COLUMNS FROM usuario LIKE 'current_streak'")
             if not cur.fetchone():
@@ -40,10 +68,19 @@ def ensure_streak_tables():
 
 def mark_task_completed(user_id, tarea_id):
     """Marca una tarea como completada y actualiza la racha."""
+    from sistema_rachas_mejorado import registrar_evento_item
+
     today = date.today()
     conn = get_db_connection()
     try:
         with conn.cursor() as cur:
+            cur.execute('''
+                SELECT completado FROM item_diario
+                WHERE id_usuario = %s AND id_item = %s AND fecha = %s
+            ''', (user_id, tarea_id, today))
+            previo = cur.fetchone()
+            completado_antes = bool(previo['completado']) if previo else False
+
             # Insertar o actualizar en item_diario
             cur.execute('''
                 INSERT INTO item_diario (id_usuario, id_item, fecha, completado, completado_en)
@@ -54,8 +91,8 @@ def mark_task_completed(user_id, tarea_id):
         
         conn.commit()
         
-        # Evaluar racha después de completar tarea
-        evaluate_daily_streak(user_id)
+        # Mover la racha con el evento (contador del día, O(1))
+        registrar_evento_item(user_id, tarea_id, completado_antes, True)
         
     finally:
         conn.close()
@@ -117,8 +154,8 @@ def check_and_reset_missed_streaks(user_id):
             day_name = dias_semana[yesterday.strftime('%A')]
             
             # ¿Había rutinas programadas para ayer?
-            cur.execute('SELECT COUNT(*) AS cnt FROM rutina WHERE id_usuario = %s AND dias LIKE %s', 
-                       (user_id, f'%{day_name}%'))
+            cur.execute('SELECT COUNT(*) AS cnt FROM rutina WHERE id_usuario = %s AND (dias_mask & %s) <> 0', 
+                       (user_id, bit_dia(day_name)))
             r = cur.fetchone()
             has_rutinas = False
             if r:
@@ -136,8 +173,8 @@ def check_and_reset_missed_streaks(user_id):
                     SELECT COUNT(ri.id_item) AS total
                     FROM rutina r
                     JOIN rutina_item ri ON r.id_rutina = ri.id_rutina
-                    WHERE r.id_usuario = %s AND FIND_IN_SET(%s, r.dias)
-                """, (user_id, day_name))
+                    WHERE r.id_usuario = %s AND (r.dias_mask & %s) <> 0
+                """, (user_id, bit_dia(day_name)))
                 t = cur.fetchone()
                 total_items = 0
                 if t:
@@ -156,8 +193,8 @@ def check_and_reset_missed_streaks(user_id):
                     JOIN rutina_item ri ON id.id_item = ri.id_item
                     JOIN rutina r ON ri.id_rutina = r.id_rutina
                     WHERE id.id_usuario = %s AND id.fecha = %s AND id.completado = 1
-                    AND FIND_IN_SET(%s, r.dias)
-                """, (user_id, yesterday, day_name))
+                    AND (r.dias_mask & %s) <> 0
+                """, (user_id, yesterday, bit_dia(day_name)))
                 c = cur.fetchone()
                 completados = 0
                 if c:
@@ -173,6 +210,7 @@ def check_and_reset_missed_streaks(user_id):
                 if total_items > 0 and completados < total_items:
                     cur.execute('UPDATE usuario SET current_streak = 0 WHERE id = %s', (user_id,))
                     conn.commit()
+                    al_confirmar(lambda: actualizar_usuario_en_cache(user_id, current_streak=0))
         
     finally:
         conn.close()
@@ -211,8 +249,8 @@ def evaluate_daily_streak(user_id):
                         longest_streak = 0
             
             # ¿Hay rutinas programadas para hoy?
-            cur.execute('SELECT COUNT(*) AS cnt FROM rutina WHERE id_usuario = %s AND dias LIKE %s', 
-                       (user_id, f'%{hoy_spanish}%'))
+            cur.execute('SELECT COUNT(*) AS cnt FROM rutina WHERE id_usuario = %s AND (dias_mask & %s) <> 0', 
+                       (user_id, bit_dia(hoy_spanish)))
             r = cur.fetchone()
             has_rutinas = False
             if r:
@@ -236,8 +274,8 @@ def evaluate_daily_streak(user_id):
                     SELECT COUNT(ri.id_item) AS total
                     FROM rutina r
                     JOIN rutina_item ri ON r.id_rutina = ri.id_rutina
-                    WHERE r.id_usuario = %s AND FIND_IN_SET(%s, r.dias)
-                """, (user_id, hoy_spanish))
+                    WHERE r.id_usuario = %s AND (r.dias_mask & %s) <> 0
+                """, (user_id, bit_dia(hoy_spanish)))
                 t = cur.fetchone()
                 total_items = 0
                 if t:
@@ -256,8 +294,8 @@ def evaluate_daily_streak(user_id):
                     JOIN rutina_item ri ON id.id_item = ri.id_item
                     JOIN rutina r ON ri.id_rutina = r.id_rutina
                     WHERE id.id_usuario = %s AND id.fecha = %s AND id.completado = 1
-                    AND FIND_IN_SET(%s, r.dias)
-                """, (user_id, today, hoy_spanish))
+                    AND (r.dias_mask & %s) <> 0
+                """, (user_id, today, bit_dia(hoy_spanish)))
                 c = cur.fetchone()
                 completados = 0
                 if c:
@@ -289,6 +327,8 @@ def evaluate_daily_streak(user_id):
                       (current_streak, longest_streak, user_id))
             
         conn.commit()
+        al_confirmar(lambda: actualizar_usuario_en_cache(user_id, current_streak=current_streak,
+                                                         longest_streak=longest_streak))
     finally:
         conn.close()
 
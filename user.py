@@ -1,19 +1,82 @@
+import os
 import pymysql
 from werkzeug.security import generate_password_hash
-from models.db import get_db_connection
+from models.db import al_confirmar, get_db_connection
+from models.cache import TTLCache
 
+_COLUMNAS = 'id, nombre, correo, password, avatar, telefono, current_streak, longest_streak'
 
-def get_user_by_email(email):
-    """Devuelve el usuario (dict) por correo o None si no existe."""
+# Caché de filas de usuario por id, más correo -> id. Es local a cada proceso:
+# los cambios hechos por otro proceso (otros workers, jobs nocturnos) se ven al
+# caducar la entrada.
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 30))
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 10000))
+_usuarios = TTLCache(ttl=USER_CACHE_TTL, maxsize=USER_CACHE_SIZE, nombre='usuarios')
+_ids_por_correo = TTLCache(ttl=USER_CACHE_TTL, maxsize=USER_CACHE_SIZE, nombre='usuarios_correo')
+
+
+def _cachear(usuario):
+    if usuario:
+        _usuarios.set(usuario['id'], usuario)
+        _ids_por_correo.set(usuario['correo'], usuario['id'])
+    return dict(usuario) if usuario else None
+
+
+def _consultar(where, valor):
     conn = get_db_connection()
     try:
         with conn.cursor(pymysql.cursors.DictCursor) as cur:
-            cur.execute('SELECT id, nombre, correo, password, avatar, telefono, current_streak, longest_streak FROM usuario WHERE correo = %s', (email,))
+            cur.execute(f'SELECT {_COLUMNAS} FROM usuario WHERE {where} = %s', (valor,))
             return cur.fetchone()
     finally:
         conn.close()
 
 
+def get_user_by_email(email, fresh=False):
+    """Devuelve el usuario (dict) por correo o None si no existe. Lectura a través de la caché.
+    fresh=True lee siempre de MySQL (p. ej. para comprobar la contraseña en el login:
+    la caché de otro worker no ve un cambio de contraseña hasta que caduca).
+    """
+    user_id = None if fresh else _ids_por_correo.get(email)
+    if user_id is not None:
+        usuario = _usuarios.get(user_id)
+        if usuario is not None and usuario['correo'] == email:
+            return dict(usuario)
+    return _cachear(_consultar('correo', email))
+
+
+def get_user_by_id(user_id):
+    """Devuelve el usuario (dict) por id o None si no existe. Lectura a través de la caché."""
+    usuario = _usuarios.get(user_id)
+    if usuario is not None:
+        return dict(usuario)
+    return _cachear(_consultar('id', user_id))
+
+
+def invalidar_usuario(user_id=None, email=None):
+    """Quita al usuario de la caché (por id, por correo o ambos). Tras escribir,
+    llamar vía al_confirmar para no dejar cacheado algo que luego se deshace."""
+    if user_id is None and email is not None:
+        user_id = _ids_por_correo.peek(email)
+    if user_id is not None:
+        usuario = _usuarios.peek(user_id)
+        if usuario is not None:
+            _ids_por_correo.delete(usuario['correo'])
+        _usuarios.delete(user_id)
+    if email is not None:
+        _ids_por_correo.delete(email)
+
+
+def actualizar_usuario_en_cache(user_id, **campos):
+    """Actualiza en su sitio campos de un usuario cacheado (p. ej. las rachas)."""
+    _usuarios.update(user_id, **campos)
+
+
+def estadisticas_cache():
+    """Aciertos/fallos de la caché de usuarios (también en /metrics)."""
+    return {'usuarios': _usuarios.stats(), 'correo': _ids_por_correo.stats()}
+
+
 
 def create_user(nombre, correo, plain_password):
     """Crea un usuario con password hasheada."""
@@ -42,6 +105,10 @@ def update_user_password(identifier, new_plain_password):
         conn.commit()
     finally:
         conn.close()
+    if isinstance(identifier, int):
+        al_confirmar(lambda: invalidar_usuario(user_id=identifier))
+    else:
+        al_confirmar(lambda: invalidar_usuario(email=identifier))
 
 
 def update_user_email(user_id, new_email):
@@ -53,6 +120,7 @@ def update_user_email(user_id, new_email):
         conn.commit()
     finally:
         conn.close()
+    al_confirmar(lambda: invalidar_usuario(user_id=user_id))
 
 
 def update_user_name(user_id, new_name):
@@ -64,6 +132,7 @@ def update_user_name(user_id, new_name):
         conn.commit()
     finally:
         conn.close()
+    al_confirmar(lambda: invalidar_usuario(user_id=user_id))
 
 
 def update_user_avatar(user_id, avatar_filename):
@@ -75,6 +144,7 @@ def update_user_avatar(user_id, avatar_filename):
         conn.commit()
     finally:
         conn.close()
+    al_confirmar(lambda: invalidar_usuario(user_id=user_id))
 
 
 def update_user_phone(user_id, telefono):
@@ -86,6 +156,7 @@ def update_user_phone(user_id, telefono):
         conn.commit()
     finally:
         conn.close()
+    al_confirmar(lambda: invalidar_usuario(user_id=user_id))
 
 
 def update_user_streak(user_id, current_streak, longest_streak=None):
@@ -101,6 +172,7 @@ def update_user_streak(user_id, current_streak, longest_streak=None):
         conn.commit()
     finally:
         conn.close()
+    al_confirmar(lambda: invalidar_usuario(user_id=user_id))
 
 
 def get_user_streak(user_id):